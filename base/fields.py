@@ -0,0 +1,68 @@
+import base64
+import json
+import zlib
+
+from django.conf import settings
+from django.db import models
+
+TEXT_PREFIX = 'zlib:'  # Inicio de los textos comprimidos
+JSON_KEY = '__zlib__'  # Llave del objeto con el que se guardan los json comprimidos
+
+
+def compress(text: str) -> str:
+    return base64.b64encode(zlib.compress(text.encode('utf-8'), settings.PAYLOAD_COMPRESS_LEVEL)).decode('ascii')
+
+
+def decompress(data: str) -> str:
+    return zlib.decompress(base64.b64decode(data)).decode('utf-8')
+
+
+def must_compress(text: str) -> bool:
+    """ Caso settings.PAYLOAD_COMPRESS_MIN_BYTES sea 0 nunca se comprime. """
+    return 0 < settings.PAYLOAD_COMPRESS_MIN_BYTES <= len(text)
+
+
+class CompressedTextField(models.TextField):
+    """
+    TextField que guarda comprimidos (zlib + base64, con el prefijo 'zlib:')
+    los textos de al menos settings.PAYLOAD_COMPRESS_MIN_BYTES caracteres.
+    Al leer de la BD se recibe el texto original, esté comprimido o no.
+    """
+
+    def get_prep_value(self, value):
+        value = super().get_prep_value(value)
+        if isinstance(value, str) and not value.startswith(TEXT_PREFIX) and must_compress(value):
+            return TEXT_PREFIX + compress(value)
+        return value
+
+    def from_db_value(self, value, expression, connection):
+        if isinstance(value, str) and value.startswith(TEXT_PREFIX):
+            return decompress(value[len(TEXT_PREFIX):])
+        return value
+
+
+class CompressedJSONField(models.JSONField):
+    """
+    JSONField que guarda los json de al menos settings.PAYLOAD_COMPRESS_MIN_BYTES
+    caracteres como {'__zlib__': '<zlib + base64>'}, de manera que la columna
+    sigue siendo un json válido. Al leer de la BD se recibe el json original.
+    Las consultas por llaves del json solo encuentran los que no están comprimidos.
+    """
+
+    def get_prep_value(self, value):
+        value = super().get_prep_value(value)
+        if isinstance(value, (dict, list)) and not self.is_compressed(value):
+            text = json.dumps(value, cls=self.encoder)
+            if must_compress(text):
+                return {JSON_KEY: compress(text)}
+        return value
+
+    def from_db_value(self, value, expression, connection):
+        value = super().from_db_value(value, expression, connection)
+        if self.is_compressed(value):
+            return json.loads(decompress(value[JSON_KEY]), cls=self.decoder)
+        return value
+
+    @staticmethod
+    def is_compressed(value) -> bool:
+        return isinstance(value, dict) and len(value) == 1 and JSON_KEY in value
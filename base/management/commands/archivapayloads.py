@@ -0,0 +1,52 @@
+from collections import defaultdict
+from itertools import islice
+
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from core.settings import logger as log
+from utils.interactor_db import archivable_files, archive_files, archived_before, purge_archive
+from utils.resources import format_number as fn
+
+
+class Command(BaseCommand):
+    help = ('Mueve a sap_payloads_archivo los archivos ya enviados a SAP y '
+            'elimina del archivo los payloads más antiguos')
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dias", type=int, default=settings.PAYLOADS_RETENTION_DAYS,
+                            help='Días sin cambios luego de los cuales un archivo enviado es archivado')
+        parser.add_argument("--purgar-dias", type=int, default=settings.ARCHIVO_RETENTION_DAYS,
+                            help='Días que se conservan en el archivo, con 0 no se elimina nada')
+        parser.add_argument("--lote", type=int, default=100, help='Archivos movidos por sentencia')
+        parser.add_argument("--dry-run", action='store_true', help='Solo informa lo que sería hecho')
+
+    def handle(self, *args, **options):
+        """
+        Ex.:
+            - python manage.py archivapayloads --dry-run
+            - python manage.py archivapayloads --dias=3 --purgar-dias=90
+        """
+        files = defaultdict(list)  # {'compras': [('Compras-1.csv', 25), ...], ...}
+        for file in archivable_files(options['dias']):
+            files[file['modulo']].append((file['nombre_archivo'], file['documentos']))
+
+        total = 0
+        for modulo, archivos in files.items():
+            documentos = sum(docs for _, docs in archivos)
+            log.info(f"[{modulo}] {fn(len(archivos))} archivos con {fn(documentos)} payloads "
+                     f"{'por archivar' if options['dry_run'] else 'archivados'}")
+            if options['dry_run']:
+                total += documentos
+                continue
+            nombres = iter(nombre for nombre, _ in archivos)
+            while lote := list(islice(nombres, options['lote'])):
+                total += archive_files(modulo, lote)
+        log.info(f"{fn(total)} payloads {'por archivar' if options['dry_run'] else 'archivados'}")
+
+        if dias := options['purgar_dias']:
+            if options['dry_run']:
+                count = archived_before(dias).count()
+                log.info(f"{fn(count)} payloads por eliminar del archivo")
+            else:
+                log.info(f"{fn(purge_archive(dias))} payloads eliminados del archivo")
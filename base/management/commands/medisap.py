@@ -2,15 +2,20 @@ import os
 import signal
 import sys
 
+from django.conf import settings
 from django.core.management import BaseCommand
 
 from base.models import RegistroMigracion
 from core.settings import logger as log, DEBUG
 from utils.decorators import logtime, not_on_debug
+from utils.gdrive.changes import refresh_changes
 from utils.gdrive.handler_api import GDriveHandler
-from utils.interactor_db import crea_registro_migracion, update_estado_finalizado
+from utils.gdrive.stats import drive_stats
+from utils.interactor_db import crea_registro_migracion, update_estado_finalizado, update_tiempos_modulos
 from utils.parsers import Module
+from utils.reporting import reporter
 from utils.sap.manager import SAPData
+from utils.scheduler import ModuleScheduler
 
 
 class Command(BaseCommand):
@@ -100,19 +105,40 @@ class Command(BaseCommand):
         :param kwargs: Might be {'filepath': 'path_of_the_file.csv'}
         """
         migracion_id = self.migracion.id if self.migracion else 0
-        client = GDriveHandler()
-        manager_sap = SAPData()
-        for module in args:
+        # SAPData no es thread-safe (sess_id, tablas cargadas a demanda), con modulos
+        # en paralelo cada uno tiene el suyo y pierden el cache compartido de tablas
+        shared_sap = SAPData() if settings.MODULES_PARALLELISM <= 1 else None
+
+        def run_module(module):
+            manager_sap = shared_sap if shared_sap is not None else SAPData()
             log.info(f'{f" INICIO {module.upper()} {self.tanda} TANDA ":=^60}')
             if dir := kwargs.get('filepath'):
                 # Caso sea local
                 mdl = Module(name=module, filepath=dir, sap=manager_sap, migracion_id=migracion_id)
             else:
-                # Caso sea del drive
-                mdl = Module(name=module, drive=client, sap=manager_sap, migracion_id=migracion_id)
+                # Caso sea del drive, cada modulo con su propio cliente porque no es thread-safe
+                mdl = Module(name=module, drive=GDriveHandler(), sap=manager_sap, migracion_id=migracion_id)
             data = mdl.exec_migration(tanda=kwargs.get('tanda'))
             log.info(f'{f" FIN {module.upper()} {self.tanda} TANDA ":=^60}')
 
+        drive_stats.reset()
+        if settings.DRIVE_CHANGES and not kwargs.get('filepath'):
+            # Una sola consulta al feed de cambios del drive por ciclo, ver utils.gdrive.changes
+            refresh_changes(GDriveHandler())
+
+        scheduler = ModuleScheduler(args, run_module, parallelism=settings.MODULES_PARALLELISM)
+        try:
+            scheduler.run()
+        except (SystemExit, KeyboardInterrupt):
+            # Migración abortada (handle_sigterm), no se esperan los reportes pendientes
+            reporter.cancel()
+            raise
+        finally:
+            # Los reportes entregados por la segunda tanda, ver utils.reporting
+            reporter.wait()
+            log.info(f"Descubrimiento de archivos en el drive: {drive_stats.summary()}")
+            update_tiempos_modulos(migracion_id, scheduler.times)
+
     def handle_sigterm(self, signum, frame):
         log.warning(f'Abortando migración # {self.migracion.id} {self.tanda} con {signum=}')
         sys.exit(1)
@@ -0,0 +1,80 @@
+import json
+import time
+
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.db import connection
+
+from base.fields import JSON_KEY, TEXT_PREFIX, compress, decompress
+from base.models import PayloadMigracion
+from core.settings import logger as log
+from utils.resources import format_number as fn
+
+
+class Command(BaseCommand):
+    help = ('Informa cuánto espacio ahorra la compresión de payload y lineas en '
+            'sap_payloads_en_migracion y cuánto tarda comprimir y descomprimir')
+
+    def add_arguments(self, parser):
+        parser.add_argument("--muestra", type=int, default=500, help='Cantidad de registros más recientes evaluados')
+
+    def handle(self, *args, **options):
+        """
+        Ex.:
+            - python manage.py reportepayloads
+            - python manage.py reportepayloads --muestra=5000
+        """
+        records = PayloadMigracion.objects.order_by('-id').values_list('payload', 'lineas')[:options['muestra']]
+        stats = {'payload': Stats(), 'lineas': Stats()}
+        for payload, lineas in records:
+            stats['payload'].add(json.dumps(payload))
+            stats['lineas'].add(lineas)
+
+        umbral = settings.PAYLOAD_COMPRESS_MIN_BYTES
+        log.info(f"Umbral de compresión: {fn(umbral) + ' caracteres' if umbral else 'desactivado'}, "
+                 f"nivel {settings.PAYLOAD_COMPRESS_LEVEL}")
+        for name, stat in stats.items():
+            log.info(f"[{name}] {stat}")
+
+        stored = {
+            'payload': PayloadMigracion.objects.filter(payload__has_key=JSON_KEY).count(),
+            'lineas': PayloadMigracion.objects.filter(lineas__startswith=TEXT_PREFIX).count(),
+        }
+        log.info(f"{fn(PayloadMigracion.objects.count())} registros en BD, comprimidos: "
+                 f"payload {fn(stored['payload'])}, lineas {fn(stored['lineas'])}")
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_size_pretty(pg_total_relation_size(%s))",
+                               [PayloadMigracion._meta.db_table])
+                log.info(f"Tamaño de {PayloadMigracion._meta.db_table} (con TOAST e índices): "
+                         f"{cursor.fetchone()[0]}")
+
+
+class Stats:
+    """ Acumula tamaños y tiempos de compresión de los textos de una columna. """
+
+    def __init__(self):
+        self.count = 0
+        self.raw = 0
+        self.compressed = 0
+        self.encode = 0.0
+        self.decode = 0.0
+
+    def add(self, text: str) -> None:
+        start = time.perf_counter()
+        data = compress(text)
+        middle = time.perf_counter()
+        decompress(data)
+        self.encode += middle - start
+        self.decode += time.perf_counter() - middle
+        self.count += 1
+        self.raw += len(text.encode('utf-8'))
+        self.compressed += len(data)
+
+    def __str__(self):
+        if not self.count:
+            return 'sin registros'
+        saved = 100 - self.compressed * 100 / self.raw if self.raw else 0
+        return (f"{fn(self.count)} registros, {fn(self.raw)} bytes -> {fn(self.compressed)} bytes "
+                f"({saved:.1f}% ahorrado), comprimir {self.encode * 1000 / self.count:.3f} ms/registro, "
+                f"descomprimir {self.decode * 1000 / self.count:.3f} ms/registro")
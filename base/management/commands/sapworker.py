@@ -0,0 +1,40 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management import BaseCommand
+from django.db import connection
+
+from core.settings import logger as log
+from utils.sap.worker import SAPWorker
+
+
+class Command(BaseCommand):
+    help = 'Envía a SAP los payloads pendientes en la BD, puede correr en varios procesos o dynos a la vez'
+
+    def add_arguments(self, parser):
+        parser.add_argument("modulos", nargs="*", type=str)
+        parser.add_argument("--hilos", type=int, default=1)
+        parser.add_argument("--lote", type=int, default=50)
+        parser.add_argument("--una-vez", action='store_true',
+                            help='Termina cuando no queden payloads pendientes')
+
+    def handle(self, *args, **options):
+        """
+        Ex.:
+            - python manage.py sapworker
+            - python manage.py sapworker dispensacion facturacion --hilos=4
+            - python manage.py sapworker --una-vez
+        """
+        hilos = options['hilos']
+        if not connection.features.has_select_for_update_skip_locked and hilos > 1:
+            log.warning(f'{connection.vendor} no soporta SKIP LOCKED, se usará un solo worker')
+            hilos = 1
+
+        workers = [SAPWorker(modulos=options['modulos'], batch=options['lote']) for _ in range(hilos)]
+        for i, worker in enumerate(workers, 1):
+            worker.name = f'{worker.name}-{i}'
+        if hilos == 1:
+            workers[0].run(once=options['una_vez'])
+            return
+        with ThreadPoolExecutor(max_workers=hilos, thread_name_prefix='sapworker') as executor:
+            for future in [executor.submit(w.run, options['una_vez']) for w in workers]:
+                future.result()
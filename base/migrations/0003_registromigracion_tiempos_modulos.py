@@ -0,0 +1,18 @@
+# Generated by Django 4.2.2 on 2026-10-19 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0002_payloadmigracion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='registromigracion',
+            name='tiempos_modulos',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
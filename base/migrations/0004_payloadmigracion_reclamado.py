@@ -0,0 +1,23 @@
+# Generated by Django 4.2.2 on 2026-10-19 10:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0003_registromigracion_tiempos_modulos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payloadmigracion',
+            name='reclamado_en',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='payloadmigracion',
+            name='reclamado_por',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
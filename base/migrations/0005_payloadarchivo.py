@@ -0,0 +1,36 @@
+# Generated by Django 4.2.2 on 2026-10-19 08:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0004_payloadmigracion_reclamado'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PayloadArchivo',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('registrado', models.DateTimeField()),
+                ('actualizado', models.DateTimeField(blank=True, null=True)),
+                ('enviado_a_sap', models.BooleanField(default=False)),
+                ('status', models.TextField()),
+                ('migracion_id', models.IntegerField()),
+                ('modulo', models.CharField(max_length=64)),
+                ('ref_documento', models.CharField(max_length=32)),
+                ('valor_documento', models.CharField(max_length=32)),
+                ('nombre_archivo', models.CharField(max_length=128)),
+                ('cantidad_lineas_documento', models.IntegerField()),
+                ('payload', models.JSONField()),
+                ('lineas', models.TextField()),
+                ('archivado', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'sap_payloads_archivo',
+                'indexes': [models.Index(fields=['nombre_archivo'], name='sap_payload_nombre__8705d9_idx'), models.Index(fields=['archivado'], name='sap_payload_archiva_8f5dff_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.2 on 2026-10-19 08:03
+
+import base.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0005_payloadarchivo'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='payloadarchivo',
+            name='lineas',
+            field=base.fields.CompressedTextField(),
+        ),
+        migrations.AlterField(
+            model_name='payloadarchivo',
+            name='payload',
+            field=base.fields.CompressedJSONField(),
+        ),
+        migrations.AlterField(
+            model_name='payloadmigracion',
+            name='lineas',
+            field=base.fields.CompressedTextField(),
+        ),
+        migrations.AlterField(
+            model_name='payloadmigracion',
+            name='payload',
+            field=base.fields.CompressedJSONField(),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.2 on 2026-10-19 08:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0006_compressed_payloads'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CarpetaDrive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=128, unique=True)),
+                ('folder_id', models.CharField(blank=True, default='', max_length=128)),
+                ('archivos', models.IntegerField(blank=True, null=True)),
+                ('listado', models.DateTimeField(blank=True, null=True)),
+                ('cambio', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'sap_carpetas_drive',
+            },
+        ),
+        migrations.CreateModel(
+            name='CursorDrive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('page_token', models.CharField(max_length=128)),
+                ('actualizado', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'sap_cursor_drive',
+            },
+        ),
+    ]
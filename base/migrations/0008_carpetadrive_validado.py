@@ -0,0 +1,18 @@
+# Generated by Django 4.2.2 on 2026-10-19 08:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0007_drive_changes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='carpetadrive',
+            name='validado',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
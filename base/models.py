@@ -8,11 +8,14 @@
 from django.db import models
 from django.db.models import ForeignKey, CASCADE
 
+from base.fields import CompressedJSONField, CompressedTextField
+
 
 class RegistroMigracion(models.Model):
     iniciado = models.DateTimeField(auto_now_add=True)
     finalizado = models.DateTimeField(auto_now=True, blank=True, null=True)
     estado = models.CharField(max_length=24)
+    tiempos_modulos = models.JSONField(default=dict, blank=True)  # {'compras': 12.5, ...} en segundos
 
     class Meta:
         db_table = 'sap_registro_migracion'
@@ -34,8 +37,12 @@ class PayloadMigracion(models.Model):
 
     nombre_archivo = models.CharField(max_length=128)
     cantidad_lineas_documento = models.IntegerField()
-    payload = models.JSONField()
-    lineas = models.TextField()
+    payload = CompressedJSONField()
+    lineas = CompressedTextField()
+
+    # Worker (manage.py sapworker) que tomó el registro para enviarlo a SAP
+    reclamado_por = models.CharField(max_length=64, blank=True, default='')
+    reclamado_en = models.DateTimeField(blank=True, null=True)
 
     class Meta:
         db_table = 'sap_payloads_en_migracion'
@@ -46,6 +53,71 @@ class PayloadMigracion(models.Model):
                 f"archivo={self.nombre_archivo} enviado_a_sap={self.enviado_a_sap}>")
 
 
+class PayloadArchivo(models.Model):
+    """
+    Payloads de archivos ya enviados a SAP, movidos en bloque desde
+    sap_payloads_en_migracion por manage.py archivapayloads.
+    """
+    id = models.BigIntegerField(primary_key=True)  # El mismo id que tenía en PayloadMigracion
+    registrado = models.DateTimeField()
+    actualizado = models.DateTimeField(blank=True, null=True)
+    enviado_a_sap = models.BooleanField(default=False)
+    status = models.TextField()
+    migracion_id = models.IntegerField()  # Sin FK, los RegistroMigracion pueden ser eliminados
+    modulo = models.CharField(max_length=64)
+
+    ref_documento = models.CharField(max_length=32)
+    valor_documento = models.CharField(max_length=32)
+
+    nombre_archivo = models.CharField(max_length=128)
+    cantidad_lineas_documento = models.IntegerField()
+    payload = CompressedJSONField()
+    lineas = CompressedTextField()
+    archivado = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'sap_payloads_archivo'
+        indexes = [
+            models.Index(fields=['nombre_archivo']),
+            models.Index(fields=['archivado']),
+        ]
+
+    def __str__(self):
+        return (f"<PayloadArchivoId:{self.id} {self.ref_documento}={self.valor_documento} "
+                f"archivo={self.nombre_archivo}>")
+
+
+class CarpetaDrive(models.Model):
+    """
+    Id de una carpeta del drive (ver utils.gdrive.folders) y, para las carpetas
+    {Modulo}Medicar, su estado según el feed de cambios (ver utils.gdrive.changes).
+    """
+    nombre = models.CharField(max_length=128, unique=True)
+    folder_id = models.CharField(max_length=128, blank=True, default='')
+    validado = models.DateTimeField(blank=True, null=True)  # Última vez que se confirmó folder_id en el drive
+    archivos = models.IntegerField(blank=True, null=True)  # csv encontrados en el último listado
+    listado = models.DateTimeField(blank=True, null=True)  # Inicio del último listado
+    cambio = models.DateTimeField(blank=True, null=True)  # Última vez que el feed trajo un csv de la carpeta
+
+    class Meta:
+        db_table = 'sap_carpetas_drive'
+
+    def __str__(self):
+        return f"<CarpetaDrive {self.nombre} archivos={self.archivos}>"
+
+
+class CursorDrive(models.Model):
+    """ Page token de changes.list hasta el cual ya fueron leídos los cambios del drive. """
+    page_token = models.CharField(max_length=128)
+    actualizado = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'sap_cursor_drive'
+
+    def __str__(self):
+        return f"<CursorDrive {self.page_token}>"
+
+
 class AuthGroup(models.Model):
     name = models.CharField(unique=True, max_length=150)
 
@@ -3,6 +3,8 @@ import re
 from django import template
 from django.utils.safestring import mark_safe
 
+from utils.rows import DocStatus, ErrorBucket
+
 register = template.Library()
 
 
@@ -44,12 +46,22 @@ def make_text_status(item: list) -> str:
     :return: Texto con toda la información de los Status.
     """
     messages = []
+    seen = set()
     for i in item:
-        if status := i['Status']:
-            phrases = status.split('|')
-            for phrase in phrases:
-                if phrase.strip() not in messages:
-                    messages.append(phrase.strip())
+        status = i['Status']
+        if isinstance(status, DocStatus):
+            # Las líneas de un mismo documento comparten el mismo DocStatus
+            if id(status) in seen:
+                continue
+            seen.add(id(status))
+            phrases = status.phrases()
+        elif status:
+            phrases = [phrase.strip() for phrase in status.split('|')]
+        else:
+            continue
+        for phrase in phrases:
+            if phrase not in messages:
+                messages.append(phrase)
     return mark_safe(', '.join(messages))
 
 
@@ -57,7 +69,10 @@ def make_text_status(item: list) -> str:
 def len_lists_in_dict(item: dict) -> int:
     """A partir de um diccionario, que contiene por cada llave
     una lista, se suman los len de todos los values
-    asumiendo que todos sus values son listas."""
+    asumiendo que todos sus values son listas.
+    Caso sea un ErrorBucket, su total ya está calculado."""
+    if isinstance(item, ErrorBucket):
+        return item.total
     return sum(len(lst) for lst in item.values())
 
 
@@ -148,15 +163,27 @@ def sum_up_errs(txt: str) -> str:
 
     return txt
 
+
+def summarize_error(txt: str) -> str:
+    """
+    >>> summarize_error("[CSV] CECO no reconocido 112")
+    'CECO no reconocido.'
+    """
+    return sum_up_errs(clean(txt))
+
+
 @register.filter
 def wrap_errors(list_errs: list[str]) -> set:
     """
     A partir de una lista con los errores,
     los intenta resumir para que no haya errores repetidos.
+    Caso sea un ErrorBucket, sus errores ya están resumidos.
     :param list_errs: ['[CSV] CECO no reconocido 112', '[CSV] CECO no reconocido 920']
     :return: ['CECO no reconocido']
     """
-    return {sum_up_errs(clean(err)) for err in list_errs}
+    if isinstance(list_errs, ErrorBucket):
+        return set(list_errs.summaries)
+    return {summarize_error(err) for err in list_errs}
 
 
 @register.filter
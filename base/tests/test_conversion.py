@@ -0,0 +1,101 @@
+import io
+from types import SimpleNamespace
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from unittest import TestCase, mock
+
+from django.test import override_settings
+
+from utils.bootstrap import setup_django
+from utils.conversion import ConversionPool, ConvertedCSV
+from utils.converters import Csv2Dict
+from utils.rows import CsvRowReader
+from utils.sap import manager
+
+FILES = {
+    'id1': ("FechaVencimiento;Plu;Lote\n"
+            "2025-05-30;7707288822951;4V660\n"
+            "2025-06-30;7707288822951;4V661\n"),
+    'id2': ("FechaVencimiento;Plu;Lote\n"
+            "2025-05-30;7707288822951;4V662\n"
+            "30/05/2025;7707288822951;4V663\n"),
+    'id3': ("FechaVencimiento;Plu;Lote\n"
+            "2025-07-30;7707288822951;4V664\n"),
+}
+
+
+def read_csv(file_id, version=''):
+    return CsvRowReader(io.StringIO(FILES[file_id]), delimiter=';')
+
+
+class TestConversionPool(TestCase):
+    def setUp(self):
+        self.sap = mock.MagicMock()
+        self.sap.get_bin_abs_entry_from_lote.return_value = 143
+        self.module = SimpleNamespace(name='ajustes_vencimiento_lote', pk='Lote', series=None,
+                                      sap=mock.MagicMock())
+
+    def convert_here(self, file_id):
+        csv_to_dict = Csv2Dict(self.module.name, self.module.pk, self.module.series, self.sap)
+        csv_to_dict.process(read_csv(file_id))
+        return csv_to_dict
+
+    @override_settings(CONVERSION_START_METHOD='fork')  # Los procesos hijos heredan los mocks
+    @mock.patch('utils.conversion.log')
+    @mock.patch('utils.converters.log')
+    def test_same_result_as_sequential(self, *mocks):
+        """ Los archivos convertidos en otros procesos llegan en orden e iguales a convertirlos uno tras otro """
+        files = [{'id': file_id, 'name': f'{file_id}.csv'} for file_id in FILES]
+        with mock.patch('utils.conversion.GDriveHandler') as drive, \
+                mock.patch('utils.conversion.SAPData', return_value=self.sap):
+            drive.return_value.read_csv_file_by_id.side_effect = read_csv
+            self.sap.entregas_loaded = set()
+            with ConversionPool(self.module, files, 2) as pool:
+                for file in files:
+                    converted = pool.get(file)
+                    self.assertIsInstance(converted, ConvertedCSV)
+                    self.assertEqual(converted.fieldnames, ['FechaVencimiento', 'Plu', 'Lote'])
+                    csv_to_dict = Csv2Dict(self.module.name, self.module.pk, self.module.series, self.module.sap)
+                    converted.load_into(csv_to_dict)
+                    expected = self.convert_here(file['id'])
+                    with self.subTest(file=file['id']):
+                        self.assertEqual(csv_to_dict.data, expected.data)
+                        self.assertEqual(csv_to_dict.errs, expected.errs)
+                        self.assertEqual(csv_to_dict.succss, expected.succss)
+                        self.assertEqual(csv_to_dict.csv_lines, expected.csv_lines)
+                self.assertIsNone(pool.get({'id': 'otro'}))
+        self.module.sap.preload.assert_called_once_with('ajustes_vencimiento_lote')
+
+    def test_error_is_raised_when_loaded(self):
+        converted = ConvertedCSV(['Lote'], error=KeyError('Plu'))
+        with self.assertRaises(KeyError):
+            converted.load_into(Csv2Dict('ajustes_vencimiento_lote', 'Lote', None, mock.MagicMock()))
+
+    @override_settings(SAP_MAX_CONCURRENCY=3)
+    @mock.patch('utils.conversion.ProcessPoolExecutor')
+    @mock.patch('utils.conversion.log')
+    def test_workers_take_sap_budget(self, log, executor):
+        with mock.patch.object(manager, 'sap_budget', manager.BoundedSemaphore(3)):
+            pool = ConversionPool(self.module, [], 4)
+            self.assertEqual(pool.workers, 2)
+            self.assertEqual(executor.call_args.kwargs['mp_context'].get_start_method(), 'spawn')
+            self.assertEqual(manager.reserve_budget(3), 1)
+            manager.release_budget(1)
+
+            # Sin cupos no se crean procesos, los archivos son convertidos por el Parser
+            manager.reserve_budget(1)
+            self.assertEqual(ConversionPool(self.module, [], 4).workers, 0)
+            self.assertEqual(executor.call_count, 1)
+            manager.release_budget(1)
+
+            pool.close()
+            pool.close()
+            self.assertEqual(manager.reserve_budget(3), 3)
+
+
+class TestSpawnedWorker(TestCase):
+    def test_django_is_set_up_before_importing_models(self):
+        """ utils.conversion importa los modelos, un proceso creado con spawn debe configurar Django antes. """
+        with ProcessPoolExecutor(1, mp_context=get_context('spawn'), initializer=setup_django) as executor:
+            converted = executor.submit(ConvertedCSV, ['Lote']).result(timeout=120)
+        self.assertEqual(converted.fieldnames, ['Lote'])
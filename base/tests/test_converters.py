@@ -1,5 +1,8 @@
+import pickle
 from unittest import TestCase, mock
+from base.templatetags.filter_extras import len_lists_in_dict, make_text_status, wrap_errors
 from utils.converters import Csv2Dict
+from utils.rows import status_category
 
 
 class TestCsv2Dict(TestCase):
@@ -184,3 +187,174 @@ class TestUpdateStatus(TestCase):
         new_row = {'FechaVencimiento': '2026-05-30', 'Lote': '4V660', 'Plu': '7707288822951', 'Status': ''}
 
         self.converter.update_status_necessary_columns(new_row, key)
+
+
+class TestSuccssOrderedByDate(TestCase):
+    def setUp(self):
+        self.converter = Csv2Dict(name='dispensacion', pk='NroSSC', series={}, sap=mock.MagicMock())
+
+    def add(self, key, fecha):
+        row = {'NroSSC': key, 'FechaDispensacion': fecha, 'Status': ''}
+        self.converter.data[key] = {'json': {}, 'csv': [row]}
+        self.converter.register_date(key, row)
+        self.converter.succss.add(key)
+
+    def test_ordered_by_date(self):
+        self.add('3', '2023-10-03 20:53:48')
+        self.add('1', '2023-10-01 08:00:00')
+        self.add('2', '2023-10-01 09:30:00')
+        self.assertEqual(self.converter.succss_ordered_by_date, ['1', '2', '3'])
+
+    def test_only_succss_are_returned(self):
+        self.add('1', '2023-10-01 08:00:00')
+        self.add('2', '2023-10-02 08:00:00')
+        self.converter.succss.discard('1')
+        self.converter.errs.add('1')
+        self.assertEqual(self.converter.succss_ordered_by_date, ['2'])
+
+    def test_date_is_parsed_once(self):
+        self.add('1', '2023-10-01 08:00:00')
+        self.converter.register_date('1', {'FechaDispensacion': '2024-01-01 00:00:00'})
+        self.assertEqual(self.converter.dates['1'], 20231001080000)
+        self.assertEqual(len(self.converter.dates_index), 1)
+
+    @mock.patch('utils.converters.log')
+    def test_unrecognized_date_returns_succss(self, mock_log):
+        self.add('1', '2023-10-01 08:00:00')
+        self.add('2', '01/10/2023')
+        self.assertEqual(self.converter.succss_ordered_by_date, {'1', '2'})
+        mock_log.error.assert_called_once()
+
+    @mock.patch('utils.converters.log')
+    def test_without_fecha_column_returns_succss(self, mock_log):
+        converter = Csv2Dict(name='test_converter', pk='ID', series={}, sap=mock.MagicMock())
+        converter.succss.update({'1', '2'})
+        self.assertEqual(converter.succss_ordered_by_date, {'1', '2'})
+        mock_log.error.assert_called_once()
+
+    def test_rows_added_without_register(self):
+        self.add('2', '2023-10-02 08:00:00')
+        self.converter.data['1'] = {'json': {}, 'csv': [{'FechaDispensacion': '2023-10-01 08:00:00'}]}
+        self.converter.succss.add('1')
+        self.assertEqual(self.converter.succss_ordered_by_date, ['1', '2'])
+
+    def test_clear_data(self):
+        self.add('1', '2023-10-01 08:00:00')
+        self.converter.clear_data()
+        self.assertEqual((self.converter.dates, self.converter.dates_index), ({}, []))
+
+
+class TestDocStatus(TestCase):
+    """ Todas las líneas de un documento leídas por process_module comparten el mismo status. """
+
+    def setUp(self):
+        self.converter = Csv2Dict(name='dispensacion', pk='NroSSC', series={}, sap=mock.MagicMock())
+        self.converter.build_base = mock.MagicMock(side_effect=self.build)
+        self.converter.build_document_lines = mock.MagicMock(side_effect=self.build)
+        self.converter.add_article = mock.MagicMock()
+
+    def build(self, *args):
+        row = args[-1]
+        if row['Error']:
+            for txt in row['Error'].split(','):
+                self.converter.reg_error(row, txt)
+
+    def process(self, *rows):
+        fields = ('NroSSC', 'FechaDispensacion', 'Error')
+        self.converter.process_module([dict(zip(fields, row)) for row in rows])
+
+    def statuses(self, key):
+        return [str(r['Status']) for r in self.converter.data[key]['csv']]
+
+    def test_rows_share_status(self):
+        self.process(('1', '2023-10-01 08:00:00', '[CSV] Plu no reconocido'),
+                     ('1', '2023-10-01 08:00:00', ''),
+                     ('2', '2023-10-01 08:00:00', ''))
+        lines = self.converter.data['1']['csv']
+        self.assertIs(lines[0]['Status'], lines[1]['Status'])
+        self.assertEqual(self.statuses('1'), ['[CSV] Plu no reconocido'] * 2)
+        self.assertEqual(self.statuses('2'), [''])
+        self.assertEqual((self.converter.errs, self.converter.succss), ({'1'}, {'2'}))
+
+    def test_status_of_new_erroneous_row_replaces_previous(self):
+        """ Igual que antes, el status de la última línea con error es el del documento. """
+        self.process(('1', '2023-10-01 08:00:00', '[CSV] Plu no reconocido,[CSV] Lote vencido'),
+                     ('1', '2023-10-01 08:00:00', '[CSV] Precio,[CSV] CECO no reconocido'),
+                     ('1', '2023-10-01 08:00:00', ''))
+        self.assertEqual(self.statuses('1'), ['[CSV] Precio | [CSV] CECO no reconocido'] * 3)
+
+    def test_without_pk(self):
+        self.process(('', '2023-10-01 08:00:00', ''))
+        self.assertEqual(self.statuses('sin nrossc (1)'), ["[CSV] NroSSC desconocido para Dispensacion: ''"])
+
+    def test_replace_and_render(self):
+        self.process(('1', '2023-10-01 08:00:00', '[CSV] Plu no reconocido|[CSV] Lote vencido'),
+                     ('1', '2023-10-01 08:00:00', ''))
+        self.assertEqual(make_text_status(self.converter.data['1']['csv']),
+                         '[CSV] Plu no reconocido, [CSV] Lote vencido')
+        self.converter.doc_status('1').replace('DocEntry: 752066')
+        self.assertEqual(self.statuses('1'), ['DocEntry: 752066'] * 2)
+
+    def regroup(self):
+        """ Agrupación como se hacía antes, recorriendo todos los documentos. """
+        groups = {'CSV': {}, 'SAP': {}, 'CONNECTION': {}, 'DocEntry': {}}
+        for k, v in self.converter.data.items():
+            text = make_text_status(v['csv'])
+            if category := status_category(text):
+                groups[category].setdefault(text, set()).add(k)
+        return groups
+
+    def assert_groups(self):
+        self.converter.group_by_type_of_errors()
+        expected = self.regroup()
+        for attr, category in (('csv_errs', 'CSV'), ('sap_errs', 'SAP'),
+                               ('other_errs', 'CONNECTION'), ('result_succss', 'DocEntry')):
+            bucket = getattr(self.converter, attr)
+            self.assertEqual(dict(bucket), expected[category])
+            self.assertEqual(len_lists_in_dict(bucket), len_lists_in_dict(expected[category]))
+            self.assertEqual(wrap_errors(bucket), wrap_errors(expected[category]))
+
+    def test_histogram_follows_status_changes(self):
+        self.process(('1', '2023-10-01 08:00:00', '[CSV] CECO no reconocido 112'),
+                     ('2', '2023-10-01 08:00:00', '[CSV] CECO no reconocido 920'),
+                     ('3', '2023-10-01 08:00:00', ''),
+                     ('4', '2023-10-01 08:00:00', ''),
+                     ('', '2023-10-01 08:00:00', ''))
+        self.assert_groups()
+        self.assertEqual(wrap_errors(self.converter.csv_errs), {'CECO no reconocido.', "NroSSC desconocido para Dispensacion: ''"})
+
+        self.converter.doc_status('3').replace('[SAP] No existen registros coincidentes (ODBC -2028) [3]')
+        self.converter.doc_status('4').replace('[CONNECTION] Read timed out')
+        self.assert_groups()
+        self.assertEqual(len_lists_in_dict(self.converter.other_errs), 1)
+
+        self.converter.doc_status('4').replace('DocEntry: 752066')
+        self.converter.unload('1')
+        self.assert_groups()
+        self.assertFalse(self.converter.other_errs)
+        self.assertEqual(self.converter.csv_errs.summaries['CECO no reconocido.'], 1)
+
+        self.converter.clear_data()
+        self.assert_groups()
+        self.assertFalse(self.converter.histogram.texts)
+
+    def test_histogram_with_rows_added_directly(self):
+        self.process(('1', '2023-10-01 08:00:00', '[CSV] Plu no reconocido'))
+        self.converter.data['9'] = {'json': {}, 'csv': [{'NroSSC': '9', 'Status': '[SAP] Lote inválido'},
+                                                        {'NroSSC': '9', 'Status': '[SAP] Lote inválido'}]}
+        self.assert_groups()
+        self.assertEqual(self.converter.sap_errs, {'[SAP] Lote inválido': {'9'}})
+
+    def test_histogram_after_load_converted(self):
+        """ Los DocStatus que vienen de otro proceso (ver utils.conversion) vuelven a ser observados. """
+        self.process(('1', '2023-10-01 08:00:00', '[CSV] Plu no reconocido'),
+                     ('2', '2023-10-01 08:00:00', ''))
+        other = Csv2Dict(name='dispensacion', pk='NroSSC', series={}, sap=None)
+        other.data, other.status, other.errs, other.succss = pickle.loads(pickle.dumps(
+            (self.converter.data, self.converter.status, self.converter.errs, self.converter.succss)))
+        self.converter = Csv2Dict(name='dispensacion', pk='NroSSC', series={}, sap=None)
+        self.converter.load_converted(other)
+        self.converter.doc_status('2').replace('[SAP] Lote inválido')
+        self.assert_groups()
+        self.assertEqual(self.converter.sap_errs, {'[SAP] Lote inválido': {'2'}})
+        self.assertEqual(self.converter.csv_errs, {'[CSV] Plu no reconocido': {'1'}})
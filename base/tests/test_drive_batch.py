@@ -0,0 +1,119 @@
+from unittest import TestCase, mock
+
+from googleapiclient.errors import HttpError
+
+from utils.gdrive.batch import DriveBatch
+from utils.gdrive.handler_api import GDriveHandler
+from utils.pipelines import ExcludeFromDB
+
+
+class FakeBatch:
+    """ BatchHttpRequest que responde a cada petición según FakeService.errors. """
+
+    def __init__(self, service, callback):
+        self.service, self.callback = service, callback
+        self.requests = []
+
+    def add(self, request, request_id):
+        self.requests.append((request_id, request))
+
+    def execute(self):
+        self.service.batches.append([request_id for request_id, _ in self.requests])
+        for request_id, request in self.requests:
+            errors = self.service.errors.get(request_id)
+            error = errors.pop(0) if errors else None
+            self.callback(request_id, None if error else {'id': request_id}, error)
+
+
+class FakeService:
+    def __init__(self):
+        self.batches = []  # Ids de las peticiones de cada lote enviado
+        self.errors = {}  # {request_id: [error del primer envío, del segundo, ...]}
+        self.updates = []
+
+    def new_batch_http_request(self, callback):
+        return FakeBatch(self, callback)
+
+    def files(self):
+        return self
+
+    def update(self, **kwargs):
+        self.updates.append(kwargs)
+        return kwargs
+
+
+def http_error(status):
+    return HttpError(mock.MagicMock(status=status), b'')
+
+
+@mock.patch('utils.gdrive.batch.time.sleep')
+class TestDriveBatch(TestCase):
+    def setUp(self):
+        self.service = FakeService()
+        self.batch = DriveBatch(self.service)
+
+    def test_items_are_sent_in_batches_of_100(self, sleep):
+        done = []
+        for i in range(250):
+            self.batch.add(str(i), f'Mover {i}', mock.MagicMock())
+            self.batch.after(str(i), done.append, i)
+        self.assertEqual(self.batch.execute(), [])
+        self.assertEqual([len(batch) for batch in self.service.batches], [100, 100, 50])
+        self.assertEqual(done, list(range(250)))
+        self.assertEqual(len(self.batch), 0)
+        sleep.assert_not_called()
+
+    def test_only_failed_items_are_retried(self, sleep):
+        done = []
+        for key in ('a', 'b', 'c'):
+            self.batch.add(key, f'Mover {key}', mock.MagicMock())
+            self.batch.after(key, done.append, key)
+        self.service.errors = {'b': [http_error(429), http_error(503)], 'c': [http_error(404)]}
+        failed = self.batch.execute()
+        self.assertEqual([item.key for item in failed], ['c'])
+        self.assertEqual(self.service.batches, [['a', 'b', 'c'], ['b'], ['b']])
+        self.assertEqual(done, ['a', 'b'])
+
+    def test_failed_request_fails_every_item(self, sleep):
+        self.batch.add('a', 'Mover a', mock.MagicMock())
+        with mock.patch.object(FakeBatch, 'execute', side_effect=ConnectionError('reset')):
+            failed = self.batch.execute()
+        self.assertEqual([item.key for item in failed], ['a'])
+        self.assertEqual(sleep.call_count, 3)
+
+
+class TestBatchedMoves(TestCase):
+    def setUp(self):
+        self.drive = GDriveHandler.__new__(GDriveHandler)
+        self.drive.service = FakeService()
+        self.drive.get_folder_id_by_name = lambda name: f'id-{name}'
+        self.file = {'id': 'f1', 'name': 'Dispensacion-1.csv', 'parents': ['id-DispensacionMedicar']}
+
+    @mock.patch('utils.pipelines.archive_files', return_value=10)
+    def test_records_are_excluded_after_the_move(self, delete):
+        self.drive.move_file(self.file, 'DispensacionMedicar_BackUp', later=True)
+        self.assertTrue(self.drive.is_moving(self.file))
+        self.assertEqual(self.drive.service.updates, [])
+
+        parser = mock.MagicMock(input=self.drive)
+        ExcludeFromDB().run(filename='Dispensacion-1', csv_to_dict=mock.MagicMock(),
+                            parser=parser, file=self.file)
+        delete.assert_not_called()
+
+        self.assertEqual(self.drive.flush_moves(), 0)
+        self.assertEqual(self.drive.service.updates, [
+            {'fileId': 'f1', 'addParents': 'id-DispensacionMedicar_BackUp',
+             'removeParents': 'id-DispensacionMedicar', 'fields': 'id, parents'}
+        ])
+        delete.assert_called_once_with(mock.ANY, ['Dispensacion-1'])
+        self.assertFalse(self.drive.is_moving(self.file))
+
+    @mock.patch('utils.pipelines.archive_files')
+    @mock.patch('utils.gdrive.batch.time.sleep')
+    def test_records_are_kept_when_the_move_fails(self, sleep, delete):
+        self.drive.move_file(self.file, 'DispensacionMedicar_BackUp', later=True)
+        ExcludeFromDB().run(filename='Dispensacion-1', csv_to_dict=mock.MagicMock(),
+                            parser=mock.MagicMock(input=self.drive), file=self.file)
+        self.drive.service.errors = {'f1': [http_error(404)]}
+        self.assertEqual(self.drive.flush_moves(), 1)
+        delete.assert_not_called()
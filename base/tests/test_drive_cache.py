@@ -0,0 +1,80 @@
+import hashlib
+import os
+import tempfile
+import time
+from unittest import TestCase, mock
+
+from utils.gdrive.cache import DownloadCache, version_of
+from utils.gdrive.handler_api import GDriveHandler
+
+CONTENT = "Plu;Lote\n7707288822951;4V660\n".encode('utf-8')
+
+
+def md5(content):
+    return hashlib.md5(content).hexdigest()
+
+
+class TestDownloadCache(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = DownloadCache(self.tmp.name, max_bytes=100)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_version_of(self):
+        self.assertEqual(version_of({'md5Checksum': 'abc', 'modifiedTime': '2023-07-05T21:59:16.994Z'}), 'abc')
+        self.assertEqual(version_of({'modifiedTime': '2023-07-05T21:59:16.994Z'}), '2023-07-05T21:59:16.994Z')
+        self.assertEqual(version_of({}), '')
+
+    def test_new_version_replaces_the_old_one(self):
+        self.cache.put('f1', md5(CONTENT), CONTENT)
+        self.assertEqual(self.cache.get('f1', md5(CONTENT)), CONTENT)
+        modified = CONTENT + b'7707288822951;4V661\n'
+        self.assertIsNone(self.cache.get('f1', md5(modified)))
+        self.cache.put('f1', md5(modified), modified)
+        self.assertEqual(os.listdir(self.tmp.name), [self.cache.path('f1', md5(modified)).name])
+
+    def test_content_not_matching_md5_is_not_saved(self):
+        self.cache.put('f1', md5(b'otro'), CONTENT)
+        self.assertEqual(os.listdir(self.tmp.name), [])
+
+    def test_least_recently_used_are_evicted(self):
+        for i, file_id in enumerate(('f1', 'f2')):
+            self.cache.put(file_id, 'v', b'x' * 40)
+            os.utime(self.cache.path(file_id, 'v'), (time.time() - 100 + i, time.time() - 100 + i))
+        self.assertIsNotNone(self.cache.get('f1', 'v'))  # f2 pasa a ser la menos usada
+        self.cache.put('f3', 'v', b'x' * 40)
+        self.assertIsNone(self.cache.get('f2', 'v'))
+        self.assertIsNotNone(self.cache.get('f1', 'v'))
+        self.assertIsNotNone(self.cache.get('f3', 'v'))
+
+
+class TestReadCsv(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.drive = GDriveHandler.__new__(GDriveHandler)
+        self.drive.cache = DownloadCache(self.tmp.name, max_bytes=1024)
+        self.drive.download_file = mock.MagicMock(return_value=CONTENT)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_second_read_is_not_downloaded(self):
+        for _ in range(2):
+            reader = self.drive.read_csv_file_by_id('f1', md5(CONTENT))
+            self.assertEqual([(row['Plu'], row['Lote']) for row in reader], [('7707288822951', '4V660')])
+        self.drive.download_file.assert_called_once_with('f1')
+
+    def test_without_version_it_is_always_downloaded(self):
+        self.drive.read_csv_file_by_id('f1')
+        self.drive.read_csv_file_by_id('f1')
+        self.assertEqual(self.drive.download_file.call_count, 2)
+
+    def test_encoding_is_detected_on_the_first_chunk(self):
+        content = ("Plu;Descripción\n" + "7707288822951;Acetaminofén\n" * 5000).encode('latin-1')
+        self.drive.download_file.return_value = content
+        with mock.patch.object(GDriveHandler, 'detect_csv_encoding', return_value='ISO-8859-1') as detect:
+            rows = list(self.drive.read_csv_file_by_id('f1'))
+        self.assertEqual(rows[0]['Descripción'], 'Acetaminofén')
+        self.assertEqual(len(detect.call_args.kwargs['head']), 64 * 1024)
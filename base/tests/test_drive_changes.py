@@ -0,0 +1,104 @@
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from googleapiclient.errors import HttpError
+
+from base.models import CarpetaDrive, CursorDrive
+from utils.gdrive.changes import must_list, refresh_changes, register_listing
+
+FOLDERS = {'DispensacionMedicar': 'id-dispensacion', 'ComprasMedicar': 'id-compras'}
+
+
+class FakeDrive:
+    """ GDriveHandler con el feed de cambios en memoria, paginado de a dos cambios. """
+
+    def __init__(self):
+        self.feed = []  # [{'fileId':..., 'file': {...}}, ...], el page token es la posición
+        self.calls = 0
+        self.error = None
+        self.service = mock.MagicMock()
+        self.service.changes.return_value.getStartPageToken.return_value.execute.side_effect = \
+            lambda: {'startPageToken': str(len(self.feed))}
+        self.service.changes.return_value.list.side_effect = self.list
+
+    def list(self, pageToken, **kwargs):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        start = int(pageToken)
+        page = self.feed[start:start + 2]
+        response = {'changes': page}
+        if start + 2 < len(self.feed):
+            response['nextPageToken'] = str(start + 2)
+        else:
+            response['newStartPageToken'] = str(len(self.feed))
+        return mock.MagicMock(execute=mock.MagicMock(return_value=response))
+
+    def upload(self, name, folder):
+        self.feed.append({'fileId': name, 'file': {'name': name, 'parents': [FOLDERS[folder]]}})
+
+    @staticmethod
+    def get_folder_id_by_name(name):
+        return FOLDERS[name]
+
+
+@override_settings(DRIVE_CHANGES=True)
+class TestDriveChanges(TestCase):
+    def setUp(self):
+        self.drive = FakeDrive()
+
+    def list_folder(self, name, files):
+        """ Simula Parser.discover_files. """
+        if must_list(self.drive, name):
+            register_listing(name, files, timezone.now())
+            return True
+        return False
+
+    def test_first_cycle_lists_every_folder(self):
+        self.assertIsNone(refresh_changes(self.drive))
+        self.assertEqual(CursorDrive.objects.get().page_token, '0')
+        self.assertTrue(self.list_folder('DispensacionMedicar', 0))
+        self.assertTrue(self.list_folder('ComprasMedicar', 2))
+
+    def test_empty_folders_are_skipped_until_a_csv_arrives(self):
+        refresh_changes(self.drive)
+        self.list_folder('DispensacionMedicar', 0)
+        self.list_folder('ComprasMedicar', 0)
+        self.list_folder('DispensacionMedicar', 0)
+
+        # Siguiente ciclo sin cambios: ninguna carpeta es listada
+        self.assertEqual(refresh_changes(self.drive), set())
+        self.assertFalse(self.list_folder('DispensacionMedicar', 0))
+        self.assertFalse(self.list_folder('ComprasMedicar', 0))
+
+        # Llegan csv a compras, en varias páginas del feed
+        for name in ('Compras-1.csv', 'notas.txt', 'Compras-2.csv'):
+            self.drive.upload(name, 'ComprasMedicar')
+        self.drive.calls = 0
+        self.assertEqual(refresh_changes(self.drive), {'id-compras'})
+        self.assertEqual(self.drive.calls, 2)
+        self.assertEqual(CursorDrive.objects.get().page_token, '3')
+        self.assertFalse(self.list_folder('DispensacionMedicar', 0))
+        self.assertTrue(self.list_folder('ComprasMedicar', 2))
+
+        # Con archivos pendientes sigue siendo listada hasta quedar vacía
+        refresh_changes(self.drive)
+        self.assertTrue(self.list_folder('ComprasMedicar', 0))
+        refresh_changes(self.drive)
+        self.assertFalse(self.list_folder('ComprasMedicar', 0))
+
+    def test_feed_error_lists_every_folder(self):
+        refresh_changes(self.drive)
+        self.list_folder('DispensacionMedicar', 0)
+        self.drive.upload('Dispensacion-1.csv', 'DispensacionMedicar')
+        self.drive.error = HttpError(mock.MagicMock(status=410), b'Gone')
+        self.assertIsNone(refresh_changes(self.drive))
+        self.assertEqual(CursorDrive.objects.get().page_token, '1')
+        self.assertTrue(self.list_folder('DispensacionMedicar', 1))
+
+    @override_settings(DRIVE_CHANGES=False)
+    def test_disabled(self):
+        self.assertIsNone(refresh_changes(self.drive))
+        self.assertTrue(must_list(self.drive, 'DispensacionMedicar'))
+        self.assertFalse(CarpetaDrive.objects.exists())
@@ -0,0 +1,80 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from googleapiclient.errors import HttpError
+
+from base.models import CarpetaDrive
+from utils.gdrive.handler_api import GDriveHandler
+from utils.gdrive.stats import drive_stats
+
+FOLDER = 'application/vnd.google-apps.folder'
+
+
+def new_handler(service) -> GDriveHandler:
+    """ GDriveHandler sin credenciales, como si fuera creado en un proceso nuevo. """
+    GDriveHandler.folders_ids.clear()
+    drive = GDriveHandler.__new__(GDriveHandler)
+    drive.service = service
+    drive.files = []
+    return drive
+
+
+@override_settings(DRIVE_FOLDER_VALIDATE_HOURS=24)
+class TestFolderIds(TestCase):
+    def setUp(self):
+        drive_stats.reset()
+        self.service = mock.MagicMock()
+        self.files = self.service.files.return_value
+        self.files.list.return_value.execute.return_value = {'files': [{'id': 'id-compras'}]}
+        self.files.get.return_value.execute.return_value = {'name': 'ComprasMedicar', 'mimeType': FOLDER,
+                                                            'trashed': False}
+
+    def tearDown(self):
+        GDriveHandler.folders_ids.clear()
+
+    def test_folder_id_is_persisted(self):
+        self.assertEqual(new_handler(self.service).get_folder_id_by_name('ComprasMedicar'), 'id-compras')
+        self.assertEqual(new_handler(self.service).get_folder_id_by_name('ComprasMedicar'), 'id-compras')
+        self.assertEqual(self.files.list.call_count, 1)
+        self.files.get.assert_not_called()
+        self.assertEqual(CarpetaDrive.objects.get(nombre='ComprasMedicar').folder_id, 'id-compras')
+        self.assertEqual(drive_stats.calls, {'busqueda_carpeta': 1})
+
+    def test_old_folder_id_is_validated(self):
+        CarpetaDrive.objects.create(nombre='ComprasMedicar', folder_id='id-compras',
+                                    validado=timezone.now() - timedelta(hours=25))
+        self.assertEqual(new_handler(self.service).get_folder_id_by_name('ComprasMedicar'), 'id-compras')
+        self.files.get.assert_called_once()
+        self.files.list.assert_not_called()
+        self.assertGreater(CarpetaDrive.objects.get().validado, timezone.now() - timedelta(minutes=1))
+
+    def test_invalid_folder_id_is_discovered_again(self):
+        CarpetaDrive.objects.create(nombre='ComprasMedicar', folder_id='id-borrado',
+                                    validado=timezone.now() - timedelta(hours=25))
+        self.files.get.return_value.execute.side_effect = HttpError(mock.MagicMock(status=404), b'Not Found')
+        self.assertEqual(new_handler(self.service).get_folder_id_by_name('ComprasMedicar'), 'id-compras')
+        self.assertEqual(CarpetaDrive.objects.get().folder_id, 'id-compras')
+
+    def test_renamed_folder_is_discovered_again(self):
+        CarpetaDrive.objects.create(nombre='ComprasMedicar', folder_id='id-viejo')
+        self.files.get.return_value.execute.return_value = {'name': 'Otra', 'mimeType': FOLDER, 'trashed': False}
+        self.assertEqual(new_handler(self.service).get_folder_id_by_name('ComprasMedicar'), 'id-compras')
+
+    def test_listing_goes_through_all_pages(self):
+        pages = {
+            None: {'files': [{'id': '3', 'name': 'C.csv', 'createdTime': '2023-06-20T14:51:24.290Z'}],
+                   'nextPageToken': 'p2'},
+            'p2': {'files': [{'id': '1', 'name': 'A.csv', 'createdTime': '2023-06-05T13:00:48.698Z'}],
+                   'nextPageToken': 'p3'},
+            'p3': {'files': [{'id': '2', 'name': 'B.csv', 'createdTime': '2023-06-10T13:00:48.698Z'}]},
+        }
+        self.files.list.side_effect = lambda **kwargs: mock.MagicMock(
+            execute=mock.MagicMock(return_value=pages[kwargs['pageToken']]))
+        files = new_handler(self.service).get_files_in_folder_by_id('id-compras', ext='csv')
+        self.assertEqual([f['id'] for f in files], ['1', '2', '3'])
+        self.assertTrue(all(call.kwargs['fields'].startswith('nextPageToken')
+                            for call in self.files.list.call_args_list))
+        self.assertEqual(drive_stats.calls, {'listado_carpeta': 3})
+        self.assertIn('3 consultas', drive_stats.summary())
@@ -0,0 +1,66 @@
+import json
+import tempfile
+from pathlib import Path
+from unittest import TestCase, mock
+
+from utils.converters import Csv2Dict
+from utils.exporters import write_csvs, write_jsonl
+from utils.pipelines import File
+from utils.rows import CsvRow, DocStatus
+
+
+class TestWriteCsvs(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.csv_to_dict = Csv2Dict('compras', 'NroDocumento', {}, None)
+        for key, status in (('1', 'DocEntry: 1'), ('2', '[CSV] Plu no reconocido'), ('3', ''),
+                            ('sin NroDocumento', '[CSV] Sin NroDocumento')):
+            doc_status = DocStatus(status)
+            rows = [CsvRow.from_dict({'NroDocumento': key, 'Plu': plu, 'Status': ''}) for plu in ('770', '771')]
+            for row in rows:
+                row['Status'] = doc_status
+            self.csv_to_dict.data[key] = {'json': {'DocNum': key}, 'csv': rows}
+        self.csv_to_dict.succss = {'1', '3'}
+        self.csv_to_dict.errs = {'2'}
+        patcher = mock.patch('utils.exporters.log')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def path(self, name):
+        return str(Path(self.tmp.name) / name)
+
+    def read(self, path):
+        return Path(path).read_text(encoding='utf-8-sig').splitlines()
+
+    def test_one_pass_several_files(self):
+        paths = {kind: self.path(f'{kind}.csv') for kind in ('processed', 'errors', 'success')}
+        with mock.patch.object(self.csv_to_dict, 'data', wraps=self.csv_to_dict.data) as data:
+            self.assertEqual(write_csvs(self.csv_to_dict, paths), paths)
+        data.items.assert_called_once_with()
+        self.assertEqual(self.read(paths['processed'])[0], 'NroDocumento;Plu;Status')
+        self.assertEqual(len(self.read(paths['processed'])), 9)
+        self.assertEqual(self.read(paths['errors'])[1:], [
+            '2;770;[CSV] Plu no reconocido', '2;771;[CSV] Plu no reconocido',
+            'sin NroDocumento;770;[CSV] Sin NroDocumento', 'sin NroDocumento;771;[CSV] Sin NroDocumento',
+        ])
+        self.assertEqual(self.read(paths['success'])[1:], ['1;770;DocEntry: 1', '1;771;DocEntry: 1', '3;770;', '3;771;'])
+
+    def test_file_without_rows_is_not_created(self):
+        self.csv_to_dict.errs.clear()
+        del self.csv_to_dict.data['sin NroDocumento']
+        created = File(self.csv_to_dict, 'compras').make_csvs(self.path('all.csv'), errors=self.path('errs.csv'))
+        self.assertEqual(created, {'processed': self.path('all.csv'), 'errors': ''})
+        self.assertFalse(Path(self.path('errs.csv')).exists())
+
+    def test_make_csv(self):
+        path = File(self.csv_to_dict, 'compras').make_csv(self.path('errs.csv'), only_error=True)
+        self.assertEqual(len(self.read(path)), 5)
+
+    def test_write_jsonl(self):
+        path = File(self.csv_to_dict, 'compras').filter_json_status(self.path('errs.jsonl'), only_error=True)
+        lines = [json.loads(line) for line in self.read(path)]
+        self.assertEqual(lines[0], {'valor_documento': '2', 'status': '[CSV] Plu no reconocido', 'json': {'DocNum': '2'}})
+        self.assertEqual([line['valor_documento'] for line in lines], ['2', 'sin NroDocumento'])
+        self.assertEqual(write_jsonl(self.csv_to_dict, path), path)
+        self.assertEqual(len(self.read(path)), 4)
@@ -0,0 +1,62 @@
+from django.db import connection
+from django.test import TestCase, override_settings
+
+from base.fields import JSON_KEY, TEXT_PREFIX
+from base.models import PayloadMigracion, RegistroMigracion
+
+PAYLOAD = {'CardCode': 'PR900073223', 'DocumentLines': [
+    {'ItemCode': '7705959015152', 'Quantity': i, 'BatchNumbers': [{'BatchNumber': f'4V66{i}', 'Quantity': i}]}
+    for i in range(20)
+]}
+LINEAS = str([{'NroSSC': '1', 'Plu': '7705959015152', 'Lote': f'4V66{i}', 'Status': ''} for i in range(20)])
+
+
+class TestCompressedFields(TestCase):
+    def setUp(self):
+        self.migracion = RegistroMigracion.objects.create(estado='en ejecucion')
+
+    def create(self, payload=PAYLOAD, lineas=LINEAS):
+        return PayloadMigracion.objects.create(
+            migracion_id=self.migracion, modulo='compras', valor_documento='1', nombre_archivo='Compras-1',
+            status='', cantidad_lineas_documento=20, payload=payload, lineas=lineas
+        )
+
+    def stored(self, record):
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT payload, lineas FROM {PayloadMigracion._meta.db_table} WHERE id = %s",
+                           [record.id])
+            return cursor.fetchone()
+
+    @override_settings(PAYLOAD_COMPRESS_MIN_BYTES=200)
+    def test_large_values_are_compressed(self):
+        record = self.create()
+        payload, lineas = self.stored(record)
+        self.assertIn(JSON_KEY, payload)
+        self.assertTrue(lineas.startswith(TEXT_PREFIX))
+        self.assertLess(len(lineas), len(LINEAS))
+        record = PayloadMigracion.objects.get(id=record.id)
+        self.assertEqual(record.payload, PAYLOAD)
+        self.assertEqual(record.lineas, LINEAS)
+        self.assertEqual(list(PayloadMigracion.objects.values_list('payload', flat=True)), [PAYLOAD])
+        self.assertEqual(PayloadMigracion.objects.filter(payload__has_key=JSON_KEY).count(), 1)
+
+    @override_settings(PAYLOAD_COMPRESS_MIN_BYTES=200)
+    def test_small_values_are_not_compressed(self):
+        record = self.create({'CardCode': 'PR900073223'}, "[{'NroSSC': '1'}]")
+        payload, lineas = self.stored(record)
+        self.assertNotIn(JSON_KEY, payload)
+        self.assertEqual(lineas, "[{'NroSSC': '1'}]")
+        self.assertEqual(PayloadMigracion.objects.get(id=record.id).payload, {'CardCode': 'PR900073223'})
+
+    @override_settings(PAYLOAD_COMPRESS_MIN_BYTES=0)
+    def test_disabled(self):
+        record = self.create()
+        payload, lineas = self.stored(record)
+        self.assertNotIn(JSON_KEY, payload)
+        self.assertEqual(lineas, LINEAS)
+
+    def test_compressed_rows_are_read_with_compression_disabled(self):
+        with override_settings(PAYLOAD_COMPRESS_MIN_BYTES=200):
+            record = self.create()
+        record = PayloadMigracion.objects.get(id=record.id)
+        self.assertEqual((record.payload, record.lineas), (PAYLOAD, LINEAS))
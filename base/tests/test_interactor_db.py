@@ -0,0 +1,210 @@
+import re
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase, override_settings
+
+from base.models import PayloadArchivo, PayloadMigracion
+from utils.converters import Csv2Dict
+from utils.interactor_db import (DBHandler, archivable_files, archive_files, archived_files, claim_payloads,
+                                 crea_registro_migracion, delete_file_payloads, purge_archive, release_payloads,
+                                 renew_claim)
+from utils.parsers import Parser
+from utils.pipelines import ExcludeFromDB
+from utils.rows import CsvRow, DocStatus
+
+
+@override_settings(DB_BULK_CHUNK=2)
+class TestDBHandler(TestCase):
+    def setUp(self):
+        with mock.patch('utils.decorators.DEBUG', False):
+            self.migracion = crea_registro_migracion()
+        self.csv_to_dict = Csv2Dict('dispensacion', 'NroSSC', {}, mock.MagicMock())
+        for key in ('1', '2', '3', '4', '5'):
+            status = DocStatus('[CSV] Plu no reconocido' if key == '3' else '')
+            row = CsvRow.from_dict({'NroSSC': key, 'Plu': '7705959015152', 'Status': ''})
+            row['Status'] = status
+            self.csv_to_dict.data[key] = {'json': {'U_LF_Formula': key}, 'csv': [row, row]}
+        self.db = DBHandler(self.migracion.id, 'dispensacion', 'NroSSC')
+        self.db.fname = 'Dispensacion-1'
+
+    def test_process(self):
+        pks = self.db.process(self.csv_to_dict)
+        saved = PayloadMigracion.objects.filter(nombre_archivo='Dispensacion-1')
+        self.assertEqual(pks, dict(saved.values_list('valor_documento', 'id')))
+        self.assertEqual(set(self.db.records), set(saved))
+        record = saved.get(valor_documento='3')
+        self.assertEqual(record.status, '[CSV] Plu no reconocido')
+        self.assertEqual(record.payload, {'U_LF_Formula': '3'})
+        self.assertEqual(record.cantidad_lineas_documento, 2)
+        self.assertEqual(eval(record.lineas)[0],
+                         {'NroSSC': '3', 'Plu': '7705959015152', 'Status': '[CSV] Plu no reconocido'})
+
+    def test_process_in_chunks(self):
+        with mock.patch.object(PayloadMigracion.objects, 'bulk_create',
+                               wraps=PayloadMigracion.objects.bulk_create) as bulk_create:
+            self.db.process(self.csv_to_dict)
+        self.assertEqual([len(c.args[0]) for c in bulk_create.call_args_list], [2, 2, 1])
+
+    def test_copy_value(self):
+        fields = {f.name: f for f in PayloadMigracion._meta.concrete_fields}
+        self.assertEqual(DBHandler.copy_value(fields['payload'], {'a': 'ñ'}), '{"a": "\\u00f1"}')
+        self.assertEqual(DBHandler.copy_value(fields['lineas'], [{'Status': ''}]), "[{'Status': ''}]")
+        self.assertIs(DBHandler.copy_value(fields['enviado_a_sap'], False), False)
+        self.assertIsNone(DBHandler.copy_value(fields['reclamado_en'], None))
+
+    def test_copy_objects_sends_none_as_null(self):
+        """ Como lo leería Postgres: solamente el marcador sin comillas es NULL. """
+        with mock.patch.object(connection, 'cursor') as cursor:
+            self.db.copy_objects(self.csv_to_dict)
+        copy_expert = cursor.return_value.__enter__.return_value.cursor.copy_expert
+        self.assertEqual(len(copy_expert.call_args_list), 3)
+        sql, buffer = copy_expert.call_args_list[0].args
+        self.assertIn("FORMAT csv, NULL '\\N'", sql)
+        columns = re.search(r'\((.*)\) FROM', sql).group(1).replace('"', '').split(', ')
+
+        lines = buffer.getvalue().splitlines()
+        self.assertEqual(len(lines), 2)
+        values = dict(zip(columns, re.findall(r'"(?:[^"]|"")*"|\\N', lines[0])))
+        self.assertEqual(values['reclamado_en'], '\\N')
+        self.assertEqual(values['actualizado'][0], '"')  # auto_now
+        self.assertEqual(values['reclamado_por'], '""')
+        self.assertEqual(values['status'], '""')
+        self.assertEqual(values['valor_documento'], '"1"')
+        self.assertEqual(values['payload'], '"{""U_LF_Formula"": ""1""}"')
+        self.assertEqual(len(values), len(columns))
+
+
+@override_settings(SAP_CLAIM_TIMEOUT=60)
+class TestClaimPayloads(TestCase):
+    def setUp(self):
+        with mock.patch('utils.decorators.DEBUG', False):
+            self.migracion = crea_registro_migracion()
+        for i, (modulo, status, enviado) in enumerate([
+            ('compras', '', False), ('compras', '', False), ('compras', '', False),
+            ('compras', '[SAP] Error', False), ('compras', '', True), ('traslados', '', False),
+        ]):
+            PayloadMigracion.objects.create(
+                migracion_id=self.migracion, modulo=modulo, valor_documento=str(i), nombre_archivo='Archivo-1',
+                status=status, enviado_a_sap=enviado, cantidad_lineas_documento=1, payload={}, lineas='[]'
+            )
+        self.ids = list(PayloadMigracion.objects.order_by('id').values_list('id', flat=True))
+
+    def test_claim_does_not_repeat(self):
+        first = claim_payloads('w1', 2)
+        self.assertEqual(first, self.ids[:2])
+        second = claim_payloads('w2', 5)
+        self.assertEqual(second, self.ids[2:3])  # Solo pendientes sin error del mismo modulo
+        self.assertEqual(claim_payloads('w3', 5), self.ids[5:])
+        self.assertEqual(claim_payloads('w4', 5), [])
+
+    def test_claim_by_modulo(self):
+        self.assertEqual(claim_payloads('w1', 5, ['traslados']), self.ids[5:])
+
+    def test_release_and_stale_claims(self):
+        claimed = claim_payloads('w1', 5)
+        release_payloads('w1', claimed[:1])
+        self.assertEqual(claim_payloads('w2', 5), claimed[:1])
+        PayloadMigracion.objects.filter(id=claimed[1]).update(reclamado_en=datetime.now() - timedelta(hours=2))
+        self.assertEqual(claim_payloads('w3', 5), claimed[1:2])
+
+    def test_stale_claim_taken_by_other_worker_is_kept(self):
+        claimed = claim_payloads('w1', 5)
+        PayloadMigracion.objects.filter(id__in=claimed).update(reclamado_en=datetime.now() - timedelta(hours=2))
+        self.assertEqual(claim_payloads('w2', 5), claimed)
+
+        # w1 termina tarde: no envía ni libera lo que ahora es de w2
+        self.assertEqual(renew_claim('w1', claimed), [])
+        release_payloads('w1', claimed)
+        self.assertEqual(set(PayloadMigracion.objects.filter(id__in=claimed)
+                             .values_list('reclamado_por', flat=True)), {'w2'})
+        self.assertEqual(claim_payloads('w3', 5), self.ids[5:])
+        self.assertEqual(renew_claim('w2', claimed), claimed)
+
+
+class TestArchivePayloads(TestCase):
+    def setUp(self):
+        with mock.patch('utils.decorators.DEBUG', False):
+            self.migracion = crea_registro_migracion()
+        for nombre, enviados in (('Compras-1', (True, True)), ('Compras-2', (True, False)), ('Compras-3', (True,))):
+            for i, enviado in enumerate(enviados):
+                PayloadMigracion.objects.create(
+                    migracion_id=self.migracion, modulo='compras', valor_documento=str(i), nombre_archivo=nombre,
+                    status='', enviado_a_sap=enviado, cantidad_lineas_documento=1, payload={'a': i}, lineas='[]'
+                )
+        old = datetime.now() - timedelta(days=10)
+        PayloadMigracion.objects.exclude(nombre_archivo='Compras-3').update(actualizado=old)
+
+    def test_archivable_files(self):
+        files = list(archivable_files(7))
+        self.assertEqual([(f['modulo'], f['nombre_archivo'], f['documentos']) for f in files],
+                         [('compras', 'Compras-1', 2)])
+
+    def test_archive_files(self):
+        ids = set(PayloadMigracion.objects.filter(nombre_archivo='Compras-1').values_list('id', flat=True))
+        self.assertEqual(archive_files('compras', ['Compras-1']), 2)
+        self.assertFalse(PayloadMigracion.objects.filter(nombre_archivo='Compras-1').exists())
+        archived = PayloadArchivo.objects.filter(nombre_archivo='Compras-1')
+        self.assertEqual(set(archived.values_list('id', flat=True)), ids)
+        self.assertEqual(archived.get(valor_documento='1').payload, {'a': 1})
+        self.assertEqual(archived.first().migracion_id, self.migracion.id)
+        self.assertEqual(PayloadMigracion.objects.count(), 3)
+
+    def test_archived_files_are_not_read_again(self):
+        archive_files('compras', ['Compras-1'])
+        self.assertEqual(archived_files('compras', ['Compras-1', 'Compras-2']), {'Compras-1'})
+        parser = Parser.__new__(Parser)
+        parser.module, parser.tanda = SimpleNamespace(name='compras'), '1RA'
+        parser.input = mock.MagicMock(files=[{'id': 'a', 'name': 'Compras-1.csv'},
+                                             {'id': 'b', 'name': 'Compras-4.csv'}])
+        self.assertEqual(parser.files_to_read(), parser.input.files[1:])
+
+        with mock.patch.object(Parser, 'run_pipeline') as run_pipeline:
+            parser.process_drive_files(mock.MagicMock(), SimpleNamespace(), None, 'ComprasMedicar')
+        parser.input.move_file.assert_called_once_with(parser.input.files[0], 'ComprasMedicar_BackUp')
+        self.assertEqual(run_pipeline.call_args.kwargs['filename'], 'Compras-4')
+
+    def test_purge_archive(self):
+        archive_files('compras', ['Compras-1'])
+        self.assertEqual(purge_archive(1), 0)
+        PayloadArchivo.objects.update(archivado=datetime.now() - timedelta(days=2))
+        self.assertEqual(purge_archive(1), 2)
+
+
+class TestExcludeFromDB(TestCase):
+    def setUp(self):
+        with mock.patch('utils.decorators.DEBUG', False):
+            self.migracion = crea_registro_migracion()
+        for modulo, nombre, valor in (('compras', 'Compras-1', '1'), ('compras', 'Compras-1', '2'),
+                                      ('compras', 'Compras-2', '1'), ('traslados', 'Compras-1', '3')):
+            PayloadMigracion.objects.create(
+                migracion_id=self.migracion, modulo=modulo, valor_documento=valor, nombre_archivo=nombre,
+                status='', cantidad_lineas_documento=1, payload={}, lineas='[]'
+            )
+        self.kwargs = {'filename': 'Compras-1', 'csv_to_dict': Csv2Dict('compras', 'NroDocumento', {}, None)}
+
+    def assert_excluded(self):
+        self.assertEqual(sorted(PayloadMigracion.objects.values_list('modulo', 'nombre_archivo')),
+                         [('compras', 'Compras-2'), ('traslados', 'Compras-1')])
+        # Los payloads del archivo terminado quedan en sap_payloads_archivo
+        self.assertEqual(sorted(PayloadArchivo.objects.values_list('modulo', 'nombre_archivo', 'valor_documento')),
+                         [('compras', 'Compras-1', '1'), ('compras', 'Compras-1', '2')])
+
+    @mock.patch('utils.pipelines.log')
+    def test_run(self, mock_log):
+        self.assertEqual(delete_file_payloads('Compras-3', 'compras'), 0)
+        ExcludeFromDB().run(**self.kwargs)
+        self.assert_excluded()
+        mock_log.info.assert_called_once_with("2 Registros excluidos de db referentes a archivo 'Compras-1'")
+
+    @override_settings(DB_DELETE_ASYNC=True)
+    @mock.patch('utils.pipelines.log')
+    def test_run_in_background(self, mock_log):
+        parser = mock.MagicMock()
+        ExcludeFromDB().run(parser=parser, **self.kwargs)
+        func, *args = parser.in_background.call_args.args
+        self.assertEqual(args, ['Compras-1', 'compras'])
+        func(*args)
+        self.assert_excluded()
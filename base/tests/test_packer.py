@@ -0,0 +1,63 @@
+import gzip
+import os
+import tempfile
+from pathlib import Path
+from unittest import TestCase, mock
+
+from utils.packer import AttachmentPacker
+
+
+@mock.patch('utils.packer.log')
+class TestAttachmentPacker(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.dir = Path(self.tmp.name)
+
+    def write(self, name, content: bytes) -> str:
+        path = self.dir / name
+        path.write_bytes(content)
+        return str(path)
+
+    def test_compress_and_group(self, mock_log):
+        csv = self.write('dispensacion_processed_all.csv', b'NroSSC;Plu;Status\n' * 5000)
+        snapshot = self.write('Dispensacion-1.snapshot.zip', b'PK' + b'x' * 100)
+        groups = AttachmentPacker([csv, snapshot], 10_000).pack()
+        self.assertEqual(groups, [[csv + '.gz', snapshot]])
+        self.assertEqual(gzip.decompress(Path(csv + '.gz').read_bytes()), Path(csv).read_bytes())
+
+    def test_unchanged_file_is_not_compressed_again(self, mock_log):
+        csv = self.write('compras_only_errors.csv', b'NroDocumento;Status\n' * 100)
+        AttachmentPacker([csv], 10_000).pack()
+        os.utime(csv + '.gz', (0, 0))
+        AttachmentPacker([csv], 10_000).pack()
+        self.assertEqual(Path(csv + '.gz').stat().st_mtime, 0)
+        self.write('compras_only_errors.csv', b'NroDocumento;Status\n' * 101)
+        AttachmentPacker([csv], 10_000).pack()
+        self.assertNotEqual(Path(csv + '.gz').stat().st_mtime, 0)
+        self.assertEqual(gzip.decompress(Path(csv + '.gz').read_bytes()), Path(csv).read_bytes())
+
+    def test_split_in_parts_and_emails(self, mock_log):
+        header = b'NroSSC;Plu;Status\n'
+        rows = [f'{i};{os.urandom(20).hex()};"linea\ncon salto"\n'.encode() for i in range(600)]  # Casi no se comprime
+        csv = self.write('dispensacion_processed_all.csv', header + b''.join(rows))
+        small = self.write('dispensacion_only_errors.csv', b'a;b\n')
+        groups = AttachmentPacker([csv, small, self.dir / 'no_existe.csv'], 10_000).pack()
+
+        parts = [f for group in groups for f in group if '.part' in f]
+        self.assertGreater(len(parts), 1)
+        self.assertEqual(parts, [str(self.dir / f'dispensacion_processed_all.part{i}.csv.gz')
+                                 for i in range(1, len(parts) + 1)])
+        self.assertEqual(groups[-1][-1], small + '.gz')
+        self.assertTrue(all(Path(f).stat().st_size <= 10_000 for group in groups for f in group))
+        # Cada parte es un .gz que se abre solo, con el encabezado y filas completas
+        received = []
+        for part in parts:
+            content = gzip.decompress(Path(part).read_bytes())
+            self.assertTrue(content.startswith(header))
+            received.append(content[len(header):])
+        self.assertEqual(b''.join(received), b''.join(rows))
+
+    def test_big_file_that_is_not_csv_is_left_out(self, mock_log):
+        snapshot = self.write('Dispensacion-1.snapshot.zip', os.urandom(25_000))
+        self.assertEqual(AttachmentPacker([snapshot], 10_000).pack(), [])
@@ -0,0 +1,158 @@
+import threading
+import time
+from datetime import datetime
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from base.models import PayloadMigracion, RegistroMigracion
+from utils.converters import Csv2Dict
+from utils.pipelines import Export, Mail, PreProcessSAP, ProcessSAP
+
+RECORDS = {
+    # valor_documento: (enviado_a_sap, status)
+    '1': (True, '[SAP] Cantidad insuficiente'),
+    '2': (True, 'DocEntry: 752066'),
+    '3': (True, '[CONNECTION] No fue posible conectar'),
+    '4': (True, '[timeout] Tiempo agotado'),
+    '5': (False, '[CSV] Plu no reconocido'),
+}
+
+
+class TestResendWithErrors(TestCase):
+    def setUp(self):
+        migracion = RegistroMigracion.objects.create(estado='en ejecucion')
+        for key, (enviado, status) in RECORDS.items():
+            PayloadMigracion.objects.create(
+                migracion_id=migracion, modulo='compras', valor_documento=key, nombre_archivo='Compras-1',
+                enviado_a_sap=enviado, status=status, cantidad_lineas_documento=2, payload={'DocNum': key},
+                lineas=str([{'NroDocumento': key, 'Status': status}] * 2)
+            )
+        PayloadMigracion.objects.create(
+            migracion_id=migracion, modulo='compras', valor_documento='1', nombre_archivo='Compras-2',
+            enviado_a_sap=True, status='[SAP] Otro archivo', cantidad_lineas_documento=1, payload={}, lineas='[]'
+        )
+        self.csv_to_dict = Csv2Dict('compras', 'NroDocumento', {}, None)
+        self.sap = mock.MagicMock()
+        self.sent = []
+
+    def fake_process(self, csv_to_dict, registros):
+        """ Simula SAPConnect.process: el documento 1 queda con DocEntry y el 3 sigue con error """
+        self.sent.append(set(csv_to_dict.succss))
+        for key, msg in (('1', 'DocEntry: 1'), ('3', '[CONNECTION] No fue posible conectar'), ('4', 'DocEntry: 4')):
+            csv_to_dict.doc_status(key).replace(msg)
+            registros.filter(valor_documento=key).update(status=msg, actualizado=datetime.now())
+
+    def test_only_errors_are_resent(self):
+        self.sap.process.side_effect = self.fake_process
+        ProcessSAP().resend_with_errors(self.csv_to_dict, self.sap, 'Compras-1')
+        self.assertEqual(self.sent, [{'1', '3', '4'}])
+        self.assertEqual(set(self.csv_to_dict.data), set(RECORDS))
+        self.assertEqual(self.csv_to_dict.succss, {'1', '2', '4'})
+        self.assertEqual(self.csv_to_dict.errs, {'3', '5'})
+        self.assertEqual(self.csv_to_dict.csv_lines, 10)
+        self.assertEqual(str(self.csv_to_dict.data['1']['csv'][1]['Status']), 'DocEntry: 1')
+
+    def test_constant_number_of_queries(self):
+        # Una consulta para cargar el archivo y otra para recargar los reenviados
+        with self.assertNumQueries(2):
+            ProcessSAP().resend_with_errors(self.csv_to_dict, self.sap, 'Compras-1')
+
+    def test_nothing_to_resend(self):
+        PayloadMigracion.objects.filter(status__contains='[').update(status='DocEntry: 1')
+        with self.assertNumQueries(1):
+            ProcessSAP().resend_with_errors(self.csv_to_dict, self.sap, 'Compras-1')
+        self.sap.process.assert_not_called()
+        self.assertEqual(len(self.csv_to_dict.succss), 5)
+
+
+class TestPreProcessSAP(TestCase):
+    LINES = [{'ItemCode': '7705959015152', 'Quantity': 2}]
+
+    def setUp(self):
+        migracion = RegistroMigracion.objects.create(estado='en ejecucion')
+        for key, status in (('1', PreProcessSAP.OFFSET), ('2', PreProcessSAP.EXCEED.upper()),
+                            ('3', '[SAP] Otro error'), ('4', f'{PreProcessSAP.INVALID_DL} | {PreProcessSAP.OFFSET}')):
+            PayloadMigracion.objects.create(
+                migracion_id=migracion, modulo='notas_credito', valor_documento=key, nombre_archivo='Notas-1',
+                enviado_a_sap=True, status=status, cantidad_lineas_documento=1,
+                payload={'DocumentLines': self.LINES}, lineas='[]'
+            )
+        self.preprocess = PreProcessSAP()
+        self.preprocess.client = mock.MagicMock()
+        self.preprocess.client.get_info_ssc.return_value = self.LINES
+
+    @mock.patch('utils.pipelines.login_check')
+    @mock.patch('utils.pipelines.log')
+    @mock.patch('utils.pipelines.build_new_documentlines')
+    def test_one_query_and_one_bulk_update(self, build_new_documentlines, mock_log, mock_login):
+        build_new_documentlines.side_effect = lambda data_sap, lines: [{**lines[0], 'BaseLine': 0}]
+        with self.assertNumQueries(2):
+            self.preprocess.exec_strategies(PayloadMigracion.objects.all(), 'notas_credito')
+        # Cada registro es alterado una sola vez, con la estrategia de su primer error
+        self.assertEqual(build_new_documentlines.call_count, 3)
+        self.assertEqual(sorted(c.args[0] for c in self.preprocess.client.get_info_ssc.call_args_list),
+                         ['1', '2', '4'])
+        changed = PayloadMigracion.objects.filter(payload__DocumentLines__0__BaseLine=0)
+        self.assertEqual(sorted(changed.values_list('valor_documento', flat=True)), ['1', '2', '4'])
+        mock_log.info.assert_any_call(f"*** 2 payloads con error {PreProcessSAP.OFFSET[6:]!r} en 'notas_credito' ***")
+
+    def test_module_without_strategies(self):
+        with self.assertNumQueries(0):
+            self.preprocess.exec_strategies(PayloadMigracion.objects.all(), 'compras')
+
+    @override_settings(SAP_MAX_CONCURRENCY=3)
+    @mock.patch('utils.pipelines.login_check')
+    def test_fetch_from_sap_concurrently(self, mock_login):
+        lock, running, peak = threading.Lock(), [0], [0]
+
+        def get_info_ssc(ssc):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.02)
+            with lock:
+                running[0] -= 1
+            return [{'ssc': ssc}]
+
+        keys = [str(i) for i in range(10)] + ['1']
+        data = self.preprocess.fetch_from_sap(get_info_ssc, keys)
+        self.assertEqual(list(data), [str(i) for i in range(10)])
+        self.assertEqual(data['7'], [{'ssc': '7'}])
+        self.assertEqual(peak[0], 3)
+        mock_login.assert_called_once_with(self.preprocess.client)
+
+    @override_settings(SAP_MAX_CONCURRENCY=1)
+    @mock.patch('utils.pipelines.login_check')
+    def test_fetch_from_sap_serially(self, mock_login):
+        self.assertEqual(self.preprocess.fetch_from_sap(str.upper, ['a', 'b']), {'a': 'A', 'b': 'B'})
+        mock_login.assert_not_called()
+
+
+class TestExportedFiles(TestCase):
+    """ Las rutas exportadas son de cada archivo, no de la clase Export, ver MODULES_PARALLELISM. """
+
+    @staticmethod
+    def kwargs(module_name):
+        parser = mock.MagicMock(output_filepath=f'/tmp/{module_name}', pipeline=(Export, Mail))
+        parser.module.name = module_name
+        return {'csv_to_dict': mock.MagicMock(), 'parser': parser, 'filename': f'{module_name}-1',
+                'file': {'name': f'{module_name}-1.csv'},
+                'exported': {}}
+
+    @mock.patch('utils.pipelines.EmailModule')
+    @mock.patch('utils.pipelines.File')
+    def test_each_module_mails_its_own_files(self, file, email):
+        file.return_value.make_csvs.side_effect = lambda processed, errors: {'processed': processed,
+                                                                            'errors': errors}
+        file.return_value.make_snapshot.side_effect = lambda filename: filename
+        compras, dispensacion = self.kwargs('compras'), self.kwargs('dispensacion')
+        Export.local_export(compras)
+        Export.local_export(dispensacion)
+
+        Mail.run(**compras)
+        self.assertEqual(email.call_args.args[2], ['/tmp/compras_processed_all.csv',
+                                                   '/tmp/compras_only_errors.csv'])
+        self.assertEqual(compras['exported']['snapshot'], 'compras-1.snapshot.zip')
+        Mail.run(**dispensacion)
+        self.assertEqual(email.call_args.args[2][0], '/tmp/dispensacion_processed_all.csv')
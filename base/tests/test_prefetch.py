@@ -0,0 +1,82 @@
+import io
+import threading
+from unittest import TestCase, mock
+
+from utils.gdrive.prefetch import Prefetcher
+from utils.rows import CsvRowReader
+
+
+class FakeDrive:
+    """ GDriveHandler cuya descarga de cada archivo espera a ser liberada por el test. """
+
+    def __init__(self):
+        self.started = []
+        self.release = {}
+        self.threads = set()
+
+    def read_csv_file_by_id(self, file_id, version=''):
+        self.started.append(file_id)
+        self.threads.add(threading.current_thread().name)
+        if not self.release.setdefault(file_id, threading.Event()).wait(5):
+            raise TimeoutError(file_id)
+        if file_id == 'roto':
+            raise ConnectionError('reset')
+        return CsvRowReader(io.StringIO(f"Plu;Archivo\n1;{file_id}\n"), delimiter=';')
+
+    def wait_started(self, n):
+        for _ in range(500):
+            if len(self.started) >= n:
+                return
+            threading.Event().wait(0.01)
+
+
+def files(*ids, size=10):
+    return [{'id': file_id, 'name': f'{file_id}.csv', 'size': str(size)} for file_id in ids]
+
+
+@mock.patch('utils.gdrive.prefetch.log')
+class TestPrefetcher(TestCase):
+    def setUp(self):
+        self.drive = FakeDrive()
+
+    def release(self, *ids):
+        for file_id in ids:
+            self.drive.release.setdefault(file_id, threading.Event()).set()
+
+    def test_files_are_delivered_in_order(self, log):
+        self.release('a', 'b', 'c', 'd')
+        with Prefetcher('compras', files('a', 'b', 'c', 'd'), 2, 1000, lambda: self.drive) as prefetcher:
+            for file in files('a', 'b', 'c', 'd'):
+                reader = prefetcher.get(file)
+                self.assertEqual(next(iter(reader))['Archivo'], file['id'])
+        self.assertEqual(self.drive.started, ['a', 'b', 'c', 'd'])
+        self.assertEqual(len(self.drive.threads), 1)
+        self.assertTrue(self.drive.threads.pop().startswith('compras-prefetch'))
+
+    def test_only_n_files_ahead(self, log):
+        prefetcher = Prefetcher('compras', files('a', 'b', 'c', 'd'), 2, 1000, lambda: self.drive)
+        self.release('a', 'b')
+        self.drive.wait_started(2)
+        self.assertEqual(list(prefetcher.futures), ['a', 'b'])
+        prefetcher.get(files('a')[0])
+        self.assertEqual(list(prefetcher.futures), ['b', 'c'])
+        self.release('c', 'd')
+        prefetcher.close()
+
+    def test_memory_budget(self, log):
+        self.release('a', 'b', 'c')
+        prefetcher = Prefetcher('compras', files('a', 'b', 'c', size=60), 3, 100, lambda: self.drive)
+        # Al menos un archivo es adelantado aunque pase del límite
+        self.assertEqual(list(prefetcher.futures), ['a'])
+        prefetcher.get(files('a')[0])
+        self.assertEqual(list(prefetcher.futures), ['b'])
+        self.assertEqual(prefetcher.buffered, 60)
+        prefetcher.close()
+
+    def test_failed_download_is_left_to_the_caller(self, log):
+        self.release('roto', 'b')
+        with Prefetcher('compras', files('roto', 'b'), 2, 1000, lambda: self.drive) as prefetcher:
+            self.assertIsNone(prefetcher.get(files('roto')[0]))
+            self.assertIsNotNone(prefetcher.get(files('b')[0]))
+            self.assertIsNone(prefetcher.get(files('otro')[0]))
+        log.warning.assert_called_once()
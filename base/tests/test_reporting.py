@@ -0,0 +1,100 @@
+import threading
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import TestCase, mock
+
+from utils.converters import Csv2Dict
+from utils.reporting import Reporter
+from utils.rows import DocStatus
+
+
+class Step:
+    calls = []
+    failures = {}  # {nombre del paso: cantidad de veces que falla}
+
+    def __str__(self):
+        return type(self).__name__
+
+    def run(self, **kwargs):
+        name = type(self).__name__
+        if self.failures.get(name):
+            self.failures[name] -= 1
+            raise ConnectionError(f'{name} falló')
+        self.calls.append((name, kwargs['csv_to_dict'], dict(kwargs['csv_to_dict'].data)))
+
+
+class Export(Step):
+    ...
+
+
+class Mail(Step):
+    ...
+
+
+class ExcludeFromDB(Step):
+    ...
+
+
+@mock.patch('utils.reporting.connections', mock.MagicMock())
+@mock.patch('utils.reporting.time.sleep')
+@mock.patch('utils.reporting.send_mail_due_to_general_error_in_file')
+@mock.patch('utils.reporting.settings', REPORT_RETRIES=3, REPORT_RETRY_INTERVAL=30)
+class TestReporter(TestCase):
+    def setUp(self):
+        Step.calls, Step.failures = [], {}
+        self.csv_to_dict = Csv2Dict(name='dispensacion', pk='NroSSC', series={}, sap=None)
+        for key, status in (('1', '[CSV] Plu no reconocido'), ('2', 'DocEntry: 752066')):
+            self.csv_to_dict.data[key] = {'json': {}, 'csv': [{'NroSSC': key, 'Status': ''}]}
+            self.csv_to_dict.link_status(key, DocStatus(status))
+        self.parser = mock.MagicMock(module=SimpleNamespace(name='dispensacion', filepath=None),
+                                     input=Path('dispensacion.csv'), output_filepath=Path('dispensacion'),
+                                     pipeline=(Export, Mail, ExcludeFromDB))
+        self.reporter = Reporter()
+
+    def submit(self, filename='dispensacion-1'):
+        self.reporter.submit(self.parser, self.parser.pipeline, self.csv_to_dict, {'filename': filename})
+
+    def test_report_after_clear_data(self, settings, send_mail, sleep):
+        self.submit()
+        self.csv_to_dict.clear_data()
+        self.assertEqual(self.reporter.wait(), 0)
+        self.assertEqual([name for name, *_ in Step.calls], ['Export', 'Mail', 'ExcludeFromDB'])
+        for name, detached, data in Step.calls:
+            self.assertIsNot(detached, self.csv_to_dict)
+            self.assertEqual(set(data), {'1', '2'})
+        detached = Step.calls[0][1]
+        detached.group_by_type_of_errors()
+        self.assertEqual(detached.csv_errs, {'[CSV] Plu no reconocido': {'1'}})
+        self.assertEqual(detached.result_succss, {'DocEntry: 752066': {'2'}})
+        self.assertFalse(self.csv_to_dict.data)
+
+    def test_step_is_retried(self, settings, send_mail, sleep):
+        Step.failures = {'Mail': 2}
+        self.submit()
+        self.assertEqual(self.reporter.wait(), 0)
+        self.assertEqual([name for name, *_ in Step.calls], ['Export', 'Mail', 'ExcludeFromDB'])
+        self.assertIn(mock.call(30), sleep.mock_calls)
+        self.assertIn(mock.call(60), sleep.mock_calls)
+        send_mail.assert_not_called()
+
+    def test_failed_report_stops_its_steps_only(self, settings, send_mail, sleep):
+        Step.failures = {'Mail': 3}
+        self.submit('dispensacion-1')
+        self.submit('dispensacion-2')
+        self.assertEqual(self.reporter.wait(), 1)
+        self.assertEqual([name for name, *_ in Step.calls], ['Export', 'Export', 'Mail', 'ExcludeFromDB'])
+        self.assertEqual(send_mail.call_args.args[0], 'dispensacion-1.csv')
+        self.assertEqual(send_mail.call_args.args[3], 2)
+        self.parser.strategy_post_error.assert_called_once_with('Mail')
+
+    def test_cancel_discards_reports_not_started(self, settings, send_mail, sleep):
+        release = threading.Event()
+        with mock.patch.object(Export, 'run', side_effect=lambda **kwargs: release.wait(5)):
+            self.submit('dispensacion-1')
+            self.submit('dispensacion-2')
+            executor = self.reporter.executor
+            self.reporter.cancel()
+            release.set()
+            executor.shutdown(wait=True)
+        self.assertEqual(self.reporter.wait(), 0)
+        self.assertEqual([name for name, *_ in Step.calls], ['Mail', 'ExcludeFromDB'])
@@ -1,8 +1,11 @@
+import copy
+import random
 import unittest
 from unittest.mock import Mock
 
 from utils.converters import Csv2Dict
-from utils.resources import build_new_documentlines
+from utils.pipelines import PreProcessSAP
+from utils.resources import build_new_documentlines, item_prices, item_quantities, mix_documentlines
 
 
 class TestGetCentroDeCosto(unittest.TestCase):
@@ -247,4 +250,83 @@ class TestTraslados(unittest.TestCase):
 
         result = build_new_documentlines(data_sap, document_lines)
 
-        self.assertTrue(result == expected)
\ No newline at end of file
+        self.assertTrue(result == expected)
+
+
+def linear_price(document_lines, item_code):
+    """ Búsqueda de precio como era hecha antes de item_prices. """
+    return [j['Price'] for j in document_lines if j['ItemCode'] == item_code][0]
+
+
+def linear_quantities(lines):
+    """ Suma de cantidades como era hecha antes de item_quantities. """
+    totals = dict()
+    for i in lines:
+        if i['ItemCode'] not in totals:
+            totals[i['ItemCode']] = 0
+        totals[i['ItemCode']] += i['Quantity']
+    return totals
+
+
+class TestIndexedDocumentLines(unittest.TestCase):
+    """ Con documentos aleatorios, el resultado debe ser igual al de recorrer las lineas. """
+    RUNS = 200
+
+    def random_document(self, rng):
+        items = [str(7700000000000 + rng.randrange(10 ** 6)) for _ in range(rng.randint(1, 8))]
+        document_lines = [
+            {'ItemCode': rng.choice(items), 'Price': rng.choice([0, 1.5, rng.randint(1, 90000)]),
+             'Quantity': rng.randint(0, 20), 'BaseType': rng.choice([13, 15]), 'CostingCode': 'SUC',
+             'CostingCode2': '200', 'CostingCode3': 'EVNOPBSS', 'WarehouseCode': '200'}
+            for _ in range(rng.randint(1, 30))
+        ]
+        present = sorted({line['ItemCode'] for line in document_lines})
+        data_sap = [
+            {'ItemCode': rng.choice(present), 'LineNum': rng.randint(0, 10), 'DocEntry': rng.randint(1, 99999),
+             'Quantity': rng.randint(1, 20), 'StockPrice': rng.random() * 1000, 'BatchNum': f'L{n}',
+             'id__': n, 'U_LF_Formula': '123', 'Dscription': 'x'}
+            for n in range(rng.randint(1, 30))
+        ]
+        return data_sap, document_lines
+
+    def test_item_prices(self):
+        rng = random.Random(39)
+        for run in range(self.RUNS):
+            _, document_lines = self.random_document(rng)
+            prices = item_prices(document_lines)
+            with self.subTest(run=run):
+                self.assertEqual(prices, {item: linear_price(document_lines, item) for item in prices})
+                self.assertEqual(set(prices), {line['ItemCode'] for line in document_lines})
+
+    def test_item_quantities(self):
+        rng = random.Random(40)
+        for run in range(self.RUNS):
+            data_sap, document_lines = self.random_document(rng)
+            with self.subTest(run=run):
+                self.assertEqual(item_quantities(document_lines), linear_quantities(document_lines))
+                self.assertEqual(PreProcessSAP().verify_quantities(data_sap, document_lines),
+                                 linear_quantities(data_sap) == linear_quantities(document_lines))
+
+    def test_mix_documentlines(self):
+        rng = random.Random(41)
+        for run in range(self.RUNS):
+            data_sap, document_lines = self.random_document(rng)
+            result = mix_documentlines(copy.deepcopy(data_sap), document_lines)
+            with self.subTest(run=run):
+                self.assertEqual([line['Price'] for line in result],
+                                 [linear_price(document_lines, line['ItemCode']) for line in data_sap])
+                self.assertEqual([line['BaseLine'] for line in result], [line['LineNum'] for line in data_sap])
+
+    def test_build_new_documentlines(self):
+        rng = random.Random(42)
+        for run in range(self.RUNS):
+            data_sap, document_lines = self.random_document(rng)
+            result = build_new_documentlines(data_sap, document_lines)
+            first_by_line = {}
+            for line in data_sap:
+                first_by_line.setdefault(line['LineNum'], line)
+            with self.subTest(run=run):
+                self.assertEqual([line['BaseLine'] for line in result], list(first_by_line))
+                self.assertEqual([line['Price'] for line in result],
+                                 [linear_price(document_lines, line['ItemCode']) for line in first_by_line.values()])
+                self.assertEqual(sum(line['Quantity'] for line in result), sum(line['Quantity'] for line in data_sap))
@@ -0,0 +1,129 @@
+import csv
+import io
+import json
+import pickle
+from unittest import TestCase
+
+from utils.rows import CsvRow, CsvRowReader, DocStatus, RowSchema, rows_as_dicts, to_builtin
+
+CONTENT = ("NroSSC;Plu;Lote;CantidadDispensada\n"
+           "118;7705959015152;D00351A;30.0\n"
+           "\n"
+           "118;7703153035044;1466035\n"
+           "119;7705959880361;DXL0500;2.0\n")
+
+
+class TestCsvRow(TestCase):
+
+    def read(self, reader_cls):
+        rows = []
+        for row in reader_cls(io.StringIO(CONTENT), delimiter=';'):
+            row['Status'] = ''
+            rows.append(row)
+        return rows
+
+    def test_same_content_as_dictreader(self):
+        """ Las líneas leídas deben ser iguales a las de csv.DictReader """
+        expected = self.read(csv.DictReader)
+        result = self.read(CsvRowReader)
+        self.assertEqual(len(result), len(expected))
+        for row, exp in zip(result, expected):
+            with self.subTest(row=exp):
+                self.assertEqual(row, exp)
+                self.assertEqual(list(row.keys()), list(exp.keys()))
+
+    def test_longer_rows_keep_extra_values(self):
+        """ Igual que csv.DictReader, los valores sobrantes quedan bajo la llave None """
+        content = 'NroSSC;Plu\n118;7705959015152;L1;2\n119;7702605104505\n'
+        expected = list(csv.DictReader(io.StringIO(content), delimiter=';'))
+        rows = list(CsvRowReader(io.StringIO(content), delimiter=';'))
+        self.assertEqual(rows[0][None], ['L1', '2'])
+        self.assertEqual([dict(r) for r in rows], [{**r, 'Status': ''} for r in expected])
+        self.assertNotIn(None, rows[1])
+
+    def test_unique_columns_are_not_interned(self):
+        rows = ''.join(f'{i};2023-07-05\n' for i in range(3 * 1024))
+        reader = CsvRowReader(io.StringIO('NroSSC;Fecha\n' + rows), delimiter=';')
+        reader.INTERN_MAX_DISTINCT = 100
+        rows = list(reader)
+        self.assertIsNone(reader._values[0])
+        self.assertEqual(list(reader._values[1]), ['2023-07-05'])
+        self.assertTrue(all(r['Fecha'] is rows[0]['Fecha'] for r in rows))
+        self.assertEqual(rows[-1]['NroSSC'], str(3 * 1024 - 1))
+
+    def test_fieldnames(self):
+        reader = CsvRowReader(io.StringIO(CONTENT), delimiter=';')
+        self.assertEqual(reader.fieldnames, ['NroSSC', 'Plu', 'Lote', 'CantidadDispensada'])
+
+    def test_schema_is_shared(self):
+        rows = self.read(CsvRowReader)
+        self.assertTrue(all(r.schema is rows[0].schema for r in rows))
+
+    def test_status_and_get(self):
+        row = self.read(CsvRowReader)[0]
+        row['Status'] = '[CSV] Plu no reconocido'
+        self.assertEqual(row['Status'], '[CSV] Plu no reconocido')
+        self.assertEqual(row.get('SubPlan', ''), '')
+        self.assertNotIn('SubPlan', row)
+        with self.assertRaises(KeyError):
+            row['SubPlan']
+
+    def test_from_dict_and_as_dict(self):
+        line = {'NroSSC': '118', 'Plu': '7705959015152', 'Status': 'DocEntry: 10'}
+        row = CsvRow.from_dict(line)
+        self.assertEqual(row.as_dict(), line)
+        self.assertIs(row.schema, RowSchema.for_fields(('NroSSC', 'Plu')))
+        self.assertEqual(eval(str(rows_as_dicts([row]))), [line])
+
+    def test_pickle(self):
+        rows = self.read(CsvRowReader)
+        loaded = pickle.loads(pickle.dumps(rows))
+        self.assertEqual(loaded, rows)
+        self.assertIs(loaded[0].schema, loaded[1].schema)
+
+    def test_csv_writer_output(self):
+        """ El csv exportado con CsvRow debe ser el mismo que con dicts """
+        outputs = []
+        for rows in (self.read(csv.DictReader), self.read(CsvRowReader)):
+            out = io.StringIO()
+            writer = csv.DictWriter(out, fieldnames=list(rows[0].keys()), delimiter=';', extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(rows)
+            outputs.append(out.getvalue())
+        self.assertEqual(outputs[0], outputs[1])
+
+
+class TestDocStatus(TestCase):
+
+    def test_same_text_as_concatenation(self):
+        status = DocStatus()
+        self.assertFalse(status)
+        self.assertEqual(status, '')
+        status.add('[CSV] Plu no reconocido 7705959015152')
+        status.add('[CSV] Lote vencido')
+        status.add('Plu no reconocido')  # Ya contenido en un mensaje anterior
+        self.assertEqual(str(status), '[CSV] Plu no reconocido 7705959015152 | [CSV] Lote vencido')
+        self.assertIn('Lote vencido', status)
+        self.assertEqual(status.category, 'CSV')
+
+    def test_replace(self):
+        status = DocStatus('[CSV] Lote vencido')
+        status.replace('DocEntry: 752066')
+        self.assertEqual(status, 'DocEntry: 752066')
+        self.assertEqual(status.category, 'DocEntry')
+
+    def test_rows_render_as_text(self):
+        status = DocStatus('[SAP] Cantidad insuficiente')
+        row = CsvRow.from_dict({'NroSSC': '118', 'Status': ''})
+        row['Status'] = status
+        line = {'NroSSC': '118', 'Status': status}
+        self.assertEqual(row.as_dict(), {'NroSSC': '118', 'Status': '[SAP] Cantidad insuficiente'})
+        self.assertEqual(eval(str(rows_as_dicts([row, line]))), [row.as_dict(), row.as_dict()])
+        self.assertEqual(json.loads(json.dumps([row, line], default=to_builtin)), [row.as_dict(), row.as_dict()])
+
+    def test_pickle_keeps_shared_status(self):
+        status = DocStatus('[CSV] Lote vencido')
+        rows = [{'Status': status}, {'Status': status}]
+        loaded = pickle.loads(pickle.dumps(rows))
+        self.assertIs(loaded[0]['Status'], loaded[1]['Status'])
+        self.assertEqual(loaded[0]['Status'], '[CSV] Lote vencido')
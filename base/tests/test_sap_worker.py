@@ -0,0 +1,46 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from base.models import PayloadMigracion
+from utils.interactor_db import claim_payloads, crea_registro_migracion
+from utils.sap.worker import SAPWorker
+
+
+@mock.patch('utils.sap.worker.SAPConnect', mock.MagicMock())
+@mock.patch('utils.sap.worker.Module', mock.MagicMock())
+class TestSAPWorker(TestCase):
+    def setUp(self):
+        with mock.patch('utils.decorators.DEBUG', False):
+            self.migracion = crea_registro_migracion()
+        for i in range(3):
+            PayloadMigracion.objects.create(
+                migracion_id=self.migracion, modulo='compras', valor_documento=str(i), nombre_archivo='Archivo-1',
+                cantidad_lineas_documento=1, payload={}, lineas='[]'
+            )
+        self.worker = SAPWorker('w1', batch=2, poll=5)
+
+    @mock.patch('utils.sap.worker.time.sleep')
+    @mock.patch('utils.sap.worker.login_check', return_value=False)
+    def test_once_stops_when_sap_is_down(self, login_check, sleep):
+        self.assertEqual(self.worker.run(once=True), 2)
+        login_check.assert_called_once()
+        sleep.assert_not_called()
+        self.assertFalse(PayloadMigracion.objects.exclude(reclamado_por='').exists())
+
+    @mock.patch('utils.sap.worker.time.sleep', side_effect=[None, KeyboardInterrupt])
+    @mock.patch('utils.sap.worker.login_check', return_value=False)
+    def test_waits_poll_after_failed_login(self, login_check, sleep):
+        with self.assertRaises(KeyboardInterrupt):
+            self.worker.run()
+        self.assertEqual(login_check.call_count, 2)
+        sleep.assert_called_with(5)
+
+    def test_posts_only_owned_payloads(self):
+        ids = claim_payloads('w1', 2)
+        PayloadMigracion.objects.filter(id=ids[0]).update(reclamado_por='w2')  # Reclamo vencido tomado por w2
+        with mock.patch.object(SAPWorker, 'post_file', return_value=1) as post_file:
+            self.assertEqual(self.worker.post(ids), 1)
+        registros, first = post_file.call_args.args
+        self.assertEqual([r.id for r in registros], ids[1:])
+        self.assertEqual(PayloadMigracion.objects.get(id=ids[0]).reclamado_por, 'w2')
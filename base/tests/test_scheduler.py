@@ -0,0 +1,129 @@
+import logging
+import threading
+import time
+from graphlib import CycleError
+from types import SimpleNamespace
+from unittest import TestCase, mock
+
+from core.settings import LogContextFilter, formatter, logger as log
+from utils.parsers import Parser
+from utils.scheduler import ModuleScheduler
+
+MODULES = ('compras', 'traslados', 'ajustes_vencimiento_lote', 'dispensacion',
+           'facturacion', 'notas_credito', 'pagos_recibidos')
+DEPENDENCIES = {
+    'traslados': ('compras',),
+    'dispensacion': ('compras', 'traslados'),
+    'facturacion': ('dispensacion',),
+    'notas_credito': ('facturacion',),
+}
+
+
+class TestModuleScheduler(TestCase):
+    def setUp(self):
+        self.lock = threading.Lock()
+        self.events = []
+        self.running = 0
+        self.max_running = 0
+
+    def run_module(self, module):
+        with self.lock:
+            self.events.append(('start', module))
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(0.02)
+        with self.lock:
+            self.running -= 1
+            self.events.append(('end', module))
+
+    def test_serial_keeps_order(self):
+        times = ModuleScheduler(MODULES, self.run_module, 1, DEPENDENCIES).run()
+        started = [module for event, module in self.events if event == 'start']
+        self.assertEqual(started, list(MODULES))
+        self.assertEqual(set(times), set(MODULES))
+        self.assertEqual(self.max_running, 1)
+
+    def test_dependencies_are_respected(self):
+        ModuleScheduler(MODULES, self.run_module, 3, DEPENDENCIES).run()
+        self.assertLessEqual(self.max_running, 3)
+        self.assertGreater(self.max_running, 1)
+        for module, deps in DEPENDENCIES.items():
+            for dep in deps:
+                with self.subTest(module=module, dep=dep):
+                    self.assertLess(self.events.index(('end', dep)), self.events.index(('start', module)))
+
+    def test_dependencies_outside_the_run_are_ignored(self):
+        times = ModuleScheduler(['facturacion', 'notas_credito'], self.run_module, 2, DEPENDENCIES).run()
+        self.assertEqual(list(times), ['facturacion', 'notas_credito'])
+
+    @mock.patch('utils.scheduler.log')
+    def test_error_stops_new_modules(self, mock_log):
+        def run_module(module):
+            self.run_module(module)
+            if module == 'compras':
+                raise ValueError('fallo')
+
+        with self.assertRaises(ValueError):
+            ModuleScheduler(MODULES, run_module, 2, DEPENDENCIES).run()
+        started = {module for event, module in self.events if event == 'start'}
+        self.assertNotIn('dispensacion', started)
+        self.assertNotIn('pagos_recibidos', started)
+
+    def test_cycle(self):
+        with self.assertRaises(CycleError):
+            ModuleScheduler(['a', 'b'], self.run_module, 2, {'a': ('b',), 'b': ('a',)}).run()
+
+    def test_serial_runs_in_the_calling_thread(self):
+        threads = set()
+        ModuleScheduler(MODULES, lambda module: threads.add(threading.current_thread()), 1, DEPENDENCIES).run()
+        self.assertEqual(threads, {threading.current_thread()})
+
+    @mock.patch('utils.scheduler.log')
+    def test_signal_stops_without_waiting_running_modules(self, mock_log):
+        release = threading.Event()
+
+        def run_module(module):
+            with self.lock:
+                self.events.append(('start', module))
+            release.wait(5)
+
+        def sigterm(*args, **kwargs):
+            # handle_sigterm ejecutado en el hilo principal mientras espera a los modulos
+            raise SystemExit(1)
+
+        start = time.perf_counter()
+        with mock.patch('utils.scheduler.wait', side_effect=sigterm), self.assertRaises(SystemExit):
+            ModuleScheduler(MODULES, run_module, 2, DEPENDENCIES).run()
+        self.assertLess(time.perf_counter() - start, 1)
+        release.set()
+        time.sleep(0.05)
+        self.assertEqual({module for _, module in self.events}, {'compras', 'ajustes_vencimiento_lote'})
+
+
+class TestLogContext(TestCase):
+    """ El archivo que aparece en el log es el del modulo del hilo, ver LogContextFilter. """
+
+    def test_each_module_logs_its_own_file(self):
+        lines = []
+        handler = logging.Handler()
+        handler.setFormatter(formatter)
+        handler.addFilter(LogContextFilter())
+        handler.emit = lambda record: lines.append(handler.format(record))
+        log.addHandler(handler)
+        barrier = threading.Barrier(2)
+
+        def run_module(module):
+            Parser.change_formatter_custom_file(SimpleNamespace(tanda='1RA'), f'{module}-1')
+            barrier.wait()
+            log.info(module)
+            Parser.change_formatter_base(None)
+            log.info(f'{module} fin')
+
+        try:
+            ModuleScheduler(['compras', 'traslados'], run_module, 2, {}).run()
+        finally:
+            log.removeHandler(handler)
+        for module in ('compras', 'traslados'):
+            with self.subTest(module=module):
+                self.assertTrue(any(f'[1RA][{module}-1.csv] run_module INFO {module}' in line for line in lines))
+                self.assertTrue(any(line.endswith(f'] run_module INFO {module} fin') for line in lines))
@@ -0,0 +1,62 @@
+import json
+import tempfile
+from pathlib import Path
+from unittest import TestCase, mock
+
+from utils.converters import Csv2Dict
+from utils.rows import CsvRow, DocStatus, to_builtin
+from utils.snapshots import RunSnapshot, get_json_from_snapshot
+
+
+class TestRunSnapshot(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        sap = mock.MagicMock()
+        sap.dispensados = {str(i): {'DocEntry': i} for i in range(10_000)}
+        self.csv_to_dict = Csv2Dict('dispensacion', 'NroSSC', {}, sap)
+        for key, status in (('1127507', 'DocEntry: 752066'), ('1127508', '[CSV] Plu no reconocido'),
+                            ('Ñ-3', '')):
+            doc_status = DocStatus(status)
+            rows = [CsvRow.from_dict({'NroSSC': key, 'Plu': plu, 'Status': ''}) for plu in ('770', '771')]
+            for row in rows:
+                row['Status'] = doc_status
+            self.csv_to_dict.data[key] = {'json': {'U_LF_Formula': key, 'DocumentLines': [{'Quantity': 2}]},
+                                          'csv': rows}
+            self.csv_to_dict.csv_lines += 2
+        self.csv_to_dict.succss = {'1127507', 'Ñ-3'}
+        self.csv_to_dict.errs = {'1127508'}
+        self.path = Path(self.tmp.name) / 'Dispensacion-1.snapshot.zip'
+
+    def test_random_access(self):
+        RunSnapshot.dump(self.csv_to_dict, self.path)
+        with RunSnapshot(self.path) as snapshot:
+            self.assertEqual((snapshot.name, snapshot.pk, snapshot.csv_lines), ('dispensacion', 'NroSSC', 6))
+            self.assertEqual(snapshot.succss, {'1127507', 'Ñ-3'})
+            self.assertEqual(snapshot.errs, {'1127508'})
+            self.assertEqual(list(snapshot), ['1127507', '1127508', 'Ñ-3'])
+            doc = snapshot['1127508']
+            self.assertEqual(doc['status'], '[CSV] Plu no reconocido')
+            self.assertEqual(doc['json'], {'U_LF_Formula': '1127508', 'DocumentLines': [{'Quantity': 2}]})
+            self.assertEqual(doc['csv'][1], {'NroSSC': '1127508', 'Plu': '771', 'Status': '[CSV] Plu no reconocido'})
+            self.assertIsNone(snapshot.get('otro'))
+            with self.assertRaises(KeyError):
+                snapshot['otro']
+
+    def test_sap_cache_is_not_stored(self):
+        RunSnapshot.dump(self.csv_to_dict, self.path)
+        self.assertLess(self.path.stat().st_size, 5_000)
+
+    @mock.patch('utils.snapshots.log')
+    def test_get_json_from_snapshot(self, mock_log):
+        RunSnapshot.dump(self.csv_to_dict, self.path)
+        jsonpath = get_json_from_snapshot(self.path, Path(self.tmp.name) / 'out.json')
+        expected = json.dumps(self.csv_to_dict.data, indent=4, ensure_ascii=False, default=to_builtin)
+        self.assertEqual(Path(jsonpath).read_text(encoding='utf-8-sig'), expected)
+
+    @mock.patch('utils.snapshots.log')
+    def test_get_json_from_empty_snapshot(self, mock_log):
+        self.csv_to_dict.data.clear()
+        RunSnapshot.dump(self.csv_to_dict, self.path)
+        jsonpath = get_json_from_snapshot(self.path, Path(self.tmp.name) / 'out.json')
+        self.assertEqual(Path(jsonpath).read_text(encoding='utf-8-sig'), '{}')
@@ -0,0 +1,133 @@
+import csv
+import io
+import os
+import tempfile
+import threading
+from unittest import TestCase, mock
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+from utils.gdrive.uploads import UploadManager
+
+CHUNK = 256 * 1024
+
+
+class FakeRequest:
+    """ files().create(...) que recibe el media por partes, como la subida resumible de Google Drive. """
+
+    def __init__(self, drive, body, media_body):
+        self.drive, self.body, self.media = drive, body, media_body
+        self.received = b''
+        self.offsets = []
+
+    def next_chunk(self):
+        if self.drive.failures:
+            self.drive.failures -= 1
+            raise self.drive.error
+        self.offsets.append(len(self.received))
+        self.received += self.media.getbytes(len(self.received), self.media.chunksize())
+        if len(self.received) < self.media.size():
+            return mock.MagicMock(resumable_progress=len(self.received), total_size=self.media.size()), None
+        with self.drive.lock:
+            self.drive.uploaded[self.body['name']] = self.received
+            self.drive.threads.add(threading.current_thread().name)
+        return None, {'id': f"id-{self.body['name']}"}
+
+
+class FakeDrive:
+    def __init__(self, failures=0, error=None):
+        self.failures, self.error = failures, error
+        self.requests = []
+        self.uploaded = {}
+        self.threads = set()
+        self.lock = threading.Lock()
+
+    def files(self):
+        return self
+
+    def create(self, body, media_body, fields):
+        self.requests.append(FakeRequest(self, body, media_body))
+        return self.requests[-1]
+
+
+@mock.patch('utils.gdrive.uploads.time.sleep')
+@mock.patch('utils.gdrive.uploads.settings', DRIVE_UPLOAD_WORKERS=4, DRIVE_UPLOAD_CHUNK_BYTES=CHUNK)
+class TestUploadManager(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.manager = UploadManager(creds=None)
+        self.drive = FakeDrive()
+        self.manager.service = lambda: self.drive
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def make_file(self, name, size):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, 'wb') as f:
+            f.write(os.urandom(size))
+        return path
+
+    def test_interrupted_upload_is_resumed(self, settings, sleep):
+        path = self.make_file('dispensacion_processed_all.csv', CHUNK * 3 + 10)
+        original_next_chunk = FakeRequest.next_chunk
+
+        def fail_after_first_chunk(request):
+            if len(request.received) == CHUNK and not getattr(request, 'failed', False):
+                request.failed = True
+                raise httplib2.HttpLib2Error('Connection reset')
+            return original_next_chunk(request)
+
+        with mock.patch.object(FakeRequest, 'next_chunk', fail_after_first_chunk):
+            file_id = self.manager.upload_file(path, 'Dispensacion-1 procesados.csv', 'folder')
+        self.assertEqual(file_id, 'id-Dispensacion-1 procesados.csv')
+        self.assertEqual(len(self.drive.requests), 1)
+        self.assertEqual(self.drive.requests[0].offsets, [0, CHUNK, CHUNK * 2, CHUNK * 3])
+        with open(path, 'rb') as f:
+            self.assertEqual(self.drive.uploaded['Dispensacion-1 procesados.csv'], f.read())
+        sleep.assert_called_once_with(55)
+
+    def test_expired_session_restarts_upload(self, settings, sleep):
+        path = self.make_file('compras_only_errors.csv', 100)
+        self.drive.failures, self.drive.error = 1, HttpError(mock.MagicMock(status=404), b'Not Found')
+        self.manager.upload_file(path, 'Compras-1 errores.csv', 'folder')
+        self.assertEqual(len(self.drive.requests), 2)
+
+    def test_upload_files_at_the_same_time(self, settings, sleep):
+        files = [(self.make_file(f'file{i}.csv', CHUNK * 2), f'Archivo-{i}.csv', 'folder') for i in range(4)]
+        ids = self.manager.upload_files(files)
+        self.assertEqual(ids, [f'id-Archivo-{i}.csv' for i in range(4)])
+        self.assertTrue(all(name.startswith('drive-upload') for name in self.drive.threads))
+
+        # Al reintentar no se suben de nuevo los que ya fueron subidos
+        self.manager.upload_files(files)
+        self.assertEqual(len(self.drive.requests), 4)
+
+    def test_upload_rows(self, settings, sleep):
+        rows = [{'NroSSC': '1', 'Status': '[CSV] Plu no reconocido'}, {'NroSSC': '2', 'Status': 'Señal'}]
+        self.assertEqual(self.manager.upload_rows(rows, 'Dispensacion-1.csv', 'folder'), 'id-Dispensacion-1.csv')
+        content = self.drive.uploaded['Dispensacion-1.csv'].decode('utf-8')
+        self.assertEqual(list(csv.DictReader(io.StringIO(content), delimiter=';')), rows)
+        self.assertEqual(self.manager.upload_rows(iter([]), 'vacio.csv', 'folder'), '')
+
+    def test_big_rows_are_spooled_to_disk(self, settings, sleep):
+        rows = ({'NroSSC': str(i), 'Status': 'x' * 100} for i in range(CHUNK // 50))
+        with mock.patch('utils.gdrive.uploads.tempfile.SpooledTemporaryFile',
+                        wraps=tempfile.SpooledTemporaryFile) as spooled:
+            self.manager.upload_rows(rows, 'Dispensacion-1.csv', 'folder')
+        spooled.assert_called_once_with(max_size=CHUNK)
+        self.assertGreater(len(self.drive.requests[0].offsets), 1)
+        content = self.drive.uploaded['Dispensacion-1.csv'].decode('utf-8')
+        self.assertEqual(len(list(csv.DictReader(io.StringIO(content), delimiter=';'))), CHUNK // 50)
+
+    def test_close_shuts_down_the_upload_threads(self, settings, sleep):
+        files = [(self.make_file(f'file{i}.csv', 10), f'Archivo-{i}.csv', 'folder') for i in range(2)]
+        self.manager.upload_files(files)
+        executor = self.manager.executor
+        self.manager.close()
+        self.assertIsNone(self.manager.executor)
+        self.assertTrue(executor._shutdown)
+        self.manager.upload_files([(self.make_file('file9.csv', 10), 'Archivo-9.csv', 'folder')] * 2)
+        self.assertIsNotNone(self.manager.executor)
+        self.manager.close()
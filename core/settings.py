@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 import logging
+import threading
 from functools import partial
 from os.path import join
 from pathlib import Path
@@ -132,6 +133,9 @@ EMAIL_PORT = config('EMAIL_PORT')
 EMAIL_HOST_USER = config('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD')
 EMAIL_USE_SSL = config('EMAIL_USE_SSL')
+# Peso máximo de los adjuntos de cada e-mail de reporte. Los adjuntos viajan en
+# base64 (4/3 de su peso), así 18 MB quedan por debajo del límite de 25 MB.
+EMAIL_ATTACHMENTS_MAX_BYTES = config('EMAIL_ATTACHMENTS_MAX_BYTES', cast=int, default=18_000_000)
 
 # create logger
 logger = logging.getLogger("logging_tryout2")
@@ -141,12 +145,24 @@ logger.setLevel(logging.DEBUG)
 ch = logging.StreamHandler()
 ch.setLevel(logging.DEBUG)
 
+# Tanda y archivo que procesa cada hilo, ver Parser.change_formatter_custom_file.
+# Es por hilo para que los modulos en paralelo no se mezclen.
+log_context = threading.local()
+
+
+class LogContextFilter(logging.Filter):
+    def filter(self, record):
+        record.context = getattr(log_context, 'prefix', '')
+        return True
+
+
 # create formatter
-formatter = logging.Formatter("%(asctime)s %(funcName)s %(levelname)s %(message)s",
+formatter = logging.Formatter("%(asctime)s%(context)s %(funcName)s %(levelname)s %(message)s",
                               "[%d%b %H:%M:%S]")
 
 # add formatter to ch
 ch.setFormatter(formatter)
+ch.addFilter(LogContextFilter())
 
 # add ch to logger
 logger.addHandler(ch)
@@ -235,9 +251,94 @@ MODULES_USE_DOCUMENTLINES = [COMPRAS_NAME, AJUSTES_ENTRADA_PRUEBA_NAME,
                              DISPENSACION_NAME, DISPENSACIONES_ANULADAS_NAME,
                              FACTURACION_NAME, NOTAS_CREDITO_NAME]
 
+# Cantidad de procesos usados para convertir en paralelo los csv de un mismo
+# modulo en la primera tanda. Con 1 los archivos se convierten uno tras otro.
+CONVERSION_WORKERS = config('CONVERSION_WORKERS', cast=int, default=1)
+# Método con el que son creados esos procesos, 'fork' no es seguro cuando hay
+# otros hilos corriendo (MODULES_PARALLELISM, REPORT_ASYNC). Cada proceso toma
+# un cupo de SAP_MAX_CONCURRENCY, ver utils.conversion.
+CONVERSION_START_METHOD = config('CONVERSION_START_METHOD', default='spawn')
+# Archivos de la primera tanda descargados por adelantado en un hilo aparte
+# (utils.gdrive.prefetch) mientras se procesa el actual, hasta sumar
+# DRIVE_PREFETCH_MAX_BYTES. Con 0 cada archivo es descargado al ser procesado.
+DRIVE_PREFETCH = config('DRIVE_PREFETCH', cast=int, default=0)
+DRIVE_PREFETCH_MAX_BYTES = config('DRIVE_PREFETCH_MAX_BYTES', cast=int, default=256 * 1024 * 1024)
+
+# Cantidad de payloads guardados en la BD por cada COPY o bulk_create
+DB_BULK_CHUNK = config('DB_BULK_CHUNK', cast=int, default=2000)
+
+# Los payloads y lineas de al menos esta cantidad de caracteres son guardados
+# comprimidos con zlib (base.fields). Con 0 no se comprime nada.
+PAYLOAD_COMPRESS_MIN_BYTES = config('PAYLOAD_COMPRESS_MIN_BYTES', cast=int, default=0)
+PAYLOAD_COMPRESS_LEVEL = config('PAYLOAD_COMPRESS_LEVEL', cast=int, default=6)
+
+# Cuando es True, ExcludeFromDB mueve los payloads del archivo a
+# sap_payloads_archivo en un hilo aparte y la segunda tanda sigue con el siguiente archivo.
+DB_DELETE_ASYNC = config('DB_DELETE_ASYNC', cast=bool, default=False)
+
+# Cuando es True, la segunda tanda entrega Export, Mail y ExcludeFromDB de cada
+# archivo a un hilo aparte (utils.reporting) y sigue con el siguiente archivo.
+REPORT_ASYNC = config('REPORT_ASYNC', cast=bool, default=False)
+# Intentos de cada acción del reporte (exportar, subir, mover, e-mail) y
+# segundos de espera antes del reintento, multiplicados por el intento.
+REPORT_RETRIES = config('REPORT_RETRIES', cast=int, default=3)
+REPORT_RETRY_INTERVAL = config('REPORT_RETRY_INTERVAL', cast=int, default=30)
+
+# Subidas al drive hechas al mismo tiempo (utils.gdrive.uploads) y tamaño de
+# cada parte de la subida resumible, debe ser múltiplo de 256 KB.
+DRIVE_UPLOAD_WORKERS = config('DRIVE_UPLOAD_WORKERS', cast=int, default=4)
+DRIVE_UPLOAD_CHUNK_BYTES = config('DRIVE_UPLOAD_CHUNK_BYTES', cast=int, default=8 * 1024 * 1024)
+
+# Cuando es True, cada ciclo lee el feed de cambios del drive (utils.gdrive.changes)
+# y los modulos cuya carpeta sigue vacía no la listan.
+DRIVE_CHANGES = config('DRIVE_CHANGES', cast=bool, default=False)
+# Horas luego de las cuales el id guardado de una carpeta del drive es
+# confirmado de nuevo antes de ser usado (utils.gdrive.folders).
+DRIVE_FOLDER_VALIDATE_HOURS = config('DRIVE_FOLDER_VALIDATE_HOURS', cast=int, default=24)
+# Cuando es True, los archivos procesados son movidos a {Carpeta}_BackUp en
+# lotes (utils.gdrive.batch) al final de cada modulo, o del ciclo con
+# REPORT_ASYNC, y sus registros son excluidos de la BD luego de moverlos.
+DRIVE_BATCH_MOVES = config('DRIVE_BATCH_MOVES', cast=bool, default=False)
+# Cuando es True, los csv descargados del drive quedan en DRIVE_CACHE_DIR
+# (utils.gdrive.cache) hasta sumar DRIVE_CACHE_MAX_BYTES.
+DRIVE_CACHE = config('DRIVE_CACHE', cast=bool, default=False)
+DRIVE_CACHE_DIR = config('DRIVE_CACHE_DIR', default=str(BASE_DIR / 'tmp' / 'drive_cache'))
+DRIVE_CACHE_MAX_BYTES = config('DRIVE_CACHE_MAX_BYTES', cast=int, default=512 * 1024 * 1024)
+
+# Cantidad de modulos ejecutados al mismo tiempo por medisap y migrasap.
+# Con 1 corren uno tras otro, en el orden recibido.
+MODULES_PARALLELISM = config('MODULES_PARALLELISM', cast=int, default=1)
+
+# Modulos que deben terminar antes de que inicie el modulo de la llave.
+# Solo son tenidos en cuenta los modulos que hagan parte de la ejecución.
+MODULES_DEPENDENCIES = {
+    TRASLADOS_NAME: (COMPRAS_NAME,),
+    # El inventario debe haber entrado antes de ser consumido
+    AJUSTES_SALIDA_NAME: (COMPRAS_NAME, TRASLADOS_NAME, AJUSTES_ENTRADA_NAME),
+    DISPENSACION_NAME: (COMPRAS_NAME, TRASLADOS_NAME, AJUSTES_ENTRADA_NAME),
+    DISPENSACIONES_ANULADAS_NAME: (DISPENSACION_NAME,),
+    FACTURACION_NAME: (DISPENSACION_NAME,),
+    NOTAS_CREDITO_NAME: (FACTURACION_NAME,),
+}
+
+# Cuando es True, el envío a SAP de los payloads guardados en la primera tanda
+# queda a cargo de los workers de `manage.py sapworker` y no del reloj.
+SAP_WORKERS = config('SAP_WORKERS', cast=bool, default=False)
+# Minutos luego de los cuales un payload reclamado por un worker que no
+# terminó de enviarlo puede ser reclamado por otro.
+SAP_CLAIM_TIMEOUT = config('SAP_CLAIM_TIMEOUT', cast=int, default=60)
+
+# Días luego de los cuales los archivos completamente enviados a SAP pasan de
+# sap_payloads_en_migracion a sap_payloads_archivo (manage.py archivapayloads).
+PAYLOADS_RETENTION_DAYS = config('PAYLOADS_RETENTION_DAYS', cast=int, default=7)
+# Días que se conservan en sap_payloads_archivo, con 0 no se eliminan.
+ARCHIVO_RETENTION_DAYS = config('ARCHIVO_RETENTION_DAYS', cast=int, default=180)
+
 # SAP INFORMATION
 
 SAP_USER = config('SAP_USER')
 SAP_PASS = config('SAP_PASS')
 SAP_COMPANY = config('SAP_COMPANY')
 SAP_URL = config('SAP_URL')
+# Máximo de peticiones simultáneas a la API de SAP entre todos los modulos
+SAP_MAX_CONCURRENCY = config('SAP_MAX_CONCURRENCY', cast=int, default=4)
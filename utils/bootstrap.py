@@ -0,0 +1,25 @@
+"""
+Inicialización de los procesos hijos creados con el método 'spawn'.
+
+Un proceso hijo con spawn empieza sin Django configurado, así que antes de
+importar cualquier modulo que use los modelos (ej.: utils.conversion) debe
+ejecutar django.setup(). Por eso el initializer de los ProcessPoolExecutor es
+setup_django, que recibe la ruta del initializer real como texto y solamente
+lo importa luego de configurar Django.
+"""
+import importlib
+import os
+
+import django
+
+
+def setup_django(initializer: str = '', *args) -> None:
+    """
+    :param initializer: Ruta de la función a ejecutar luego de django.setup().
+                        Ej.: 'utils.conversion.init_worker'
+    """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+    django.setup()
+    if initializer:
+        module, name = initializer.rsplit('.', 1)
+        getattr(importlib.import_module(module), name)(*args)
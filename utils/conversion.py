@@ -0,0 +1,139 @@
+"""
+Conversión de los csv de un mismo modulo en varios procesos.
+
+Cada proceso descarga del drive el archivo que le corresponde y lo
+convierte con Csv2Dict, consultando las tablas de SAP que el proceso
+principal ya había cargado (ver SAPData.preload). El resultado vuelve
+al proceso principal como un ConvertedCSV, el cual es usado como reader
+en el pipeline, de manera que guardar en BD, enviar a SAP y exportar
+sigue sucediendo en el proceso principal, archivo por archivo y en el
+mismo orden en que fueron detectados en el drive.
+
+Los procesos son creados con settings.CONVERSION_START_METHOD ('spawn' por
+defecto): con 'fork' heredarían copiados los locks que otros hilos (modulos
+en paralelo, Reporter) tengan tomados en ese momento. Además cada proceso
+cuenta como una petición simultánea a SAP dentro de settings.SAP_MAX_CONCURRENCY,
+así que el pool toma esos cupos del proceso principal mientras exista y
+tiene como máximo SAP_MAX_CONCURRENCY - 1 procesos.
+"""
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from threading import BoundedSemaphore
+from dataclasses import dataclass, field
+from typing import Optional
+
+from django.conf import settings
+from django.db import connections
+
+from core.settings import logger as log
+from utils.converters import Csv2Dict
+from utils.gdrive.cache import version_of
+from utils.gdrive.handler_api import GDriveHandler
+from utils.bootstrap import setup_django
+from utils.sap import manager
+from utils.sap.manager import SAPData, release_budget, reserve_budget
+
+# Inicializados en cada proceso por init_worker
+_drive: Optional[GDriveHandler] = None
+_sap: Optional[SAPData] = None
+
+
+@dataclass
+class ConvertedCSV:
+    """Resultado de convertir un csv en otro proceso."""
+    fieldnames: list
+    csv_to_dict: Optional[Csv2Dict] = None
+    error: Optional[Exception] = None
+    sap_cache: dict = field(default_factory=dict)  # Entregas consultadas en SAP durante la conversión
+
+    def load_into(self, csv_to_dict: Csv2Dict) -> None:
+        """Pasa la información convertida al Csv2Dict del proceso principal."""
+        if self.error:
+            raise self.error
+        csv_to_dict.sap.update_cache(self.sap_cache)
+        csv_to_dict.load_converted(self.csv_to_dict)
+
+
+def init_worker(sap_cache: dict) -> None:
+    global _drive, _sap
+    # El proceso es un solo hilo y el principal le reservó un cupo, ver reserve_budget
+    manager.sap_budget = BoundedSemaphore(1)
+    _sap = SAPData()
+    _sap.update_cache(sap_cache)
+    _drive = GDriveHandler()
+
+
+def convert_file(name: str, pk: str, series, file_id: str, version: str = '') -> ConvertedCSV:
+    """Descarga y convierte un csv del drive. Ejecutado en otro proceso."""
+    reader = _drive.read_csv_file_by_id(file_id, version)
+    converted = ConvertedCSV(reader.fieldnames)
+    already_loaded = set(_sap.entregas_loaded)
+    csv_to_dict = Csv2Dict(name, pk, series, _sap)
+    try:
+        csv_to_dict.process(reader)
+    except Exception as e:
+        converted.error = e
+    else:
+        csv_to_dict.sap = None
+        converted.csv_to_dict = csv_to_dict
+    loaded = _sap.entregas_loaded - already_loaded
+    converted.sap_cache = {
+        'entregas': {ssc: _sap.entregas[ssc] for ssc in loaded if ssc in _sap.entregas},
+        'entregas_loaded': loaded,
+    }
+    return converted
+
+
+class ConversionPool:
+    """
+    Convierte en otros procesos los próximos archivos mientras el proceso
+    principal se encarga del archivo actual. Para no acumular en memoria
+    archivos ya convertidos, solo mantiene `workers` archivos adelantados.
+    """
+
+    def __init__(self, module, files: list, workers: int):
+        self.module = module
+        self.pending = deque(files)
+        self.futures = {}
+        self.workers = self.reserved = reserve_budget(min(workers, settings.SAP_MAX_CONCURRENCY - 1))
+        self.executor = None
+        if not self.workers:
+            log.warning(f"[{module.name}] Sin cupo en SAP_MAX_CONCURRENCY para convertir en otros procesos")
+            return
+        module.sap.preload(module.name)
+        # Las conexiones a la BD no deben ser heredadas por los procesos hijos.
+        connections.close_all()
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context(settings.CONVERSION_START_METHOD),
+            initializer=setup_django, initargs=('utils.conversion.init_worker', module.sap.cache_snapshot())
+        )
+        log.info(f"[{module.name}] Convirtiendo {len(files)} archivos en {self.workers} procesos")
+        self.fill()
+
+    def fill(self) -> None:
+        while self.executor and self.pending and len(self.futures) < self.workers:
+            file = self.pending.popleft()
+            self.futures[file['id']] = self.executor.submit(
+                convert_file, self.module.name, self.module.pk, self.module.series, file['id'], version_of(file)
+            )
+
+    def get(self, file: dict) -> Optional[ConvertedCSV]:
+        """Espera la conversión del archivo, None caso no haya sido enviado a convertir."""
+        if (future := self.futures.pop(file['id'], None)) is None:
+            return None
+        self.fill()
+        return future.result()
+
+    def close(self) -> None:
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+        release_budget(self.reserved)
+        self.reserved = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
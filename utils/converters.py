@@ -1,10 +1,14 @@
+import copy
+from bisect import insort
 from dataclasses import dataclass, field
 from datetime import datetime
+from functools import cached_property
 from typing import Iterable
 
 from django.conf import settings
+from django.db.models import QuerySet
 
-from base.templatetags.filter_extras import make_text_status
+from base.templatetags.filter_extras import make_text_status, summarize_error
 from core.settings import logger as log
 from utils.decorators import logtime
 from utils.resources import (
@@ -13,6 +17,7 @@ from utils.resources import (
     load_comments,
     string_to_datetime
 )
+from utils.rows import CsvRow, DocStatus, ErrorHistogram
 from utils.sap.manager import SAPData
 
 
@@ -26,97 +31,169 @@ class Csv2Dict:
     errs: set = field(init=False, default_factory=set)
     succss: set = field(init=False, default_factory=set)
     csv_lines: int = 0
+    # Fecha de cada documento como entero AAAAMMDDHHMMSS, calculada al leer su primera línea
+    dates: dict = field(init=False, default_factory=dict, repr=False)
+    dates_index: list = field(init=False, default_factory=list, repr=False)  # [(fecha, key), ...] ordenado
+    undated: set = field(init=False, default_factory=set, repr=False)  # Documentos con fecha no reconocida
+    status: dict = field(init=False, default_factory=dict, repr=False)  # {key: DocStatus}
+    # Documentos por categoría y texto de error, actualizado por cada DocStatus de self.status
+    histogram: ErrorHistogram = field(init=False, repr=False,
+                                      default_factory=lambda: ErrorHistogram(summarize_error))
+    fresh_row: object = field(init=False, default=None, repr=False)  # Línea que está siendo leída
 
     def __repr__(self):
         return (f"Csv2Dict(name='{self.name}', "
                 f"{self.pk}={len(self.data.values())} series={self.series} "
                 f"csv_lines={self.csv_lines})")
 
+    @cached_property
+    def fecha_field(self) -> str:
+        """ Primer campo (en orden alfabético) del header del modulo que tenga la palabra 'fecha' """
+        fields = sorted(
+            h
+            for h in getattr(settings, f"{self.name.upper()}_HEADER", [])
+            if 'fecha' in h.lower()
+        )
+        return fields[0] if fields else ''
+
+    def register_date(self, key: str, row) -> None:
+        """ Guarda la fecha del documento en el índice ordenado de fechas. """
+        if not self.fecha_field or key in self.dates:
+            return
+        try:
+            dt = datetime.strptime(row[self.fecha_field], '%Y-%m-%d %H:%M:%S')
+        except Exception:
+            self.undated.add(key)
+        else:
+            stamp = int(format(dt, '%Y%m%d%H%M%S'))
+            self.dates[key] = stamp
+            insort(self.dates_index, (stamp, key))
+
     @property
     def succss_ordered_by_date(self) -> Iterable:
         """ Ordena los info.success por el campo fecha que posea el modulo """
-        fecha_field = [
-            h
-            for h in tuple(getattr(settings, f"{self.name.upper()}_HEADER", []))
-            if 'fecha' in h.lower()
-        ]
         try:
-            # fecha_field son todos los campos del header del modulo que tengan la palabra 'fecha'
-            if not fecha_field:
-                raise Exception(f'No se encontró header con la palabra \'fecha\' en {self.name.uppper()}_HEADER')
-            order_func = lambda d: datetime.strptime(self.data[d]['csv'][0][fecha_field[0]], '%Y-%m-%d %H:%M:%S')
-            return sorted(self.succss.intersection(self.data), key=order_func)
+            if not self.fecha_field:
+                raise Exception(f'No se encontró header con la palabra \'fecha\' en {self.name.upper()}_HEADER')
+            # Documentos agregados a self.data sin pasar por process_module o load_data_from_db
+            for key in self.succss.difference(self.dates, self.undated).intersection(self.data):
+                self.register_date(key, self.data[key]['csv'][0])
+            if undated := self.undated.intersection(self.succss):
+                raise Exception(f'Fecha no reconocida en {self.fecha_field} de {", ".join(sorted(undated))}')
+            return [key for _, key in self.dates_index if key in self.succss]
         except Exception as e:
             log.error(f'Error al ordenar la info en {self.name.upper()!r}: {repr(e)}')
             return self.succss
 
     def load_data_from_db(self, records) -> None:
+        """
+        Carga los PayloadMigracion recibidos. Un QuerySet es consultado de
+        nuevo, en una sola consulta, para leer lo último guardado en BD.
+        Caso un documento ya esté cargado, es reemplazado.
+        """
+        if isinstance(records, QuerySet):
+            records = records.all()
         for record in records:
-            record.refresh_from_db()
+            if record.valor_documento in self.data:
+                self.unload(record.valor_documento)
             # log.info(f"{record.valor_documento} Cargando en csvdict actual DL -> {record.payload['DocumentLines']}")
             self.data[record.valor_documento] = {
                 'json': record.payload,
-                'csv': eval(record.lineas),
+                'csv': [CsvRow.from_dict(line) for line in eval(record.lineas)],
             }
             # log.info(f"{record.valor_documento} Nuevo DL en csvdict           -> {self.data[record.valor_documento]['json']['DocumentLines']}")
             self.csv_lines += record.cantidad_lineas_documento
+            self.link_status(record.valor_documento, DocStatus(record.status))
+            self.register_date(record.valor_documento, self.data[record.valor_documento]['csv'][0])
             if record.status == '' or 'DocEntry' in record.status:
                 self.succss.add(record.valor_documento)
             else:
                 self.errs.add(record.valor_documento)
 
+    def unload(self, key: str) -> None:
+        """ Quita el documento de data, succss, errs y del conteo de lineas. """
+        self.csv_lines -= len(self.data.pop(key)['csv'])
+        self.succss.discard(key)
+        self.errs.discard(key)
+        if status := self.status.pop(key, None):
+            status.unwatch()
+        self.histogram.discard(key)
+
     def clear_data(self):
         self.data.clear()
         self.errs.clear()
         self.succss.clear()
         self.csv_lines = 0
+        self.dates.clear()
+        self.dates_index.clear()
+        self.undated.clear()
+        for status in self.status.values():
+            status.unwatch()
+        self.status.clear()
+        self.histogram.clear()
+        self.fresh_row = None
 
     def group_by_type_of_errors(self):
         """
-        Crea los atributos csv_errs, sap_errs y other_errs donde se guardan las
-        referencias de los registros que tienen ese tipo de error.
+        Crea los atributos csv_errs, sap_errs, other_errs y result_succss donde se
+        guardan las referencias de los registros que tienen ese tipo de status,
+        como {texto del status: {valor_documento, ...}}.
         Los cuáles podrán ser indexados en self.data.
+        Los grupos vienen de self.histogram, que ya fue actualizado con cada
+        cambio de status, así que solamente son recorridos los documentos cuyo
+        status no está en self.status, Ej.: agregados directamente en self.data.
         """
-        self.result_succss, self.csv_errs, self.sap_errs, self.other_errs = {}, {}, {}, {}
-        for k, v in self.data.items():
-            status_text = make_text_status(v['csv'])
+        if len(self.status) < len(self.data):
+            for k, v in self.data.items():
+                if k not in self.status:
+                    self.histogram.update(k, make_text_status(v['csv']))
 
-            if 'CSV' in status_text:
-                if status_text not in self.csv_errs:
-                    self.csv_errs[status_text] = []
-                self.csv_errs[status_text].append(k)
+        buckets = self.histogram.buckets
+        self.csv_errs, self.sap_errs = buckets['CSV'], buckets['SAP']
+        self.other_errs, self.result_succss = buckets['CONNECTION'], buckets['DocEntry']
 
-            elif 'SAP' in status_text:
-                if status_text not in self.sap_errs:
-                    self.sap_errs[status_text] = []
-                self.sap_errs[status_text].append(k)
-
-            elif 'CONNECTION' in status_text or 'TIMEOUT' in status_text:
-                if status_text not in self.sap_errs:
-                    self.other_errs[status_text] = []
-                self.other_errs[status_text].append(k)
-
-            elif 'DocEntry' in status_text:
-                self.result_succss[k] = status_text
-
-            elif status_text:
-                log.error(f"{status_text!r} no es un tipo de error válido, "
-                          f"los errores deben ser o tipo SAP o tipo CSV.")
+        for status_text, count in self.histogram.unknown.items():
+            log.error(f"{status_text!r} no es un tipo de error válido ({count} documentos), "
+                      f"los errores deben ser o tipo SAP o tipo CSV.")
 
     def reg_error(self, row, txt):
-        """Agrega el motivo del error a la llave 'Status'."""
+        """Agrega el motivo del error al status del documento."""
         self.errs.add(row[f'{self.pk}'])
         try:
             self.succss.remove(row[f'{self.pk}'])
         except Exception:
             ...
-        if row['Status'] == '':
-            row['Status'] = txt
-        elif txt not in row['Status']:
-            row['Status'] += f" | {txt}"
+        status = row['Status']
+        if not isinstance(status, DocStatus):
+            # Línea que no fue leída por process_module, Ej.: agregada directamente en self.data
+            status = row['Status'] = DocStatus(status)
+        elif row is self.fresh_row:
+            # El primer error de la línea que está siendo leída reemplaza
+            # el status que traía el documento.
+            status.clear()
+            self.fresh_row = None
+        status.add(txt)
 
         self.update_status_necessary_columns(row, row[self.pk])
 
+    def link_status(self, key, status: DocStatus) -> DocStatus:
+        """ Hace que todas las líneas del documento referencien el mismo status. """
+        if key in self.data:
+            if (previous := self.status.get(key)) is not None and previous is not status:
+                previous.unwatch()
+            self.status[key] = status
+            status.watch(self.histogram, key)
+            for r in self.data[key]['csv']:
+                r['Status'] = status
+        return status
+
+    def doc_status(self, key) -> DocStatus:
+        """ Retorna el status del documento, creándolo a partir de sus líneas si aún no existe. """
+        if (status := self.status.get(key)) is None:
+            lines = self.data[key]['csv']
+            status = self.link_status(key, DocStatus(str(lines[0]['Status']) if lines else ''))
+        return status
+
     def get_series(self, row):
         """Determina el series a partir del SubPlan o No y crea la variable single_serie."""
         # TODO En el caso de facturación viene 'Capita complementaria Subsidiado '
@@ -499,6 +576,30 @@ class Csv2Dict:
             return res
 
     @logtime('CSV')
+    def load_converted(self, other: 'Csv2Dict') -> None:
+        """ Toma la información de un csv convertido en otro proceso, ver utils.conversion. """
+        for attr in ('data', 'errs', 'succss', 'csv_lines', 'dates', 'dates_index', 'undated', 'status'):
+            setattr(self, attr, getattr(other, attr))
+        # Los DocStatus llegan sin observador desde el otro proceso
+        self.histogram.clear()
+        for key, status in self.status.items():
+            status.watch(self.histogram, key)
+        log.info(f"[{self.name}] CSV convertido en otro proceso, {fn(self.csv_lines)} líneas leidas,"
+                 f" {fn(len(self.succss))} payloads creados y {fn(len(self.errs))} Errores de CSV.")
+
+    def detach(self) -> 'Csv2Dict':
+        """
+        Copia con sus propios contenedores, de manera que clear_data no la
+        afecte. Los documentos y sus status son compartidos, ya que luego de
+        clear_data no vuelven a ser modificados. Ver utils.reporting.
+        """
+        other = copy.copy(self)
+        for attr in ('data', 'errs', 'succss', 'dates', 'dates_index', 'undated', 'status'):
+            setattr(other, attr, copy.copy(getattr(self, attr)))
+        other.histogram = copy.deepcopy(self.histogram)
+        other.fresh_row = None
+        return other
+
     def process(self, csv_reader):
         log.info(f"[{self.name}] Comenzando procesamiendo de CSV.")
         self.process_module(csv_reader)
@@ -981,8 +1082,9 @@ class Csv2Dict:
             key = row[self.pk]
 
             log.info(f'LN {i} Leyendo {self.pk} {key}')
-            row['Status'] = ''
             if key in self.data:
+                row['Status'] = self.doc_status(key)
+                self.fresh_row = row
                 if self.name in settings.MODULES_USE_DOCUMENTLINES:
                     self.add_article(key, self.build_document_lines(row))
                     self.data[key]['csv'].append(row)
@@ -997,8 +1099,10 @@ class Csv2Dict:
                 # log.info(f'{i} [{self.name.capitalize()}] Leyendo {self.pk} {key}')
                 self.succss.add(key)
                 self.data[key] = {'json': {}, 'csv': []}
+                row['Status'] = self.link_status(key, DocStatus())
                 self.data[key]['json'] = self.build_base(key, row)
                 self.data[key]['csv'].append(row)
+                self.register_date(key, row)
             else:
                 # Entra aquí cuando viene el pk vacío, entonces
                 # crea un key para que sea tenido en cuenta en la exportación de csv
@@ -1006,7 +1110,7 @@ class Csv2Dict:
                 txt = f"[CSV] {self.pk} desconocido para {self.name.capitalize()}: {key!r}"
                 log.info(f'{i} {txt}')
                 self.data[new_key] = {'json': {}, 'csv': []}
-                row['Status'] = txt
+                row['Status'] = self.link_status(new_key, DocStatus(txt))
                 self.data[new_key]['json'] = self.build_base(key, row)
                 self.data[f"sin {self.pk.lower()} ({i})"]['csv'].append(row)
                 self.reg_error(row, txt)
@@ -1016,10 +1120,17 @@ class Csv2Dict:
 
     def update_status_necessary_columns(self, row, key):
         """ Actualiza el campo de status en el resto de lineas del mismo
-        documento caso esten vacías. """
-        if key in self.errs:
-            if not row['Status'] and not self.data[key]['csv'][-1]['Status']:
-                self.data[key]['csv'][-1]['Status'] = self.data[key]['csv'][-2]['Status']
-            else:
-                for r in self.data[row[self.pk]]['csv']:
-                    r['Status'] = row['Status']
+        documento caso esten vacías. Las líneas leídas por process_module
+        ya comparten el DocStatus del documento, así que no hay nada que copiar. """
+        if row is self.fresh_row:
+            self.fresh_row = None
+        if key not in self.errs:
+            return
+        status = row['Status']
+        if isinstance(status, DocStatus):
+            if self.status.get(key) is not status:
+                self.link_status(key, status)
+        elif not status and not self.data[key]['csv'][-1]['Status']:
+            self.data[key]['csv'][-1]['Status'] = self.data[key]['csv'][-2]['Status']
+        else:
+            self.link_status(row[self.pk], DocStatus(status))
@@ -1,5 +1,6 @@
 import functools
 import pickle
+import threading
 import time
 from datetime import datetime, timedelta
 from functools import wraps
@@ -78,17 +79,18 @@ def login_required(func):
 
 def once_in_interval(interval_seconds):
     def decorator(func):
-        last_execution_time = datetime.min
+        # Cada hilo lleva su propio registro, así los modulos que corren
+        # en paralelo (ver utils.scheduler) no bloquean la ejecución del otro.
+        state = threading.local()
 
         @wraps(func)
         def wrapper(*args, **kwargs):
-            nonlocal last_execution_time
             current_time = datetime.now()
-            if current_time - last_execution_time >= timedelta(seconds=interval_seconds):
+            if current_time - getattr(state, 'last_execution_time', datetime.min) >= timedelta(seconds=interval_seconds):
                 # Execute the function
                 result = func(*args, **kwargs)
                 # Update the last execution time
-                last_execution_time = datetime.now()
+                state.last_execution_time = datetime.now()
                 return result
             else:
                 # Function was not executed due to repeated attempt
@@ -0,0 +1,85 @@
+import csv
+import json
+from contextlib import ExitStack
+from typing import Callable, Dict
+
+from core.settings import logger as log
+from utils.rows import to_builtin
+
+# Filtros de documentos para cada tipo de exportación, reciben el Csv2Dict y el valor_documento.
+FILTERS: Dict[str, Callable] = {
+    'processed': lambda source, key: True,
+    'errors': lambda source, key: key in source.errs or 'sin' in key,
+    'success': lambda source, key: key in source.succss,
+}
+
+
+class LazyCsvWriter:
+    """ csv.DictWriter que solo crea el archivo al recibir la primera linea. """
+
+    def __init__(self, path: str, stack: ExitStack):
+        self.path = path
+        self.stack = stack
+        self.writer = None
+
+    def writerows(self, rows) -> None:
+        for row in rows:
+            if self.writer is None:
+                f = self.stack.enter_context(open(self.path, 'w', encoding='utf-8-sig', newline=''))
+                self.writer = csv.DictWriter(f, fieldnames=list(row.keys()), delimiter=';', extrasaction='ignore')
+                self.writer.writeheader()
+            self.writer.writerow(row)
+
+    @property
+    def created(self) -> bool:
+        return self.writer is not None
+
+
+def write_csvs(source, paths: Dict[str, str]) -> Dict[str, str]:
+    """
+    Escribe en una sola pasada por source.data un csv por cada tipo de
+    exportación recibido, sin armar listas intermedias con las lineas.
+    Los encabezados de cada csv son los de su primera linea y caso un csv
+    no tenga lineas, no es creado.
+    :param source: Csv2Dict.
+    :param paths: {'processed': 'compras_processed_all.csv', 'errors': ..., 'success': ...}
+    :return: {'processed': 'compras_processed_all.csv', 'errors': '', ...} con '' en los no creados.
+    """
+    try:
+        with ExitStack() as stack:
+            writers = {kind: LazyCsvWriter(path, stack) for kind, path in paths.items()}
+            filters = {kind: FILTERS[kind] for kind in paths}
+            for key, doc in source.data.items():
+                for kind, writer in writers.items():
+                    if filters[kind](source, key):
+                        writer.writerows(doc['csv'])
+    except Exception as e:
+        log.error(f"Creando csv para {source.name.capitalize()} al ser procesado: {e}")
+        return dict.fromkeys(paths, '')
+
+    created = {}
+    for kind, writer in writers.items():
+        if writer.created:
+            log.info(f"Archivo creado -> {writer.path}")
+            created[kind] = writer.path
+        else:
+            log.info(f"No fue creado CSV {kind!r}, sin lineas que exportar")
+            created[kind] = ''
+    return created
+
+
+def write_jsonl(source, path: str, kind: str = 'processed') -> str:
+    """
+    Escribe un json por linea con el payload y status de cada documento
+    de source.data que pase el filtro `kind` (ver FILTERS).
+    :return: Ruta del archivo creado.
+    """
+    with open(path, 'w', encoding='utf-8') as f:
+        for key, doc in source.data.items():
+            if FILTERS[kind](source, key):
+                status = doc['csv'][0]['Status'] if doc['csv'] else ''
+                f.write(json.dumps({'valor_documento': key, 'status': status, 'json': doc['json']},
+                                   ensure_ascii=False, default=to_builtin))
+                f.write('\n')
+    log.info(f"Archivo creado -> {path}")
+    return path
@@ -0,0 +1,105 @@
+import time
+from dataclasses import dataclass, field
+from typing import Callable, List
+
+from googleapiclient.errors import HttpError
+
+from core.settings import logger as log
+
+BATCH_LIMIT = 100  # Maximum of requests per batch accepted by Google Drive
+RETRYABLE = (403, 429, 500, 502, 503, 504)  # 403 is what Drive answers when the rate limit is exceeded
+ROUNDS = 4
+
+
+@dataclass
+class BatchItem:
+    key: str  # Ex.: id of the file that is being moved
+    description: str
+    make_request: Callable  # Builds the HttpRequest, a new one on each round
+    callbacks: List[tuple] = field(default_factory=list)  # [(func, args), ...] run once it succeeds
+
+
+class DriveBatch:
+    """
+    Mutations of Google Drive (moves, metadata updates) sent together
+    through the batch endpoint, up to BATCH_LIMIT per HTTP request.
+    Each item succeeds or fails on its own: the ones that fail with a
+    retryable status are sent again in the next round, the others are
+    returned by execute. Media uploads can not be batched, see UploadManager.
+    """
+
+    def __init__(self, service):
+        self.service = service
+        self.items = {}  # {key: BatchItem}
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, key) -> bool:
+        return key in self.items
+
+    def add(self, key: str, description: str, make_request: Callable) -> None:
+        self.items[key] = BatchItem(key, description, make_request)
+
+    def after(self, key: str, func: Callable, *args) -> None:
+        """Runs func(*args) once the item key succeeds."""
+        self.items[key].callbacks.append((func, args))
+
+    def execute(self) -> List[BatchItem]:
+        """
+        Sends the pending items and runs the callbacks of the ones that succeeded.
+        :return: Items that failed, their callbacks are not run.
+        """
+        pending, self.items = list(self.items.values()), {}
+        failed, total = [], len(pending)
+        for round_ in range(ROUNDS):
+            if not pending:
+                break
+            if round_:
+                time.sleep(2 ** round_)
+            retry = []
+            for start in range(0, len(pending), BATCH_LIMIT):
+                chunk = pending[start:start + BATCH_LIMIT]
+                errors = self.send(chunk)
+                for item in chunk:
+                    if (error := errors.get(item.key)) is None:
+                        self.succeeded(item)
+                    elif self.retryable(error) and round_ < ROUNDS - 1:
+                        retry.append(item)
+                    else:
+                        log.error(f"{item.description} no fue realizado en Google Drive: {error}")
+                        failed.append(item)
+            pending = retry
+        if total:
+            log.info(f"{total - len(failed)} de {total} cambios realizados en Google Drive por lote")
+        return failed
+
+    def send(self, items: List[BatchItem]) -> dict:
+        """:return: {key: exception} of the items that failed."""
+        errors = {}
+
+        def callback(request_id, response, exception):
+            if exception is not None:
+                errors[request_id] = exception
+
+        batch = self.service.new_batch_http_request(callback=callback)
+        for item in items:
+            batch.add(item.make_request(), request_id=item.key)
+        try:
+            batch.execute()
+        except Exception as e:
+            # Falló la petición completa, todos los items quedan con ese error
+            return {item.key: e for item in items}
+        return errors
+
+    @staticmethod
+    def retryable(error: Exception) -> bool:
+        return not isinstance(error, HttpError) or error.resp.status in RETRYABLE
+
+    @staticmethod
+    def succeeded(item: BatchItem) -> None:
+        for func, args in item.callbacks:
+            try:
+                func(*args)
+            except Exception as e:
+                log.error(f"Error {e!r} luego de {item.description}")
@@ -0,0 +1,81 @@
+"""
+Copia en disco de los csv descargados del drive, para que al reiniciar una
+ejecución (caída, SIGTERM) o al leer de nuevo el mismo archivo no se
+descargue otra vez.
+Cada copia es identificada por el id del archivo y su versión (md5Checksum
+o, en su defecto, modifiedTime), así un archivo modificado en el drive no es
+leído de una copia vieja. Cuando las copias suman más de
+settings.DRIVE_CACHE_MAX_BYTES se borran las usadas hace más tiempo.
+"""
+import hashlib
+import os
+from pathlib import Path
+from typing import Optional
+
+from core.settings import logger as log
+from utils.resources import format_number as fn
+
+
+def version_of(file: dict) -> str:
+    """ Versión del archivo listado del drive, vacío si no es conocida. """
+    return file.get('md5Checksum') or file.get('modifiedTime') or ''
+
+
+class DownloadCache:
+
+    def __init__(self, directory: Path, max_bytes: int):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def path(self, file_id: str, version: str) -> Path:
+        return self.directory / f"{file_id}-{hashlib.sha1(version.encode()).hexdigest()[:16]}.csv"
+
+    def get(self, file_id: str, version: str) -> Optional[bytes]:
+        path = self.path(file_id, version)
+        try:
+            content = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        os.utime(path)  # Marca la copia como usada recientemente
+        log.info(f"[CSV] {path.name} leído de la copia local")
+        return content
+
+    def put(self, file_id: str, version: str, content: bytes) -> None:
+        """
+        Guarda la copia del archivo, reemplazando las de versiones anteriores.
+        Caso version sea el md5Checksum y no coincida con el contenido, no es guardada.
+        """
+        if len(version) == 32 and hashlib.md5(content).hexdigest() != version:
+            log.warning(f"[CSV] Contenido de {file_id} no coincide con su md5, no será guardado en la copia local")
+            return
+        path = self.path(file_id, version)
+        for old in self.directory.glob(f"{file_id}-*.csv"):
+            if old != path:
+                old.unlink(missing_ok=True)
+        # Escrito en un archivo temporal para que otro proceso nunca lea una copia a medias
+        tmp = path.with_suffix(f'.{os.getpid()}.tmp')
+        tmp.write_bytes(content)
+        os.replace(tmp, path)
+        self.evict()
+
+    def evict(self) -> None:
+        """ Borra las copias usadas hace más tiempo hasta quedar dentro de max_bytes. """
+        entries = []
+        for path in self.directory.glob('*.csv'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:  # Borrada por otro proceso
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        if total <= self.max_bytes:
+            return
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            removed += 1
+        log.info(f"[CSV] {removed} copias locales borradas, quedan {fn(total)} bytes")
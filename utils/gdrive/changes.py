@@ -0,0 +1,98 @@
+"""
+Descubrimiento de archivos guiado por el feed de cambios del drive (changes.list).
+
+Al inicio de cada ciclo, refresh_changes lee con una sola consulta (paginada)
+los cambios ocurridos desde el page token guardado en CursorDrive y marca las
+carpetas que recibieron algún csv. Luego, cada modulo solamente lista su
+carpeta {Modulo}Medicar (ver Parser.discover_files) si:
+    - Nunca fue listada o el feed no pudo ser leído.
+    - En el último listado tenía archivos, ya que siguen pendientes por la
+      segunda tanda o por un error.
+    - El feed trajo un csv de la carpeta desde el inicio del último listado.
+"""
+from typing import Optional, Set
+
+from django.conf import settings
+from django.utils import timezone
+from googleapiclient.errors import HttpError
+
+from base.models import CarpetaDrive, CursorDrive
+from core.settings import logger as log
+from utils.gdrive.stats import drive_stats
+
+FIELDS = 'nextPageToken, newStartPageToken, changes(fileId, removed, file(name, parents, trashed))'
+INVALID_TOKEN = (400, 404, 410)  # Status con el que el drive rechaza un page token expirado
+
+
+def refresh_changes(drive) -> Optional[Set[str]]:
+    """
+    Lee los cambios del drive desde el último page token y marca las carpetas
+    que recibieron csv.
+    :param drive: GDriveHandler
+    :return: Ids de las carpetas marcadas o None si todas deben ser listadas.
+    """
+    if not settings.DRIVE_CHANGES:
+        return None
+    cursor = CursorDrive.objects.first()
+    if cursor is None:
+        start = drive.service.changes().getStartPageToken().execute()['startPageToken']
+        CursorDrive.objects.create(page_token=start)
+        log.info("Feed de cambios del drive iniciado, las carpetas serán listadas")
+        return None
+
+    parents, token, new_start, pages = set(), cursor.page_token, cursor.page_token, 0
+    try:
+        while token:
+            with drive_stats.measure('cambios'):
+                response = drive.service.changes().list(pageToken=token, spaces='drive', pageSize=1000,
+                                                        fields=FIELDS).execute()
+            pages += 1
+            for change in response.get('changes', []):
+                file = change.get('file') or {}
+                if not change.get('removed') and file.get('name', '').lower().endswith('.csv'):
+                    parents.update(file.get('parents', []))
+            if new_start := response.get('newStartPageToken'):
+                break
+            token = response.get('nextPageToken')
+    except Exception as e:
+        # Sin el feed no se sabe qué carpetas cambiaron, así que se listan todas
+        log.warning(f"No fue posible leer el feed de cambios del drive: {e!r}")
+        CarpetaDrive.objects.update(cambio=timezone.now())
+        if isinstance(e, HttpError) and e.resp.status in INVALID_TOKEN:
+            cursor.page_token = drive.service.changes().getStartPageToken().execute()['startPageToken']
+            cursor.save()
+        return None
+
+    now = timezone.now()
+    marked = CarpetaDrive.objects.filter(folder_id__in=parents).update(cambio=now) if parents else 0
+    cursor.page_token = new_start
+    cursor.save()
+    log.info(f"Feed de cambios del drive leído en {pages} consulta{'s' if pages > 1 else ''}, "
+             f"{marked} carpeta{'s' if marked != 1 else ''} con csv nuevos")
+    return parents
+
+
+def must_list(drive, folder_name: str) -> bool:
+    """ Indica si la carpeta debe ser listada, ver docstring del modulo. """
+    if not settings.DRIVE_CHANGES:
+        return True
+    folder = CarpetaDrive.objects.filter(nombre=folder_name).first()
+    if folder is None or not folder.folder_id:
+        CarpetaDrive.objects.update_or_create(nombre=folder_name,
+                                              defaults={'folder_id': drive.get_folder_id_by_name(folder_name)})
+        return True
+    return (
+        folder.archivos != 0
+        or folder.listado is None
+        or (folder.cambio is not None and folder.cambio >= folder.listado)
+    )
+
+
+def register_listing(folder_name: str, files: int, started) -> None:
+    """
+    Guarda la cantidad de csv encontrados en la carpeta.
+    :param started: Momento en que inició el listado, los cambios posteriores
+                    hacen que la carpeta vuelva a ser listada.
+    """
+    if settings.DRIVE_CHANGES:
+        CarpetaDrive.objects.filter(nombre=folder_name).update(archivos=files, listado=started)
@@ -0,0 +1,36 @@
+"""
+Ids de las carpetas del drive guardados en la BD (CarpetaDrive), para que
+cada proceso nuevo no repita la búsqueda por nombre de las carpetas
+{Modulo}Medicar, _BackUp, _Procesado y _Error.
+Un id guardado es confirmado en el drive (files().get, más barato que la
+búsqueda) cuando pasan settings.DRIVE_FOLDER_VALIDATE_HOURS desde la última
+confirmación. Caso ya no exista, fue borrada o renombrada, se busca de nuevo.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from base.models import CarpetaDrive
+from core.settings import logger as log
+
+
+def load_folder_id(drive, name: str) -> str:
+    """
+    :param drive: GDriveHandler
+    :return: Id guardado y válido de la carpeta o '' caso deba ser buscada.
+    """
+    folder = CarpetaDrive.objects.filter(nombre=name).exclude(folder_id='').first()
+    if folder is None:
+        return ''
+    if folder.validado and timezone.now() - folder.validado < timedelta(hours=settings.DRIVE_FOLDER_VALIDATE_HOURS):
+        return folder.folder_id
+    if drive.is_folder(folder.folder_id, name):
+        CarpetaDrive.objects.filter(pk=folder.pk).update(validado=timezone.now())
+        return folder.folder_id
+    log.warning(f"Id guardado de carpeta {name!r} ya no es válido, será buscado de nuevo")
+    return ''
+
+
+def save_folder_id(name: str, folder_id: str) -> None:
+    CarpetaDrive.objects.update_or_create(nombre=name, defaults={'folder_id': folder_id, 'validado': timezone.now()})
@@ -1,30 +1,33 @@
 from __future__ import print_function
 
-import csv
-import time
 from datetime import datetime
 import io
 import os.path
-import tempfile
 from dataclasses import dataclass
-from functools import lru_cache
+from functools import cached_property, partial
 from time import sleep
+from typing import Optional
 
 import chardet as chardet
 from decouple import config
+from django.conf import settings
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-from googleapiclient.http import MediaFileUpload, MediaIoBaseDownload, MediaIoBaseUpload
-from tenacity import retry, stop_after_attempt, wait_random
+from googleapiclient.http import MediaIoBaseDownload
 
 from core.settings import logger as log
-from utils.decorators import ignore_unhashable, logtime, retry_until_true
-from utils.resources import get_fibonacci_sequence
+from utils.decorators import logtime, retry_until_true
+from utils.gdrive.batch import DriveBatch
+from utils.gdrive.cache import DownloadCache
+from utils.gdrive.folders import load_folder_id, save_folder_id
+from utils.gdrive.stats import drive_stats
+from utils.gdrive.uploads import UploadManager
+from utils.rows import CsvRowReader
 
-NUMBER_OF_ATTEMPTS = 7
+HEAD_BYTES = 64 * 1024  # First bytes of the csv used to detect its encoding
 
 
 @dataclass
@@ -43,27 +46,61 @@ class GDriveHandler:
         self.service = build('drive', 'v3', credentials=self.creds)
         self.files = []  # Se le agregan los archivos al ser ejecutada la función discover_files()
 
-    @ignore_unhashable
-    @lru_cache()
+    @cached_property
+    def uploads(self) -> UploadManager:
+        return UploadManager(self.creds)
+
+    def close(self) -> None:
+        """ Releases the upload threads, see UploadManager.close. """
+        if 'uploads' in self.__dict__:
+            self.uploads.close()
+
+    @cached_property
+    def batch(self) -> DriveBatch:
+        return DriveBatch(self.service)
+
+    @cached_property
+    def cache(self) -> Optional[DownloadCache]:
+        if not settings.DRIVE_CACHE:
+            return None
+        return DownloadCache(settings.DRIVE_CACHE_DIR, settings.DRIVE_CACHE_MAX_BYTES)
+
     def discover_folder_id_by_name(self, name) -> str:
-        query = f"name = '{name}' and mimeType = 'application/vnd.google-apps.folder'"
-        response = self.service.files().list(q=query).execute()
+        query = f"name = '{name}' and mimeType = 'application/vnd.google-apps.folder' and trashed = false"
+        with drive_stats.measure('busqueda_carpeta'):
+            response = self.service.files().list(q=query, fields='files(id)', pageSize=1).execute()
         if folders := response.get('files', []):
             folder_id = folders[0]['id']
-            GDriveHandler.folders_ids[name] = folders[0]['id']
+            GDriveHandler.folders_ids[name] = folder_id
+            save_folder_id(name, folder_id)
             return folder_id
         log.warning(f'No fue encontrado folder {name} en Google Drive')
         return ''
 
     def get_folder_id_by_name(self, name) -> str:
-        """Reach id of folder in attr of class"""
-        folder_id = GDriveHandler.folders_ids.get(name)
-        return folder_id or self.discover_folder_id_by_name(name)
-
+        """Reach id of folder in attr of class, then in the db (see utils.gdrive.folders) and then in Google Drive"""
+        if folder_id := GDriveHandler.folders_ids.get(name):
+            return folder_id
+        if folder_id := load_folder_id(self, name):
+            GDriveHandler.folders_ids[name] = folder_id
+            return folder_id
+        return self.discover_folder_id_by_name(name)
+
+    def is_folder(self, folder_id, name) -> bool:
+        """Check that the id still belongs to a folder with that name which is not in the trash."""
+        try:
+            with drive_stats.measure('validacion_carpeta'):
+                folder = self.service.files().get(fileId=folder_id, fields='name, mimeType, trashed').execute()
+        except HttpError as e:
+            if e.resp.status == 404:
+                return False
+            raise
+        return (folder.get('name') == name and not folder.get('trashed')
+                and folder.get('mimeType') == 'application/vnd.google-apps.folder')
 
     def get_files_in_folder_by_id(self, folder_id, ext='', only_files=True) -> list:
         """
-        Reach the files of a given folder given an id.
+        Reach the files of a given folder given an id, going through all the pages.
         :param only_files: Define if only files will be reached or all the elements.
         :param ext: Extension of files to  be reached.
         :param folder_id: '1Pf...Y'
@@ -71,20 +108,16 @@ class GDriveHandler:
                     [
                         {'id': '123lkj...',
                         'name': 'Dispensacion-8.csv',
-                        'createdTime': '2023-06-20T14:51:22.991Z',
-                        'modifiedTime': '2023-06-10T20:26:35.000Z'},
+                        'createdTime': '2023-06-20T14:51:22.991Z'},
                         {'id': '456mnb...',
                         'name': 'Dispensacion-7.csv',
-                        'createdTime': '2023-06-20T14:51:24.290Z',
-                        'modifiedTime': '2023-06-10T15:53:34.000Z'},
+                        'createdTime': '2023-06-20T14:51:24.290Z'},
                         {'id': '345pokjn...',
                         'name': 'Dispensacion-6.csv',
-                        'createdTime': '2023-06-20T14:51:24.290Z',
-                        'modifiedTime': '2023-06-07T22:11:25.000Z'},
+                        'createdTime': '2023-06-20T14:51:24.290Z'},
                         {'id': '1m...1A',
                         'name': 'convenioArticulos062023.csv',
-                        'createdTime': '2023-06-05T13:00:48.698Z',
-                        'modifiedTime': '2023-06-05T13:00:48.698Z'}
+                        'createdTime': '2023-06-05T13:00:48.698Z'}
                     ]
         """
         query = f"'{folder_id}' in parents and trashed = false"
@@ -92,13 +125,17 @@ class GDriveHandler:
             query += "and mimeType != 'application/vnd.google-apps.folder'"
         if ext:
             query += f" and fileExtension='{ext}'"
-        fields = 'files(id, name, modifiedTime, createdTime, parents)'
-        response = self.service.files().list(q=query, fields=fields).execute()
-        files = response.get('files', [])
+        fields = 'nextPageToken, files(id, name, createdTime, modifiedTime, md5Checksum, size, parents)'
+        files, page_token = [], None
+        while True:
+            with drive_stats.measure('listado_carpeta'):
+                response = self.service.files().list(q=query, fields=fields, pageSize=1000,
+                                                     pageToken=page_token).execute()
+            files.extend(response.get('files', []))
+            if not (page_token := response.get('nextPageToken')):
+                break
         return self.order_files_asc(files)
 
-    @ignore_unhashable
-    @lru_cache()
     @retry_until_true(3, 30)
     # @logtime('')
     def get_files_in_folder_by_name(self, folder_name, ext=None) -> list:
@@ -147,30 +184,40 @@ class GDriveHandler:
         return self.get_files_in_folder_by_id(self.get_folder_id_by_name(folder_name), ext=ext)
 
     @logtime('DRIVE')
-    def read_csv_file_by_id(self, file_id: str):
-        # file_metadata = self.service.files().get(fileId=file_id).execute()
-
-        # Download the file content as a bytes object
+    def read_csv_file_by_id(self, file_id: str, version: str = ''):
+        """
+        Read a csv of Google Drive.
+        :param file_id: Id of the file in Google Drive.
+        :param version: md5Checksum or modifiedTime of the file (see cache.version_of),
+                        when given the file is read from self.cache if it was already downloaded.
+        :return: CsvRowReader with the content of the file.
+        """
+        content = self.cache.get(file_id, version) if self.cache and version else None
+        if content is None:
+            content = self.download_file(file_id)
+            if self.cache and version:
+                self.cache.put(file_id, version, content)
+
+        try:
+            file_content_str = content.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            encoding = self.detect_csv_encoding(file_id, head=content[:HEAD_BYTES]) or 'latin-1'
+            log.warning(f"[CSV] Archivo {file_id} no está en utf-8, leído como {encoding}")
+            file_content_str = content.decode(encoding, errors='replace')
+
+        # Process the CSV file content using CsvRowReader (compact DictReader)
+        return CsvRowReader(io.StringIO(file_content_str), delimiter=';')
+
+    def download_file(self, file_id: str) -> bytes:
         request = self.service.files().get_media(fileId=file_id)
         file_content = io.BytesIO()
         downloader = MediaIoBaseDownload(file_content, request)
         done = False
         while not done:
             _, done = downloader.next_chunk()
+        return file_content.getvalue()
 
-        # encoding = self.detect_csv_encoding(file_id)
-
-        # Convert the bytes content to a string
-        file_content_str = file_content.getvalue().decode('utf-8-sig')
-
-        # Process the CSV file content using DictReader
-        import csv
-        from io import StringIO
-
-        csv_data = StringIO(file_content_str)
-        return csv.DictReader(csv_data, delimiter=';')
-
-    def move_file(self, file: dict, to_folder_name: str) -> None:
+    def move_file(self, file: dict, to_folder_name: str, later: bool = False) -> None:
         """
         Move a file to another folder.
         When it happens, might return a dict like this:
@@ -180,16 +227,38 @@ class GDriveHandler:
         'modifiedTime': '2023-07-05T21:59:16.994Z'}
         :param file: Dict with unique identification of the file in Google Drive.
         :param to_folder_name: Name of the folder where it will be moved.
+        :param later: When True the move is queued in self.batch and sent by flush_moves.
         """
         new_parent_id = self.get_folder_id_by_name(to_folder_name)
         previous_parents = ",".join(file.get('parents'))
-        self.service.files().update(
-            fileId=file['id'], addParents=new_parent_id, removeParents=previous_parents, fields='id, parents'
-        ).execute()
+        request = partial(self.service.files().update, fileId=file['id'], addParents=new_parent_id,
+                          removeParents=previous_parents, fields='id, parents')
+        if later:
+            self.batch.add(file['id'], f"Mover {file['name']!r} a {to_folder_name}", request)
+        else:
+            request().execute()
+
+    def is_moving(self, file: dict) -> bool:
+        """ Whether the move of the file is still queued, see move_file. """
+        return file['id'] in self.batch
+
+    def after_move(self, file: dict, func, *args) -> None:
+        """ Runs func(*args) once the queued move of the file is done. """
+        self.batch.after(file['id'], func, *args)
+
+    def flush_moves(self) -> int:
+        """
+        Sends the queued moves through the batch endpoint.
+        :return: Amount of files that were not moved, they stay in their folder.
+        """
+        if not len(self.batch):
+            return 0
+        return len(self.batch.execute())
 
     def create_csv_in_drive(self, csv_to_dict, filename, folder_name, filter='') -> None:
         """
         Create a csv file in Google Drive considering the errors detected in the previous process.
+        The rows are written straight into the uploaded content, see UploadManager.upload_rows.
         :param csv_to_dict: Csv2Dict
         :param filename: Name of the file.
         :param folder_name: Name of the folder where the file will be placed.
@@ -197,31 +266,15 @@ class GDriveHandler:
         :return:
         """
         folder_id = self.get_folder_id_by_name(folder_name)
-        rows = []
-        for k, v in csv_to_dict.data.items():
-            if filter == 'error' and k in csv_to_dict.errs or 'sin' in k:
-                rows.extend(v['csv'])
-            elif filter == '':
-                rows.extend(v['csv'])
-        if rows:
-            fieldnames = rows[0].keys()
-            with tempfile.NamedTemporaryFile(mode='w', delete=True) as temp_file:
-                writer = csv.DictWriter(temp_file, fieldnames=fieldnames, delimiter=';')
-                writer.writeheader()
-                writer.writerows(rows)
-
-                with open(temp_file.name, 'rb') as file:
-                    media = MediaIoBaseUpload(io.BytesIO(file.read()),
-                                              mimetype='text/csv', resumable=True)
-
-                file_metadata = {'name': filename, 'parents': [folder_id]}
-
-                file = self.service.files().create(body=file_metadata,
-                                                   media_body=media,
-                                                   fields='id').execute()
-                log.info(f"CSV {filename!r} creado en carpeta {folder_name!r} con ID: {file['id']}")
-
-    @retry(stop=stop_after_attempt(3), wait=wait_random(min=10, max=20))
+        rows = (
+            row
+            for k, v in csv_to_dict.data.items()
+            if filter == 'error' and k in csv_to_dict.errs or 'sin' in k or filter == ''
+            for row in v['csv']
+        )
+        if file_id := self.uploads.upload_rows(rows, filename, folder_id):
+            log.info(f"CSV {filename!r} creado en carpeta {folder_name!r} con ID: {file_id}")
+
     def prepare_and_send_csv(self, path_csv, filename, folder_name) -> None:
         """
         From a filepath, it sends the file to Google Drive.
@@ -230,40 +283,37 @@ class GDriveHandler:
         :param folder_name: Name of the folder where the file will be placed.
         :return:
         """
-        log.info(f"Preparando envio de csv para GDrive de {filename!r}")
-        folder_id = self.get_folder_id_by_name(folder_name)
-        file_metadata = {'name': filename, 'parents': [folder_id]}
-        media = MediaFileUpload(path_csv, mimetype='text/plain')
-        file = self.send_csv(file_metadata, media)
-        log.info(f"CSV {filename!r} creado en carpeta {folder_name!r}")
-
-    def send_csv(self, file_metadata, media):
-        """Try to create a file in Google Drive.
-        In case of error, it will wait for three intervals (56, 111, 167) of seconds.
+        self.send_csvs([(path_csv, filename, folder_name)])
+
+    def send_csvs(self, files: list) -> None:
         """
-        fibonacci_sequence = get_fibonacci_sequence(NUMBER_OF_ATTEMPTS, 55)
-        for attempt in range(NUMBER_OF_ATTEMPTS):
-            try:
-                return self.service.files().create(body=file_metadata, media_body=media, fields='id').execute()
-            except HttpError as e:
-                log.error(f'ATTEMPT#{attempt + 1} Error while fetching Google API (sync) -> {str(e)}')
-                time.sleep(fibonacci_sequence[attempt])
-                error = e
-
-            if attempt == NUMBER_OF_ATTEMPTS - 1:
-                raise error
-            time.sleep(fibonacci_sequence[attempt])
-
-    def detect_csv_encoding(self, file_id):
-        request = self.service.files().get_media(fileId=file_id)
-        response = request.execute()
+        Sends the files to Google Drive at the same time, see UploadManager.
+        :param files: [(path_csv, filename, folder_name), ...]
+        """
+        log.info(f"Preparando envio de csv para GDrive de {', '.join(repr(f[1]) for f in files)}")
+        self.uploads.upload_files([
+            (path_csv, filename, self.get_folder_id_by_name(folder_name))
+            for path_csv, filename, folder_name in files
+        ])
+        for _, filename, folder_name in files:
+            log.info(f"CSV {filename!r} creado en carpeta {folder_name!r}")
+
+    def detect_csv_encoding(self, file_id, head: bytes = None):
+        """
+        Detect the encoding of the csv using only its first HEAD_BYTES.
+        :param head: First bytes of the file, when not given only that chunk is downloaded.
+        """
+        if head is None:
+            request = self.service.files().get_media(fileId=file_id)
+            buffer = io.BytesIO()
+            MediaIoBaseDownload(buffer, request, chunksize=HEAD_BYTES).next_chunk()
+            head = buffer.getvalue()
 
-        content = response.decode('utf-8')  # Decode the content to a string
         detector = chardet.UniversalDetector()
 
         # Feed the content to the detector line by line
-        for line in content.splitlines():
-            detector.feed(line.encode('raw_unicode_escape'))
+        for line in head.splitlines():
+            detector.feed(line)
             if detector.done:
                 break
 
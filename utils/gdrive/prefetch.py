@@ -0,0 +1,76 @@
+"""
+Descarga de los próximos csv del drive mientras el archivo actual pasa por
+el pipeline, así la descarga se solapa con la conversión, la BD y SAP.
+
+El Prefetcher mantiene hasta settings.DRIVE_PREFETCH archivos adelantados,
+descargados uno tras otro en un hilo con su propio GDriveHandler, sin pasar
+de settings.DRIVE_PREFETCH_MAX_BYTES según el tamaño reportado por el drive.
+Los archivos son entregados en el mismo orden en que fueron detectados
+(createdTime ascendente), Parser.process_drive_files sigue procesando uno
+a la vez. Para además convertirlos por adelantado ver utils.conversion.
+"""
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from core.settings import logger as log
+from utils.gdrive.cache import version_of
+
+
+class Prefetcher:
+
+    def __init__(self, module_name: str, files: list, ahead: int, max_bytes: int, make_drive: Callable):
+        """
+        :param files: Archivos que serán leídos, en el orden en que serán procesados.
+        :param make_drive: Crea el GDriveHandler del hilo, GDriveHandler no es thread-safe.
+        """
+        self.module_name = module_name
+        self.pending = deque(files)
+        self.futures = {}  # {file_id: (size, future)}
+        self.ahead = ahead
+        self.max_bytes = max_bytes
+        self.buffered = 0  # Bytes de los archivos adelantados que aún no fueron entregados
+        self.make_drive = make_drive
+        self.drive = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'{module_name}-prefetch')
+        log.info(f"[{module_name}] Descargando por adelantado hasta {ahead} de {len(files)} archivos")
+        self.fill()
+
+    def fill(self) -> None:
+        while self.pending and len(self.futures) < self.ahead:
+            size = int(self.pending[0].get('size') or 0)
+            if self.futures and self.buffered + size > self.max_bytes:
+                break
+            file = self.pending.popleft()
+            self.buffered += size
+            self.futures[file['id']] = size, self.executor.submit(self.download, file)
+
+    def download(self, file: dict):
+        self.drive = self.drive or self.make_drive()
+        return self.drive.read_csv_file_by_id(file['id'], version_of(file))
+
+    def get(self, file: dict):
+        """
+        Espera la descarga del archivo.
+        :return: CsvRowReader, o None caso no haya sido adelantado o la descarga falle,
+                 entonces quien llama lo descarga.
+        """
+        if (entry := self.futures.pop(file['id'], None)) is None:
+            return None
+        size, future = entry
+        self.buffered -= size
+        self.fill()
+        try:
+            return future.result()
+        except Exception as e:
+            log.warning(f"[{self.module_name}] Descarga adelantada de {file['name']!r} falló: {e!r}")
+            return None
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,46 @@
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+
+class DriveStats:
+    """
+    Consultas al drive hechas para descubrir archivos y segundos que tomaron,
+    por tipo, desde el último reset. medisap y migrasap las reportan por ciclo.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = Counter()
+        self.seconds = Counter()
+
+    @contextmanager
+    def measure(self, kind: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.calls[kind] += 1
+                self.seconds[kind] += time.perf_counter() - start
+
+    def reset(self) -> None:
+        with self.lock:
+            self.calls.clear()
+            self.seconds.clear()
+
+    def summary(self) -> str:
+        """
+        >>> stats = DriveStats()
+        >>> stats.summary()
+        '0 consultas'
+        """
+        with self.lock:
+            total = sum(self.calls.values())
+            detail = ', '.join(f"{kind}={n} ({self.seconds[kind]:.2f}s)" for kind, n in self.calls.most_common())
+            seconds = sum(self.seconds.values())
+        return f"{total} consultas en {seconds:.2f}s: {detail}" if total else '0 consultas'
+
+
+drive_stats = DriveStats()
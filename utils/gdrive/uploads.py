@@ -0,0 +1,131 @@
+import csv
+import io
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, List, Sequence, Tuple
+
+import httplib2
+from django.conf import settings
+from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaFileUpload, MediaIoBaseUpload, MediaUpload
+
+from core.settings import logger as log
+from utils.resources import format_number as fn, get_fibonacci_sequence
+
+NUMBER_OF_ATTEMPTS = 7
+# Status with which Google Drive answers when the upload session no longer exists
+EXPIRED_SESSION = (404, 410)
+
+
+class UploadManager:
+    """
+    Uploads files to Google Drive using resumable uploads in chunks of
+    settings.DRIVE_UPLOAD_CHUNK_BYTES, up to settings.DRIVE_UPLOAD_WORKERS
+    at the same time.
+    When a chunk fails, the upload is resumed from the last byte received
+    by Google Drive instead of being restarted. Files already uploaded by
+    this manager are not uploaded again, e.g. when the caller retries.
+    """
+
+    def __init__(self, creds):
+        self.creds = creds
+        self.local = threading.local()  # googleapiclient is not thread-safe, one service per thread
+        self.executor = None
+        self.lock = threading.Lock()
+        self.done = {}  # {(folder_id, filename, path, size, mtime): file_id}
+
+    def service(self):
+        if getattr(self.local, 'service', None) is None:
+            self.local.service = build('drive', 'v3', credentials=self.creds)
+        return self.local.service
+
+    def upload(self, media: MediaUpload, filename: str, folder_id: str) -> str:
+        """
+        Creates the file in the folder sending media chunk by chunk.
+        In case of error, it waits (55, 56, 111, ...) seconds and resumes the upload.
+        :return: Id of the created file.
+        """
+        metadata = {'name': filename, 'parents': [folder_id]}
+        request = self.service().files().create(body=metadata, media_body=media, fields='id')
+        wait = get_fibonacci_sequence(NUMBER_OF_ATTEMPTS, 55)
+        response, attempt = None, 0
+        while response is None:
+            try:
+                status, response = request.next_chunk()
+            except (HttpError, httplib2.HttpLib2Error, OSError) as e:
+                if attempt == NUMBER_OF_ATTEMPTS - 1:
+                    raise
+                log.error(f'ATTEMPT#{attempt + 1} Error subiendo {filename!r} a Google Drive -> {e}')
+                if isinstance(e, HttpError) and e.resp.status in EXPIRED_SESSION:
+                    log.warning(f"Sesión de subida de {filename!r} expiró, iniciando de nuevo")
+                    request = self.service().files().create(body=metadata, media_body=media, fields='id')
+                time.sleep(wait[attempt])
+                attempt += 1
+            else:
+                if status and media.size() > media.chunksize():
+                    log.info(f"{filename!r} {fn(status.resumable_progress)} de {fn(status.total_size)} bytes subidos")
+        return response['id']
+
+    def upload_file(self, path: str, filename: str, folder_id: str) -> str:
+        stat = os.stat(path)
+        key = (folder_id, filename, str(path), stat.st_size, stat.st_mtime_ns)
+        if file_id := self.done.get(key):
+            log.info(f"CSV {filename!r} ya había sido subido con ID: {file_id}")
+            return file_id
+        media = MediaFileUpload(path, mimetype='text/plain', chunksize=settings.DRIVE_UPLOAD_CHUNK_BYTES,
+                                resumable=True)
+        self.done[key] = self.upload(media, filename, folder_id)
+        return self.done[key]
+
+    def upload_files(self, files: Sequence[Tuple[str, str, str]]) -> List[str]:
+        """
+        Uploads at the same time the files received.
+        :param files: [(path, filename, folder_id), ...]
+        :return: Ids of the created files, in the same order. If an upload
+                 fails, the others finish and its error is raised.
+        """
+        if len(files) < 2 or settings.DRIVE_UPLOAD_WORKERS < 2:
+            return [self.upload_file(*file) for file in files]
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=settings.DRIVE_UPLOAD_WORKERS,
+                                                   thread_name_prefix='drive-upload')
+        futures = [self.executor.submit(self.upload_file, *file) for file in files]
+        errors = [e for e in (future.exception() for future in futures) if e]
+        if errors:
+            raise errors[0]
+        return [future.result() for future in futures]
+
+    def upload_rows(self, rows: Iterable, filename: str, folder_id: str) -> str:
+        """
+        Writes the rows as a csv into a SpooledTemporaryFile that is uploaded
+        in chunks. It stays in memory up to one chunk, bigger csv go to disk.
+        The header is the keys of the first row.
+        :return: Id of the created file or '' when there are no rows.
+        """
+        with tempfile.SpooledTemporaryFile(max_size=settings.DRIVE_UPLOAD_CHUNK_BYTES) as buffer:
+            text = io.TextIOWrapper(buffer, encoding='utf-8', newline='', write_through=True)
+            writer = None
+            for row in rows:
+                if writer is None:
+                    writer = csv.DictWriter(text, fieldnames=list(row.keys()), delimiter=';')
+                    writer.writeheader()
+                writer.writerow(row)
+            text.detach()  # Keeps the buffer open
+            if writer is None:
+                return ''
+            buffer.seek(0)
+            media = MediaIoBaseUpload(buffer, mimetype='text/csv', chunksize=settings.DRIVE_UPLOAD_CHUNK_BYTES,
+                                      resumable=True)
+            return self.upload(media, filename, folder_id)
+
+    def close(self) -> None:
+        """ Shuts down the upload threads, a later upload_files starts them again. """
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
@@ -1,10 +1,34 @@
-from typing import List
-from base.models import RegistroMigracion, PayloadMigracion
+import io
+import json
+from datetime import datetime, timedelta
+from itertools import islice
+from typing import Iterator, List
+
+from django.conf import settings
+from django.db import connection, models, transaction
+from django.db.models import Count, Max, Q
+
+from base.models import RegistroMigracion, PayloadMigracion, PayloadArchivo
 from utils.converters import Csv2Dict
 from utils.decorators import not_on_debug
+from utils.rows import rows_as_dicts
 from core.settings import logger as log
 
 
+COPY_NULL = r'\N'  # Marcador de NULL en el csv enviado a COPY
+
+
+def copy_line(values) -> str:
+    """
+    Línea del csv enviado a COPY. Los valores van entre comillas para que los
+    textos vacíos no sean tomados como NULL, y None va como COPY_NULL sin
+    comillas, que es la única forma en que COPY lo lee como NULL.
+    """
+    return ','.join(
+        COPY_NULL if value is None else '"{}"'.format(str(value).replace('"', '""')) for value in values
+    ) + '\n'
+
+
 class DBHandler:
 
     def __init__(self, migracion_id, module_name, pk):
@@ -13,26 +37,75 @@ class DBHandler:
         self.ref = pk
         self.fname = ''
         self.records = None  # QuerySet
+        self.pks = {}  # {valor_documento: id} de los PayloadMigracion guardados
 
-    def process(self, csvtodict: Csv2Dict):
+    def process(self, csvtodict: Csv2Dict) -> dict:
+        """
+        Guarda los payloads del archivo en la BD, por partes de
+        settings.DB_BULK_CHUNK documentos. En Postgres usa COPY y en
+        otras BD bulk_create.
+        :return: Diccionario {valor_documento: id} con los registros guardados.
+        """
         log.info(f'[{self.mname}] guardando {len(csvtodict.data)} payloads en db')
-        objs = self.create_objects(csvtodict)
+        self.pks = {}
         try:
-            PayloadMigracion.objects.bulk_create(objs)
-            self.records = PayloadMigracion.objects.filter(id__in=[p.id for p in objs])
+            with transaction.atomic():
+                if connection.vendor == 'postgresql':
+                    self.copy_objects(csvtodict)
+                else:
+                    self.bulk_create_objects(csvtodict)
+            if len(self.pks) < len(csvtodict.data):
+                # COPY y algunas BD no retornan los ids insertados
+                self.pks = dict(self.saved_records().values_list('valor_documento', 'id'))
+            self.records = self.saved_records()
         except Exception as e:
             log.error(f"Error {e} al guardar en db")
             raise
         else:
-            log.info(f'[{self.mname}] {len(self.records)} payloads de archivo {self.mname} guardados en db')
+            log.info(f'[{self.mname}] {len(self.pks)} payloads de archivo {self.mname} guardados en db')
+        return self.pks
+
+    def saved_records(self):
+        return PayloadMigracion.objects.filter(nombre_archivo=self.fname, modulo=self.mname)
+
+    def bulk_create_objects(self, info: Csv2Dict) -> None:
+        objs = self.iter_objects(info)
+        while batch := list(islice(objs, settings.DB_BULK_CHUNK)):
+            PayloadMigracion.objects.bulk_create(batch)
+            self.pks.update((p.valor_documento, p.id) for p in batch if p.id is not None)
+
+    def copy_objects(self, info: Csv2Dict) -> None:
+        """ Inserta los registros con COPY ... FROM STDIN, enviando un csv por cada parte. """
+        fields = [f for f in PayloadMigracion._meta.concrete_fields if not f.primary_key]
+        sql = "COPY {} ({}) FROM STDIN WITH (FORMAT csv, NULL '{}')".format(
+            connection.ops.quote_name(PayloadMigracion._meta.db_table),
+            ', '.join(connection.ops.quote_name(f.column) for f in fields),
+            COPY_NULL
+        )
+        objs = self.iter_objects(info)
+        with connection.cursor() as cursor:
+            while batch := list(islice(objs, settings.DB_BULK_CHUNK)):
+                buffer = io.StringIO()
+                for obj in batch:
+                    buffer.write(copy_line(self.copy_value(f, f.pre_save(obj, add=True)) for f in fields))
+                buffer.seek(0)
+                cursor.cursor.copy_expert(sql, buffer)
+
+    @staticmethod
+    def copy_value(field, value):
+        if isinstance(field, models.JSONField):
+            return json.dumps(field.get_prep_value(value), cls=field.encoder)
+        return field.get_db_prep_save(value, connection)
 
     def create_objects(self, info: Csv2Dict) -> List[PayloadMigracion]:
         """Crea los PayloadMigracion con base en los payloads
         procesados previamente por ProcessCSV. """
-        res = []
+        return list(self.iter_objects(info))
+
+    def iter_objects(self, info: Csv2Dict) -> Iterator[PayloadMigracion]:
         for k in info.data:
-            payload = PayloadMigracion(
-                status=info.data[k]['csv'][0]['Status'],
+            yield PayloadMigracion(
+                status=str(info.data[k]['csv'][0]['Status']),
                 migracion_id=self.mig,
                 modulo=self.mname,
                 ref_documento=self.ref,
@@ -40,10 +113,144 @@ class DBHandler:
                 nombre_archivo=self.fname,
                 cantidad_lineas_documento=len(info.data[k]['csv']),
                 payload=info.data[k]['json'],
-                lineas=info.data[k]['csv'],
+                lineas=rows_as_dicts(info.data[k]['csv']),
             )
-            res.append(payload)
-        return res
+
+
+def pending_payloads():
+    """ Payloads sin error que faltan por enviar a SAP y que no están en manos de otro worker. """
+    stale = datetime.now() - timedelta(minutes=settings.SAP_CLAIM_TIMEOUT)
+    return PayloadMigracion.objects.filter(
+        Q(reclamado_por='') | Q(reclamado_en__lt=stale),
+        enviado_a_sap=False, status='',
+    )
+
+
+def claim_payloads(worker: str, limit: int, modulos=()) -> List[int]:
+    """
+    Reclama para el worker hasta `limit` payloads pendientes de un mismo modulo,
+    empezando por los más antiguos. En Postgres usa SELECT ... FOR UPDATE SKIP LOCKED
+    para que varios workers no tomen los mismos registros; además el UPDATE vuelve a
+    filtrar por pendientes, así que en BD sin SKIP LOCKED (sqlite) tampoco se repiten.
+    :return: ids de los payloads reclamados.
+    """
+    with transaction.atomic():
+        qs = pending_payloads()
+        if modulos:
+            qs = qs.filter(modulo__in=modulos)
+        if connection.features.has_select_for_update_skip_locked:
+            qs = qs.select_for_update(skip_locked=True)
+        if not (first := qs.order_by('id').values_list('modulo', flat=True).first()):
+            return []
+        ids = list(qs.filter(modulo=first).order_by('id').values_list('id', flat=True)[:limit])
+        now = datetime.now()
+        pending_payloads().filter(id__in=ids).update(reclamado_por=worker, reclamado_en=now)
+    return list(PayloadMigracion.objects.filter(id__in=ids, reclamado_por=worker, reclamado_en=now)
+                .order_by('id').values_list('id', flat=True))
+
+
+def renew_claim(worker: str, ids: List[int]) -> List[int]:
+    """
+    Renueva reclamado_en de los payloads que siguen reclamados por el worker,
+    para que no sean tomados por otro mientras son enviados a SAP.
+    :return: ids que siguen siendo del worker, los demás no deben ser enviados.
+    """
+    now = datetime.now()
+    PayloadMigracion.objects.filter(id__in=ids, reclamado_por=worker, enviado_a_sap=False).update(reclamado_en=now)
+    return list(PayloadMigracion.objects.filter(id__in=ids, reclamado_por=worker, reclamado_en=now)
+                .order_by('id').values_list('id', flat=True))
+
+
+def release_payloads(worker: str, ids: List[int]) -> None:
+    """
+    Devuelve a la cola los payloads que no pudieron ser enviados. Solamente
+    los que siguen reclamados por el worker: caso el reclamo haya vencido
+    (SAP_CLAIM_TIMEOUT) y otro worker los haya tomado, no se le quitan.
+    """
+    PayloadMigracion.objects.filter(id__in=ids, reclamado_por=worker, enviado_a_sap=False).update(
+        reclamado_por='', reclamado_en=None
+    )
+
+
+def delete_file_payloads(filename: str, modulo: str) -> int:
+    """
+    Elimina los payloads de un archivo con un solo DELETE, sin cargar las
+    filas en memoria como lo hace QuerySet.delete().
+    :return: Cantidad de payloads eliminados.
+    """
+    qn = connection.ops.quote_name
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {qn(PayloadMigracion._meta.db_table)} "
+            f"WHERE {qn('nombre_archivo')} = %s AND {qn('modulo')} = %s",
+            [filename, modulo]
+        )
+        return cursor.rowcount
+
+
+def archivable_files(days: int):
+    """
+    Archivos con todos sus payloads enviados a SAP y sin cambios en los
+    últimos `days` días.
+    :return: QuerySet de dicts con modulo, nombre_archivo, documentos y ultimo.
+    """
+    cutoff = datetime.now() - timedelta(days=days)
+    return (PayloadMigracion.objects.values('modulo', 'nombre_archivo')
+            .annotate(documentos=Count('id'), pendientes=Count('id', filter=Q(enviado_a_sap=False)),
+                      ultimo=Max('actualizado'))
+            .filter(pendientes=0, ultimo__lt=cutoff)
+            .order_by('ultimo'))
+
+
+def archive_files(modulo: str, nombres: List[str]) -> int:
+    """
+    Mueve en bloque los payloads de los archivos recibidos de un modulo a
+    sap_payloads_archivo. En Postgres es una sola sentencia
+    (WITH ... DELETE ... RETURNING ... INSERT), en otras BD un
+    INSERT ... SELECT y un DELETE en la misma transacción.
+    :return: Cantidad de payloads archivados.
+    """
+    qn = connection.ops.quote_name
+    hot, archive = PayloadMigracion._meta.db_table, PayloadArchivo._meta.db_table
+    fields = [f for f in PayloadArchivo._meta.concrete_fields if f.name != 'archivado']
+    target = ', '.join(qn(f.column) for f in fields + [PayloadArchivo._meta.get_field('archivado')])
+    source = ', '.join(qn(PayloadMigracion._meta.get_field(f.name).column) for f in fields)
+    where = f"{qn('modulo')} = %s AND {qn('nombre_archivo')} IN ({', '.join(['%s'] * len(nombres))})"
+    params = [modulo, *nombres]
+    with transaction.atomic(), connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                f"WITH moved AS (DELETE FROM {qn(hot)} WHERE {where} RETURNING {source}) "
+                f"INSERT INTO {qn(archive)} ({target}) SELECT {source}, %s FROM moved",
+                params + [datetime.now()]
+            )
+            return cursor.rowcount
+        cursor.execute(
+            f"INSERT INTO {qn(archive)} ({target}) SELECT {source}, %s FROM {qn(hot)} WHERE {where}",
+            [datetime.now()] + params
+        )
+        cursor.execute(f"DELETE FROM {qn(hot)} WHERE {where}", params)
+        return cursor.rowcount
+
+
+def archived_files(modulo: str, nombres: List[str]) -> set:
+    """
+    Nombres de los archivos recibidos que ya están en sap_payloads_archivo,
+    es decir que ya fueron procesados y no deben ser leídos de nuevo.
+    """
+    return set(PayloadArchivo.objects.filter(modulo=modulo, nombre_archivo__in=nombres)
+               .values_list('nombre_archivo', flat=True).distinct())
+
+
+def archived_before(days: int):
+    """ Payloads de sap_payloads_archivo archivados hace más de `days` días. """
+    return PayloadArchivo.objects.filter(archivado__lt=datetime.now() - timedelta(days=days))
+
+
+def purge_archive(days: int) -> int:
+    """ Elimina de sap_payloads_archivo los payloads archivados hace más de `days` días. """
+    deleted, _ = archived_before(days).delete()
+    return deleted
 
 
 @not_on_debug
@@ -102,6 +309,12 @@ def update_estado_finalizado(migracion_id: int) -> None:
     update_estado(migracion, 'finalizado')
 
 
+@not_on_debug
+def update_tiempos_modulos(migracion_id: int, tiempos: dict) -> None:
+    """ Guarda cuántos segundos tardó cada modulo en la migración. """
+    RegistroMigracion.objects.filter(id=migracion_id).update(tiempos_modulos=tiempos)
+
+
 def del_registro_migracion(migracion_id: int) -> None:
     log.debug(f'excluyendo migración #{migracion_id}')
     RegistroMigracion.objects.get(id=migracion_id).delete()
@@ -10,6 +10,7 @@ from django.utils.safestring import SafeString
 
 from core import settings
 from core.settings import BASE_DIR, logger
+from utils.packer import AttachmentPacker
 from utils.resources import datetime_str, moment, beautify_name
 
 
@@ -75,42 +76,43 @@ class EmailModule:
         self.html_content = None
         self.make_html_content()
 
-    def prepare_email(self):
+    def prepare_email(self, attachs=None, part=1, parts=1):
         """
         Crea clase EmailMessage basado en atributos de la instancia y adjunta
-        los archivos que tenga el atributo self.attachs
+        los archivos recibidos, o los del atributo self.attachs.
         :return: Instancia de clase lista para que sea enviado el e-mail.
         """
+        subject = self.subject if parts == 1 else f"{self.subject} (parte {part} de {parts})"
         self.email = EmailMessage(
-            self.subject, self.html_content, to=self.destinatary, bcc=self.copia_oculta,
+            subject, self.html_content, to=self.destinatary, bcc=self.copia_oculta,
             from_email=f"Logs de Migración <{settings.EMAIL_HOST_USER}>"
         )
         self.email.content_subtype = "html"
-        size = 0
-        for attachment in self.attachs:
+        for attachment in self.attachs if attachs is None else attachs:
             logger.info(f"Adjuntando {attachment}")
-            size += Path(attachment).stat().st_size
-            if size <= 25_000_000:
-                self.attach_file(attachment)
-            else:
-                logger.warning(f"No fue posible adjuntar {attachment} por su peso")
+            self.attach_file(attachment)
 
     def send(self):
         """
+        Comprime los adjuntos y, caso no quepan en un solo e-mail,
+        envia un e-mail por cada grupo de adjuntos (ver AttachmentPacker).
+
         from django.core.mail import EmailMessage
 
         email = EmailMessage( "Hello", "Body goes here", "alfareiza@gmail.com", ["alfareiza@gmail.com"])
         """
-        self.prepare_email()
-        try:
-            if r := self.email.send(fail_silently=False):
-                logger.info(f'Reporte de e-mail enviado referente al archivo {self.module.filepath}')
-            else:
-                logger.warning(f'E-mail no enviado referente al archivo {self.module.filepath}')
-        except SMTPSenderRefused as e:
-            logger.warning(f'E-mail no enviado porque {e}')
-        except Exception as e:
-            logger.warning(f'E-mail no enviado. Error={e}')
+        groups = AttachmentPacker(self.attachs, settings.EMAIL_ATTACHMENTS_MAX_BYTES).pack() or [[]]
+        for part, attachs in enumerate(groups, 1):
+            self.prepare_email(attachs, part, len(groups))
+            try:
+                if r := self.email.send(fail_silently=False):
+                    logger.info(f'Reporte de e-mail enviado referente al archivo {self.module.filepath}')
+                else:
+                    logger.warning(f'E-mail no enviado referente al archivo {self.module.filepath}')
+            except SMTPSenderRefused as e:
+                logger.warning(f'E-mail no enviado porque {e}')
+            except Exception as e:
+                logger.warning(f'E-mail no enviado. Error={e}')
 
     def attach_file(self, filepath):
         self.email.attach_file(str(filepath))
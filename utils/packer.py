@@ -0,0 +1,133 @@
+import gzip
+import hashlib
+import shutil
+from pathlib import Path
+from typing import List
+
+from core.settings import logger as log
+from utils.resources import format_number as fn
+
+# Archivos que ya están comprimidos y son adjuntados como vienen.
+COMPRESSED_SUFFIXES = ('.gz', '.zip')
+
+
+class AttachmentPacker:
+    """
+    Prepara los archivos exportados para ser enviados por e-mail:
+        1. Comprime con gzip los que no estén comprimidos. Caso el archivo no
+           haya cambiado desde la última vez (mismo sha256), reutiliza el .gz.
+        2. Caso el .gz de un csv aún pese más que max_bytes, divide el csv por
+           filas en archivo.part1.csv.gz, archivo.part2.csv.gz, ..., cada uno
+           un .gz válido con el encabezado, así cada e-mail se abre por separado.
+        3. Agrupa los archivos resultantes en grupos de hasta max_bytes,
+           uno por e-mail.
+    """
+
+    def __init__(self, paths: List[str], max_bytes: int):
+        self.paths = [Path(path) for path in paths]
+        self.max_bytes = max_bytes
+
+    def pack(self) -> List[List[str]]:
+        """ :return: Grupos de archivos, cada grupo cabe en un e-mail. """
+        files = []
+        for path in self.paths:
+            if not path.exists():
+                log.warning(f"No fue posible adjuntar {path}, archivo no existe")
+                continue
+            files.extend(self.split(path, self.compress(path)))
+        return self.group(files)
+
+    def compress(self, path: Path) -> Path:
+        if path.suffix in COMPRESSED_SUFFIXES:
+            return path
+        target = path.with_name(f"{path.name}.gz")
+        digest_path = path.with_name(f"{path.name}.gz.sha256")
+        digest = self.sha256(path)
+        if target.exists() and digest_path.exists() and digest_path.read_text() == digest:
+            log.info(f"{target.name} sin cambios, no será comprimido de nuevo")
+        else:
+            with open(path, 'rb') as src, gzip.open(target, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            digest_path.write_text(digest)
+        size, compressed = path.stat().st_size, target.stat().st_size
+        log.info(f"{path.name} comprimido: {fn(size)} -> {fn(compressed)} bytes "
+                 f"({100 - compressed * 100 / size if size else 0:.1f}% menos)")
+        return target
+
+    def split(self, source: Path, path: Path) -> List[Path]:
+        """
+        Divide el csv por filas en partes comprimidas de hasta max_bytes.
+        :param source: Archivo original.
+        :param path: source comprimido, ver compress.
+        """
+        if path.stat().st_size <= self.max_bytes:
+            return [path]
+        if source.suffix != '.csv':
+            log.warning(f"{path.name} pesa más de {fn(self.max_bytes)} bytes y no será adjuntado")
+            return []
+        stem = source.name[:-len(source.suffix)]
+        for old in source.parent.glob(f"{stem}.part*.csv.gz"):
+            old.unlink()
+        # Bytes de filas por parte, estimados con la compresión del archivo completo y con margen
+        target = max(int(self.max_bytes * source.stat().st_size / path.stat().st_size * 0.9), 1)
+        blobs = []
+        with open(source, 'rb') as src:
+            records = self.records(src)
+            header, rows, size = next(records, b''), [], 0
+            for row in records:
+                rows.append(row)
+                size += len(row)
+                if size >= target:
+                    blobs.extend(self.compress_rows(header, rows))
+                    rows, size = [], 0
+            if rows:
+                blobs.extend(self.compress_rows(header, rows))
+        parts = []
+        for blob in blobs:
+            parts.append(source.with_name(f"{stem}.part{len(parts) + 1}.csv.gz"))
+            parts[-1].write_bytes(blob)
+        log.info(f"{source.name} dividido en {len(parts)} partes de hasta {fn(self.max_bytes)} bytes")
+        return parts
+
+    def compress_rows(self, header: bytes, rows: List[bytes]) -> List[bytes]:
+        """ Comprime el encabezado con las filas, dividiéndolas a la mitad mientras pasen de max_bytes. """
+        blob = gzip.compress(header + b''.join(rows))
+        if len(blob) <= self.max_bytes or len(rows) == 1:
+            if len(blob) > self.max_bytes:
+                log.warning(f"Fila de {fn(len(rows[0]))} bytes no cabe en {fn(self.max_bytes)} bytes")
+            return [blob]
+        half = len(rows) // 2
+        return self.compress_rows(header, rows[:half]) + self.compress_rows(header, rows[half:])
+
+    @staticmethod
+    def records(src):
+        """ Filas del csv en bytes, una fila puede ocupar varias lineas si tiene saltos entre comillas. """
+        record, quotes = b'', 0
+        for line in src:
+            record += line
+            quotes += line.count(b'"')
+            if quotes % 2 == 0:
+                yield record
+                record, quotes = b'', 0
+        if record:
+            yield record
+
+    def group(self, files: List[Path]) -> List[List[str]]:
+        """ Agrupa los archivos en el orden recibido sin pasar de max_bytes por grupo. """
+        groups, size = [], 0
+        for file in files:
+            file_size = file.stat().st_size
+            if not groups or size + file_size > self.max_bytes:
+                groups.append([])
+                size = 0
+            groups[-1].append(str(file))
+            size += file_size
+        return groups
+
+    @staticmethod
+    def sha256(path: Path) -> str:
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            while chunk := f.read(1 << 20):
+                h.update(chunk)
+        return h.hexdigest()
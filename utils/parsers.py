@@ -1,23 +1,31 @@
-import csv
-import logging
 import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
 from pathlib import Path, PosixPath
 from typing import Optional
 
 from googleapiclient.errors import HttpError
 from django.conf import settings
+from django.db import connections
+from django.utils import timezone
 
 from base.exceptions import RetryMaxException
 from base.models import PayloadMigracion
-from core.settings import logger as log, BASE_DIR, SAP_URL, ch, formatter
+from core.settings import logger as log, BASE_DIR, SAP_URL, log_context
+from utils.conversion import ConversionPool
 from utils.converters import Csv2Dict
 from utils.decorators import logtime
+from utils.reporting import REPORT_STEPS, reporter
 from utils.resources import format_number as fn
+from utils.rows import CsvRowReader
+from utils.gdrive.cache import version_of
+from utils.gdrive.changes import must_list, register_listing
 from utils.gdrive.handler_api import GDriveHandler
+from utils.gdrive.prefetch import Prefetcher
 from utils.interactor_db import (
     DBHandler,
+    archived_files,
     update_estado_error,
     update_estado_error_drive,
     update_estado_error_export,
@@ -142,6 +150,8 @@ class Parser:
     def __post_init__(self):
         self.pipeline = []
         self.output_filepath = BASE_DIR / f"{self.module.name}"
+        self.background = None  # ThreadPoolExecutor de las tareas enviadas con in_background
+        self.pending = []  # Futures de esas tareas
         self.set_pipeline()
 
         # Deprecated 20/Jan/24
@@ -171,15 +181,58 @@ class Parser:
         db = DBHandler(self.module.migracion_id, csv_to_dict.name, csv_to_dict.pk)
         sap = SAPConnect(self.module)
 
-        if isinstance(self.input, (str, PosixPath)):
-            db.fname = self.input.stem
-            self.run_filepath(csv_to_dict, db, sap)
+        try:
+            if isinstance(self.input, (str, PosixPath)):
+                db.fname = self.input.stem
+                self.run_filepath(csv_to_dict, db, sap)
 
-        elif isinstance(self.input, GDriveHandler):
-            self.run_drive(csv_to_dict, db, sap)
+            elif isinstance(self.input, GDriveHandler):
+                self.run_drive(csv_to_dict, db, sap)
+        finally:
+            self.wait_background()
 
         return csv_to_dict
 
+    def run_pipeline(self, csv_to_dict, **kwargs) -> None:
+        """
+        Ejecuta los pasos del pipeline sobre csv_to_dict.
+        Con settings.REPORT_ASYNC, desde el primer paso de reporte (Export o Mail)
+        en adelante son entregados al Reporter y el Parser sigue sin esperarlos.
+        """
+        # Rutas de los archivos creados por Export, para Mail (ver Export)
+        kwargs.setdefault('exported', {})
+        for i, self.proc in enumerate(self.pipeline):
+            if settings.REPORT_ASYNC and self.proc in REPORT_STEPS:
+                reporter.submit(self, self.pipeline[i:], csv_to_dict, kwargs)
+                return
+            self.proc().run(csv_to_dict=csv_to_dict, parser=self, **kwargs)
+            time.sleep(3)
+
+    def in_background(self, func, *args) -> None:
+        """ Ejecuta func en un hilo aparte, las tareas corren una tras otra en orden de llegada. """
+        def task():
+            try:
+                return func(*args)
+            finally:
+                connections.close_all()
+
+        if self.background is None:
+            self.background = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'{self.module.name}-bg')
+        self.pending.append(self.background.submit(task))
+
+    def wait_background(self) -> None:
+        """ Espera las tareas de in_background y relanza el primer error encontrado. """
+        if self.background is None:
+            return
+        self.background.shutdown(wait=True)
+        self.background = None
+        pending, self.pending = self.pending, []
+        errors = [e for e in (f.exception() for f in pending) if e]
+        for e in errors:
+            log.error(f"[{self.module.name}] Error {e!r} en tarea en segundo plano")
+        if errors:
+            raise errors[0]
+
     def run_filepath(self, csv_to_dict, db, sap):
         """Procesa el archivo cuando se recibe un csv local."""
         try:
@@ -191,11 +244,8 @@ class Parser:
 
             else:
                 with open(self.input, encoding='utf-8-sig') as csvf:
-                    csv_reader = csv.DictReader(csvf, delimiter=';')
-                    for self.proc in self.pipeline:
-                        self.proc().run(csv_to_dict=csv_to_dict, reader=csv_reader, db=db,
-                                        parser=self, filename=db.fname, sap=sap)
-                        time.sleep(3)
+                    csv_reader = CsvRowReader(csvf, delimiter=';')
+                    self.run_pipeline(csv_to_dict, reader=csv_reader, db=db, filename=db.fname, sap=sap)
             self.change_formatter_base()
         except Exception as e:
             update_estado_error(self.module.migracion_id)
@@ -211,6 +261,60 @@ class Parser:
         """Procesa el archivo cuando se recibe un GDriveHandler."""
         name_folder = self.folder_to_check()
         self.discover_files(name_folder)
+        pool = self.conversion_pool() or self.prefetcher()
+        try:
+            self.process_drive_files(csv_to_dict, db, sap, name_folder, pool)
+        finally:
+            if pool:
+                pool.close()
+            # Movimientos a _BackUp acumulados por Export con settings.DRIVE_BATCH_MOVES
+            if failed := self.input.flush_moves():
+                log.error(f"[{self.module.name}] {failed} archivo(s) no fueron movidos a {name_folder}_BackUp,"
+                          f" serán procesados de nuevo en la siguiente ejecución")
+            self.input.close()
+
+    def conversion_pool(self) -> Optional[ConversionPool]:
+        """
+        Caso settings.CONVERSION_WORKERS sea mayor a 1, crea el ConversionPool
+        con los archivos que serán leídos en la primera tanda.
+        """
+        if settings.CONVERSION_WORKERS < 2 or self.tanda != '1RA':
+            return None
+        to_convert = self.files_to_read()
+        if len(to_convert) < 2:
+            return None
+        pool = ConversionPool(self.module, to_convert, min(settings.CONVERSION_WORKERS, len(to_convert)))
+        if not pool.workers:
+            # Sin cupo en SAP_MAX_CONCURRENCY, ver ConversionPool
+            pool.close()
+            return None
+        return pool
+
+    def prefetcher(self) -> Optional[Prefetcher]:
+        """
+        Caso settings.DRIVE_PREFETCH sea mayor a 0, crea el Prefetcher con
+        los archivos que serán leídos en la primera tanda.
+        """
+        if settings.DRIVE_PREFETCH < 1 or self.tanda != '1RA':
+            return None
+        to_read = self.files_to_read()
+        if len(to_read) < 2:
+            return None
+        return Prefetcher(self.module.name, to_read, settings.DRIVE_PREFETCH, settings.DRIVE_PREFETCH_MAX_BYTES,
+                          make_drive=GDriveHandler)
+
+    def files_to_read(self) -> list:
+        """
+        Archivos del drive que aún no tienen registros en la BD ni fueron
+        archivados, en el orden en que serán procesados.
+        """
+        names = [file['name'][:-4] for file in self.input.files]
+        saved = set(PayloadMigracion.objects.filter(nombre_archivo__in=names, modulo=self.module.name)
+                    .values_list('nombre_archivo', flat=True))
+        saved |= archived_files(self.module.name, names)
+        return [file for file in self.input.files if file['name'][:-4] not in saved]
+
+    def process_drive_files(self, csv_to_dict, db, sap, name_folder, pool=None):
         for i, file in enumerate(self.input.files, 1):
             try:
                 records = PayloadMigracion.objects.filter(nombre_archivo=file['name'][:-4],
@@ -218,14 +322,18 @@ class Parser:
                 db.fname = file['name'][:-4]
                 self.change_formatter_custom_file(db.fname)
 
-                if not records and self.tanda == '1RA':
+                if not records and self.tanda == '1RA' and archived_files(self.module.name, [db.fname]):
+                    # Ya fue procesado, pero no alcanzó a ser movido a _BackUp
+                    log.warning(f"[{self.module.name}] archivo {db.fname} ya fue procesado y archivado,"
+                                f" no será leído de nuevo")
+                    self.input.move_file(file, f"{name_folder}_BackUp")
+                elif not records and self.tanda == '1RA':
                     log.info(f"[CSV] Leyendo {i} de {len(self.input.files)} {file['name']!r}")
-                    csv_reader = self.input.read_csv_file_by_id(file['id'])
-                    for self.proc in self.pipeline:
-                        self.proc().run(csv_to_dict=csv_to_dict, reader=csv_reader,
-                                        parser=self, sap=sap, file=file, db=db,
-                                        name_folder=name_folder, filename=db.fname)
-                        time.sleep(3)
+                    # ConversionPool o Prefetcher, caso el archivo haya sido adelantado
+                    csv_reader = ((pool and pool.get(file))
+                                  or self.input.read_csv_file_by_id(file['id'], version_of(file)))
+                    self.run_pipeline(csv_to_dict, reader=csv_reader, sap=sap, file=file, db=db,
+                                      name_folder=name_folder, filename=db.fname)
                     csv_to_dict.clear_data()
                 elif records:
                     self.existing_records(records, csv_to_dict, sap, db,
@@ -244,6 +352,11 @@ class Parser:
                 raise
 
     def existing_records(self, records, csv_to_dict, sap, db, file=None, name_folder=None):
+        if settings.SAP_WORKERS and records.filter(enviado_a_sap=False, status='').exists():
+            # Los workers de sapworker aún no terminan de enviar este archivo
+            log.info(f"[{self.module.name}] archivo {db.fname} con payloads en cola para SAP,"
+                     f" será procesado en la siguiente ejecución")
+            return
         # Si hay records del archivo y algunos no se han enviado a sap, entonces
         # Es por que se cayó la última migración
         db.records = records.filter(enviado_a_sap=False)
@@ -269,11 +382,8 @@ class Parser:
                  )
 
         # Ejecutará el pipeline desde el paso después de SaveInBD
-        for self.proc in self.pipeline:
-            self.proc().run(csv_to_dict=csv_to_dict, db=db, file=file, name_folder=name_folder,
-                            parser=self, filename=db.fname, sap=sap,
-                            payloads_previously_sent=already_sent)
-            time.sleep(3)
+        self.run_pipeline(csv_to_dict, db=db, file=file, name_folder=name_folder,
+                          filename=db.fname, sap=sap, payloads_previously_sent=already_sent)
         csv_to_dict.clear_data()
 
     def strategy_post_error(self, proc_name):
@@ -298,7 +408,14 @@ class Parser:
         """Busca los archivos en la carpeta {Modulo}Medicar y los carga
         en la variable self.input.files. Siendo esta una lista de diccionarios
         donde cada diccionario representa un archivo. El primero de la lista
-        es el archivo más viejo"""
+        es el archivo más viejo.
+        Con settings.DRIVE_CHANGES no lista la carpeta caso el feed de cambios
+        del drive indique que sigue vacía, ver utils.gdrive.changes."""
+        if not must_list(self.input, name_folder):
+            log.info(f'Sin csv nuevos en carpeta {name_folder!r} desde la última consulta')
+            self.input.files = []
+            return
+        started = timezone.now()
         try:
             files = self.input.get_files_in_folder_by_name(name_folder, ext='csv')
         except RetryMaxException:
@@ -312,6 +429,7 @@ class Parser:
                 log.info(f"Archivos reconocidos en carpeta {name_folder!r}:  "
                          f"{', '.join(list(map(lambda f: f['name'], files)))}")
             self.input.files = files
+            register_listing(name_folder, len(files), started)
 
     def folder_to_check(self) -> str:
         """Crea el nombre de la carpeta a ser buscada en Google Drive"""
@@ -324,11 +442,8 @@ class Parser:
         return f"{base_word}Medicar"
 
     def change_formatter_custom_file(self, filename):
-        ch.setFormatter(
-            logging.Formatter("%(asctime)s%(tanda)s%(namefile)s %(funcName)s %(levelname)s %(message)s",
-                              "[%d%b %H:%M:%S]",
-                              defaults={"tanda": f"[{self.tanda}]", "namefile": f"[{filename}.csv]"})
-        )
+        # Solamente en el hilo del modulo, ver LogContextFilter
+        log_context.prefix = f"[{self.tanda}][{filename}.csv]"
 
     def change_formatter_base(self):
-        ch.setFormatter(formatter)
+        log_context.prefix = ''
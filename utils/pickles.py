@@ -1,6 +1,7 @@
 import json
 import pickle
 from core.settings import logger as log
+from utils.rows import to_builtin
 
 
 def load_pkl(pkl_path):
@@ -11,7 +12,8 @@ def load_pkl(pkl_path):
 
 
 def get_json_from_pkl(pklpath, jsonfilepath=None):
-    """ Given a pickle file, create a json file with his content """
+    """ Given a pickle file, create a json file with his content.
+    Only for .pkl files exported before utils.snapshots, see get_json_from_snapshot. """
     source = load_pkl(pklpath)
 
     if not jsonfilepath:
@@ -19,7 +21,7 @@ def get_json_from_pkl(pklpath, jsonfilepath=None):
 
     with open(jsonfilepath, 'w', encoding='utf-8-sig') as jsonf:
         log.info(f'Creando archivo {jsonfilepath}')
-        jsonf.write(json.dumps(source.data, indent=4, ensure_ascii=False))
+        jsonf.write(json.dumps(source.data, indent=4, ensure_ascii=False, default=to_builtin))
         log.info(f'Archivo {jsonfilepath} creado con éxito!')
 
 
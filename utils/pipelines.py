@@ -1,11 +1,15 @@
-import csv
 import json
 import pickle
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
+from datetime import datetime
+from functools import partial, reduce
+from operator import or_
 from pathlib import Path
-from typing import Callable, NoReturn
+from typing import Callable
 
 from django.conf import settings
+from django.db.models import Q
 
 from base.exceptions import LoginNotSucceed
 from base.models import PayloadMigracion
@@ -24,12 +28,17 @@ from core.settings import (
     NOTAS_CREDITO_HEADER,
     PAGOS_RECIBIDOS_HEADER
 )
+from utils.conversion import ConvertedCSV
 from utils.converters import Csv2Dict
 from utils.decorators import once_in_interval
+from utils.exporters import write_csvs, write_jsonl
 from utils.gdrive.handler_api import GDriveHandler
+from utils.interactor_db import archive_files
 from utils.mail import EmailModule
 from utils.resources import set_filename, format_number as fn, login_check, build_new_documentlines, mix_documentlines, \
-    re_make_stock_transfer_lines_traslados
+    item_quantities, re_make_stock_transfer_lines_traslados
+from utils.rows import to_builtin
+from utils.snapshots import RunSnapshot
 from utils.sap.manager import SAPData
 from tenacity import retry, stop_after_attempt, wait_random, retry_if_exception_type
 
@@ -96,7 +105,11 @@ class ProcessCSV:
 
     @staticmethod
     def run(**kwargs):
-        kwargs['csv_to_dict'].process(kwargs['reader'])
+        if isinstance(reader := kwargs['reader'], ConvertedCSV):
+            # Convertido en otro proceso por utils.conversion.ConversionPool
+            reader.load_into(kwargs['csv_to_dict'])
+        else:
+            kwargs['csv_to_dict'].process(reader)
 
 
 class SaveInBD:
@@ -117,6 +130,9 @@ class ProcessSAP:
     @once_in_interval(2)
     def run(self, **kwargs):
         """Ejecuta SAPConnect.process()"""
+        if settings.SAP_WORKERS and kwargs['parser'].tanda == '1RA':
+            log.info('Envío a SAP a cargo de los workers de sapworker')
+            return
         if csvtodict := kwargs['csv_to_dict']:
             if csvtodict.succss:
                 # Estos son los pendientes por enviar
@@ -127,25 +143,39 @@ class ProcessSAP:
                     log.info(f'No hay payloads que enviar a sap')
 
         if kwargs.get('payloads_previously_sent'):
-            kwargs['csv_to_dict'].load_data_from_db(kwargs['payloads_previously_sent'])
             if kwargs['parser'].tanda == '2DA':
-                sap_errs = kwargs['payloads_previously_sent'].filter(status__icontains='[SAP]')
-                conn_errs = kwargs['payloads_previously_sent'].filter(status__icontains='[CONNECTION]')
-                timeout_errs = kwargs['payloads_previously_sent'].filter(status__icontains='[TIMEOUT]')
-
-                to_process = sap_errs | conn_errs | timeout_errs
-
-                # Solamente serán enviados a sap de nuevo los que tuvieron error en la primera tanda
-                kwargs['csv_to_dict'].succss = set(to_process.values_list('valor_documento', flat=True))
-                kwargs['csv_to_dict'].errs.clear()
+                self.resend_with_errors(kwargs['csv_to_dict'], kwargs['sap'], kwargs['filename'])
+            else:
+                kwargs['csv_to_dict'].load_data_from_db(kwargs['payloads_previously_sent'])
 
-                kwargs['sap'].process(kwargs['csv_to_dict'], to_process)
+    @staticmethod
+    def must_resend(record) -> bool:
+        """ Solamente son enviados a sap de nuevo los que tuvieron error de SAP o de conexión en la primera tanda """
+        status = record.status.upper()
+        return record.enviado_a_sap and any(tag in status for tag in ('[SAP]', '[CONNECTION]', '[TIMEOUT]'))
 
-                csvtodict.clear_data()
-                kwargs['csv_to_dict'].load_data_from_db(kwargs['db'].records)
-                final_records = PayloadMigracion.objects.filter(nombre_archivo=kwargs['filename'],
-                                                                modulo=kwargs['csv_to_dict'].name)
-                kwargs['csv_to_dict'].load_data_from_db(final_records)
+    def resend_with_errors(self, csv_to_dict, sap, filename):
+        """
+        Carga todos los registros del archivo en una sola consulta, reenvía a SAP
+        los que tuvieron error de SAP o de conexión y vuelve a cargar solamente
+        los que fueron actualizados en el reenvío.
+        """
+        records = PayloadMigracion.objects.filter(nombre_archivo=filename, modulo=csv_to_dict.name)
+        csv_to_dict.clear_data()
+        loaded = list(records)
+        csv_to_dict.load_data_from_db(loaded)
+        if not (to_resend := {record.valor_documento for record in loaded if self.must_resend(record)}):
+            return
+
+        succss, errs = csv_to_dict.succss, csv_to_dict.errs
+        csv_to_dict.succss, csv_to_dict.errs = to_resend, set()
+        start = datetime.now()
+        try:
+            sap.process(csv_to_dict, records)
+        finally:
+            csv_to_dict.succss, csv_to_dict.errs = succss, errs
+        # update_payloadmigracion guarda cada registro reenviado, lo que actualiza su fecha de actualizado
+        csv_to_dict.load_data_from_db(records.filter(actualizado__gte=start))
 
 
 class PreProcessSAP:
@@ -170,8 +200,7 @@ class PreProcessSAP:
         if kwargs.get('payloads_previously_sent') and kwargs['parser'].tanda == '2DA':
             if not self.client:
                 self.client = SAPData()
-            for desc in self.errors():
-                self.exec_strategy_error(desc, kwargs['payloads_previously_sent'], kwargs['parser'].module.name)
+            self.exec_strategies(kwargs['payloads_previously_sent'], kwargs['parser'].module.name)
 
             self.update_qs_payloads(kwargs)
         else:
@@ -191,28 +220,54 @@ class PreProcessSAP:
             enviado_a_sap=True
         )
 
-    def exec_strategy_error(self, type_sap_error: str, qs_payloads, module_name: str):
-        """ Ejecuta determinada lógica con base en los errores y modulos estbalecidos en el case. """
-        match type_sap_error, module_name:
-            case [self.OFFSET | self.EXCEED | self.COINCIDENCE, settings.FACTURACION_NAME]:
-                sap_errs = qs_payloads.filter(status__icontains=type_sap_error)
-                log.info(f"*** {len(sap_errs)} payloads con error {type_sap_error[6:]!r} en {settings.FACTURACION_NAME!r} ***")
-                self.handle_documentlines(self.client.get_dispensado, sap_errs, mix_documentlines)
-            case [_, settings.NOTAS_CREDITO_NAME]:
-                sap_errs = qs_payloads.filter(status__icontains=type_sap_error)
-                log.info(f"*** {len(sap_errs)} payloads con error {type_sap_error[6:]!r} en {settings.NOTAS_CREDITO_NAME!r} ***")
-                self.handle_documentlines(self.client.get_info_ssc, sap_errs, build_new_documentlines)
-            case [self.INEGATIVE, settings.TRASLADOS_NAME]:
-                sap_errs = qs_payloads.filter(status__icontains=type_sap_error)
-                log.info(f"*** {len(sap_errs)} payloads con error {type_sap_error[6:]!r} en {settings.TRASLADOS_NAME!r} ***")
-                self.handle_documentlines(self.client.get_info_ssc, sap_errs, re_make_stock_transfer_lines_traslados)
-
-    def handle_documentlines(self, client_get_data: Callable, records: 'QuerySet[PayloadMigracion]',
-                             func: Callable) -> NoReturn:
-        """ Altera el DocumentLines de los registros recibidos. """
+    def strategies(self, module_name: str) -> dict:
+        """
+        Errores tratados en el modulo y la estrategia de cada uno.
+        :return: {error: (función que consulta SAP, función que arma las nuevas lineas)}
+        """
+        match module_name:
+            case settings.FACTURACION_NAME:
+                strategy = (self.client.get_dispensado, mix_documentlines)
+                return dict.fromkeys((self.OFFSET, self.EXCEED, self.COINCIDENCE), strategy)
+            case settings.NOTAS_CREDITO_NAME:
+                return dict.fromkeys(self.errors(), (self.client.get_info_ssc, build_new_documentlines))
+            case settings.TRASLADOS_NAME:
+                return {self.INEGATIVE: (self.client.get_info_ssc, re_make_stock_transfer_lines_traslados)}
+        return {}
+
+    def exec_strategies(self, qs_payloads, module_name: str) -> None:
+        """
+        Consulta una sola vez los registros con alguno de los errores del modulo,
+        los separa en memoria según el primer error que tengan (en el orden de
+        self.errors()), ejecuta la estrategia de cada error y guarda todos los
+        payloads alterados en un solo bulk_update.
+        """
+        if not (strategies := self.strategies(module_name)):
+            return
+        buckets = {desc: [] for desc in strategies}
+        candidates = qs_payloads.filter(reduce(or_, (Q(status__icontains=desc) for desc in strategies)))
+        for record in candidates:
+            status = record.status.upper()
+            if desc := next((desc for desc in buckets if desc.upper() in status), None):
+                buckets[desc].append(record)
+
         to_update = []
+        for desc, records in buckets.items():
+            if records:
+                log.info(f"*** {len(records)} payloads con error {desc[6:]!r} en {module_name!r} ***")
+                client_get_data, func = strategies[desc]
+                to_update.extend(self.handle_documentlines(client_get_data, records, func))
+        if to_update:
+            PayloadMigracion.objects.bulk_update(to_update, fields=['payload'])
+
+    def handle_documentlines(self, client_get_data: Callable, records: 'list[PayloadMigracion]',
+                             func: Callable) -> list:
+        """ Altera el DocumentLines de los registros recibidos y retorna los que fueron alterados. """
+        to_update = []
+        sap_data = self.fetch_from_sap(client_get_data, [record.valor_documento for record in records
+                                                         if record.modulo != settings.TRASLADOS_NAME])
         for record in records:
-            if record.modulo != settings.TRASLADOS_NAME and (data_sap := client_get_data(record.valor_documento)):
+            if record.modulo != settings.TRASLADOS_NAME and (data_sap := sap_data.get(record.valor_documento)):
                 # log.debug(f'({record.valor_documento}) Cambiando DocumentLines')
                 if self.verify_quantities(data_sap, record.payload['DocumentLines']):
                     new_dl = func(data_sap, record.payload['DocumentLines'])
@@ -232,47 +287,39 @@ class PreProcessSAP:
                 record.payload = tmp_payload
                 to_update.append(record)
 
-        if to_update:
-            PayloadMigracion.objects.bulk_update(to_update, fields=['payload'])
-            to_update.clear()
+        return to_update
+
+    def fetch_from_sap(self, client_get_data: Callable, keys: list) -> dict:
+        """
+        Consulta en SAP la información de todos los documentos a la vez, con
+        hasta settings.SAP_MAX_CONCURRENCY peticiones simultáneas.
+        :return: {valor_documento: respuesta de client_get_data}
+        """
+        keys = list(dict.fromkeys(keys))
+        workers = min(settings.SAP_MAX_CONCURRENCY, len(keys))
+        if workers < 2:
+            return {key: client_get_data(key) for key in keys}
+        # Login antes de crear los hilos, para que no lo intenten todos a la vez
+        login_check(self.client)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='sap-consulta') as executor:
+            return dict(zip(keys, executor.map(client_get_data, keys)))
 
     def verify_quantities(self, data_dispensado, document_lines) -> bool:
         """ Verifica que las cantidades totales por Plu sean la misma. """
-        arts_dispensados = dict()
-        arts_en_sap = dict()
-        for i in data_dispensado:
-            if i['ItemCode'] not in arts_dispensados:
-                arts_dispensados[i['ItemCode']] = 0
-            arts_dispensados[i['ItemCode']] += i['Quantity']
-
-        for i in document_lines:
-            if i['ItemCode'] not in arts_en_sap:
-                arts_en_sap[i['ItemCode']] = 0
-            arts_en_sap[i['ItemCode']] += i['Quantity']
-
-        return arts_dispensados == arts_en_sap
+        return item_quantities(data_dispensado) == item_quantities(document_lines)
 
 
 class Export:
     """
     Crea archivos locales con información de la clase Csv2Dict y
     si Parser.input es de tipo GDriveHandler los envia al Google Drive.
+    Las rutas de los archivos creados quedan en kwargs['exported'], propio
+    de cada archivo procesado (ver Parser.run_pipeline), de donde las toma Mail.
     """
-    # Estas variables guardan las rutas donde están los archivos.
-    json_file = None
-    file_processed = None
-    file_errors = None
-    pkl_data = None
-    pkl_module = None
 
     def __str__(self):
         return "Exportación de archivos"
 
-    @classmethod
-    def class_variables(cls):
-        return [file for file in (cls.json_file, cls.file_processed, cls.file_errors, cls.pkl_data, cls.pkl_module) if
-                file]
-
     def run(self, **kwargs):
         """
         Exporta csv y/o json.
@@ -282,51 +329,50 @@ class Export:
             - Crea archivo en Drive con todos los procesados.
         Obs.: Exportar archivos locales es obligatório cuando se lee del drive.
         """
-        self.local_export(**kwargs)
+        for action in self.actions(kwargs):
+            action()
+
+    def actions(self, kwargs) -> list:
+        """ Acciones de la exportación en orden, utils.reporting las reintenta por separado. """
+        actions = [partial(self.local_export, kwargs)]
         if isinstance(kwargs['parser'].input, GDriveHandler):
-            self.create_csv_errs_in_drive(kwargs)
-            self.create_csv_processed_in_drive(kwargs)
-            self.move_csv(kwargs)
-            ...
+            actions += [partial(self.create_csvs_in_drive, kwargs),
+                        partial(self.move_csv, kwargs)]
+        return actions
 
     @once_in_interval(2)
     def move_csv(self, kwargs):
-        # Mueve archivo a carpeta
-        kwargs['parser'].input.move_file(kwargs['file'], f"{kwargs['name_folder']}_BackUp")
-
-    @once_in_interval(2)
-    def create_csv_processed_in_drive(self, kwargs):
-        # Crea archivo en Drive con todos los procesados
-        kwargs['parser'].input.prepare_and_send_csv(
-            self.file_processed,
-            set_filename(kwargs['file']['name'], reason='procesados'),
-            f"{kwargs['name_folder']}_Procesado"
-        )
+        # Mueve archivo a carpeta, con DRIVE_BATCH_MOVES queda en el lote del GDriveHandler
+        kwargs['parser'].input.move_file(kwargs['file'], f"{kwargs['name_folder']}_BackUp",
+                                         later=settings.DRIVE_BATCH_MOVES)
 
     @once_in_interval(2)
-    def create_csv_errs_in_drive(self, kwargs):
-        # Crea archivo en Drive con todos los errores
-        if kwargs['csv_to_dict'].errs:
-            kwargs['parser'].input.prepare_and_send_csv(
-                self.file_errors,
-                set_filename(kwargs['file']['name'], reason='errores'),
-                f"{kwargs['name_folder']}_Error"
-            )
+    def create_csvs_in_drive(self, kwargs):
+        # Crea en Drive, al mismo tiempo, el archivo con todos los errores y el de todos los procesados
+        files, exported = [], kwargs['exported']
+        if kwargs['csv_to_dict'].errs and exported.get('errors'):
+            files.append((exported['errors'], set_filename(kwargs['file']['name'], reason='errores'),
+                          f"{kwargs['name_folder']}_Error"))
+        if exported.get('processed'):
+            files.append((exported['processed'], set_filename(kwargs['file']['name'], reason='procesados'),
+                          f"{kwargs['name_folder']}_Procesado"))
+        kwargs['parser'].input.send_csvs(files)
 
     @staticmethod
-    def local_export(**kwargs):
+    def local_export(kwargs):
         fp = File(kwargs['csv_to_dict'], kwargs['parser'].module.name)
-        Export.file_errors = fp.make_csv(f"{kwargs['parser'].output_filepath}_only_errors.csv", only_error=True)
-        Export.file_processed = fp.make_csv(f"{kwargs['parser'].output_filepath}_processed_all.csv")
+        exported = kwargs.setdefault('exported', {})
+        exported.update(fp.make_csvs(processed=f"{kwargs['parser'].output_filepath}_processed_all.csv",
+                                     errors=f"{kwargs['parser'].output_filepath}_only_errors.csv"))
         # Archivo .json es muy pesado y el e-mail no es enviado por causa de esto
 
-        # Export.json_file = fp.make_json(f"{kwargs['parser'].output_filepath}.json")
+        # exported['json'] = fp.make_json(f"{kwargs['parser'].output_filepath}.json")
 
-        # Export.pkl_module = fp.make_pkl(kwargs['parser'].module,
-        #                                 filename=f"{kwargs['parser'].module.name}_module.pkl")
+        # exported['pkl'] = fp.make_pkl(kwargs['parser'].module,
+        #                               filename=f"{kwargs['parser'].module.name}_module.pkl")
 
-        Export.pkl_data = fp.make_pkl(kwargs['csv_to_dict'],
-                                      filename=f"{kwargs.get('filename', kwargs['parser'].module.name)}.pkl")
+        exported['snapshot'] = fp.make_snapshot(
+            f"{kwargs.get('filename', kwargs['parser'].module.name)}.snapshot.zip")
 
 
 class Mail:
@@ -346,13 +392,13 @@ class Mail:
         else:
             module.filepath = kwargs['file']['name']
 
-        # Accessa a clase Export para traer paths de archivos exportados
-        idx_export = kwargs['parser'].pipeline.index(Export)
-        attachs = kwargs['parser'].pipeline[idx_export].class_variables()
+        # Paths de los archivos exportados por Export para este archivo. El
+        # snapshot queda solamente en el servidor, ver RunSnapshot
+        exported = kwargs.get('exported', {})
+        attachs = [exported[key] for key in ('processed', 'errors') if exported.get(key)]
 
         # Se definen los archivos adjuntos al correo.
-        # En caso no se deseen todos los mencionados en class_variables()
-        # se pueden filtrar aqui.
+        # En caso no se deseen todos los exportados se pueden filtrar aqui.
         e = EmailModule(module, data, attachs)
 
         e.send()
@@ -364,13 +410,24 @@ class ExcludeFromDB:
     def __str__(self):
         return "Eliminando registros de BD"
 
+    def run(self, **kwargs):
+        filename, modulo = kwargs['filename'], kwargs['csv_to_dict'].name
+        parser, file = kwargs.get('parser'), kwargs.get('file')
+        if file and isinstance(getattr(parser, 'input', None), GDriveHandler) and parser.input.is_moving(file):
+            # El archivo aún no fue movido a _BackUp, los registros se excluyen
+            # cuando lo sea para que no vuelva a ser procesado en la primera tanda
+            parser.input.after_move(file, self.delete, filename, modulo)
+        elif settings.DB_DELETE_ASYNC and parser:
+            # El parser sigue con el siguiente archivo y espera la eliminación al final
+            parser.in_background(self.delete, filename, modulo)
+        else:
+            self.delete(filename, modulo)
+
     @staticmethod
-    def run(**kwargs):
-        records = PayloadMigracion.objects.filter(nombre_archivo=kwargs['filename'],
-                                                  modulo=kwargs['csv_to_dict'].name)
-        len_records = len(records)
-        records.delete()
-        log.info(f"{fn(len_records)} Registros excluidos de db referentes a archivo {kwargs['filename']!r}")
+    def delete(filename, modulo):
+        # Movidos en bloque a sap_payloads_archivo, ver archivapayloads
+        len_records = archive_files(modulo, [filename])
+        log.info(f"{fn(len_records)} Registros excluidos de db referentes a archivo {filename!r}")
 
 
 @dataclass
@@ -387,68 +444,54 @@ class File:
             log.info(f"Archivo creado -> {filepath}")
         return filepath
 
+    def make_snapshot(self, filename) -> str:
+        """Crea un RunSnapshot con los documentos, status y payloads del CsvtoDict"""
+        try:
+            filepath = RunSnapshot.dump(self.source, BASE_DIR / filename)
+        except Exception as e:
+            log.error(f"Creando snapshot de {self.module_name}: {e}")
+            return ''
+        log.info(f"Archivo creado -> {filepath}")
+        return filepath
+
     def make_json(self, jsonfilepath=None) -> None:
         # TODO Se puede dumpar datos de la llave json o csv
         try:
             if not jsonfilepath:
                 jsonfilepath = f"{self.module_name}.json"
             with open(jsonfilepath, 'w', encoding='utf-8-sig') as jsonf:
-                jsonf.write(json.dumps(self.source.data, indent=4, ensure_ascii=False))
+                jsonf.write(json.dumps(self.source.data, indent=4, ensure_ascii=False, default=to_builtin))
         except Exception as e:
             log.error(f"Creando json con datos: {e}")
         else:
             log.info(f"Archivo creado -> {jsonfilepath}")
             return jsonfilepath
 
-    def make_csv(self, csvfilepath: str, only_error=False, only_success=False) -> str:
-        # log.info(f'Creando csv {only_error=}, {only_success=}')
-        rows = self.filter_csv_status(only_error, only_success)
-        try:
-            if rows:
-                fieldnames = rows[0].keys()
-                with open(csvfilepath, 'w', encoding='utf-8-sig', newline='') as f:
-                    writer = csv.DictWriter(f, fieldnames=fieldnames, delimiter=';', extrasaction='ignore')
-                    writer.writeheader()
-                    writer.writerows(rows)
-                log.info(f"Archivo creado -> {csvfilepath}")
-                return csvfilepath
-            else:
-                log.info(f"No fue creado CSV segun filtro {only_error=} y {only_success=}")
-        except Exception as e:
-            log.error(f"Creando csv para {self.module_name.capitalize()} al ser procesado: {e}")
-        return ''
-
-    def filter_csv_status(self, only_error, only_success) -> list:
+    def make_csvs(self, processed: str, errors: str = '', success: str = '') -> dict:
         """
-        Filtra el objeto self.source.data com base en si es deseado
-        o solo los errores o solo los succes o todos.
-        En ningun caso only_error y only_success deberán ser True
-        al mismo tiempo.
-        :param only_error: True or False
-        :param only_success: True or False
-        :return: Lista de dicts o luego de haber sido filtrada.
+        Crea en una sola pasada los csv con todas las lineas, solo los errores
+        y solo los exitosos, omitiendo los que no reciban ruta.
+        :return: {'processed': ruta, 'errors': ruta, ...} con '' en los no creados.
         """
-        rows = []
-        if only_error:
-            for k, v in self.source.data.items():
-                if k in self.source.errs or 'sin' in k:
-                    rows.extend(v['csv'])
-        elif only_success:
-            for k in self.source.succss:
-                rows.extend(self.source.data[k])
-        else:
-            for k, v in self.source.data.items():
-                rows.extend(v['csv'])
-        return rows
+        paths = {kind: path for kind, path in (('processed', processed), ('errors', errors), ('success', success))
+                 if path}
+        return write_csvs(self.source, paths)
+
+    def make_csv(self, csvfilepath: str, only_error=False, only_success=False) -> str:
+        kind = self.kind(only_error, only_success)
+        return write_csvs(self.source, {kind: csvfilepath})[kind]
 
-    def filter_json_status(self, only_error=False, only_success=False) -> dict:
+    def filter_json_status(self, jsonlfilepath: str, only_error=False, only_success=False) -> str:
         """
-        Filtra el objeto self.source.data com base en si es deseado
-        o solo los errores o solo los succes o todos.
+        Escribe en jsonlfilepath un json por linea con el payload de cada documento,
+        filtrando o solo los errores o solo los succes o todos.
         En ningun caso only_error y only_success deberán ser True
         al mismo tiempo.
-        :param only_error: True or False
-        :param only_success: True or False
-        :return: Lista de dicts o luego de haber sido filtrada.
+        :return: Ruta del archivo creado.
         """
-        ...
+        return write_jsonl(self.source, jsonlfilepath, self.kind(only_error, only_success))
+
+    @staticmethod
+    def kind(only_error, only_success) -> str:
+        """ Tipo de exportación de utils.exporters.FILTERS. """
+        return 'errors' if only_error else 'success' if only_success else 'processed'
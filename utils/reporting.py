@@ -0,0 +1,182 @@
+"""
+Reporte de los archivos de la segunda tanda en un hilo aparte.
+
+Con settings.REPORT_ASYNC, al llegar a Export el Parser entrega al Reporter
+una copia del Csv2Dict (ver Csv2Dict.detach) junto con los pasos restantes
+del pipeline (Export, Mail, ExcludeFromDB) y sigue con el siguiente archivo
+o modulo. El Reporter ejecuta los reportes uno tras otro, en orden de
+llegada, reintentando cada acción por separado (exportar, subir al drive,
+mover, enviar e-mail) hasta settings.REPORT_RETRIES veces. Caso una acción
+no se logre, se registra el error en la migración igual que antes y no se
+ejecutan los pasos siguientes de ese archivo, así sus payloads no son
+excluidos de la BD y el archivo no es movido, quedando para la siguiente
+ejecución.
+Con settings.DRIVE_BATCH_MOVES, los archivos reportados en el ciclo son
+movidos a _BackUp en lotes al final, en Reporter.wait.
+"""
+import copy
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from pathlib import Path
+from typing import Optional
+
+from django.conf import settings
+from django.db import connections
+
+from core.settings import logger as log
+from utils.converters import Csv2Dict
+from utils.gdrive.handler_api import GDriveHandler
+from utils.mail import send_mail_due_to_general_error_in_file
+from utils.pipelines import Export, Mail
+
+# Pasos del pipeline desde los cuales el reporte pasa al Reporter
+REPORT_STEPS = (Export, Mail)
+
+
+@dataclass
+class ReportParser:
+    """ Lo que los pasos de reporte usan del Parser, sin compartir su estado con el hilo principal. """
+    module: object
+    input: str or Path or GDriveHandler
+    output_filepath: Path
+    pipeline: tuple
+
+    @staticmethod
+    def in_background(func, *args) -> None:
+        # Ya se está en segundo plano, ver ExcludeFromDB
+        func(*args)
+
+
+@dataclass
+class ReportJob:
+    parser: object  # Parser que entregó el reporte, para registrar los errores
+    steps: tuple
+    kwargs: dict
+
+    @property
+    def name(self) -> str:
+        return self.kwargs.get('filename') or self.parser.module.name
+
+
+class Reporter:
+    """ Hilo que ejecuta los ReportJob de todos los modulos, uno a la vez. """
+
+    def __init__(self):
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.pending = []
+        self.lock = threading.Lock()
+        self.drive: Optional[GDriveHandler] = None  # Propio del hilo, GDriveHandler no es thread-safe
+
+    def submit(self, parser, steps, csv_to_dict: Csv2Dict, kwargs: dict) -> None:
+        """ Entrega los pasos de reporte del archivo, el Parser puede seguir con csv_to_dict. """
+        report_parser = ReportParser(copy.copy(parser.module), parser.input, parser.output_filepath, parser.pipeline)
+        kwargs = {**kwargs, 'csv_to_dict': csv_to_dict.detach(), 'parser': report_parser}
+        job = ReportJob(parser, tuple(steps), kwargs)
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='reporte')
+            self.pending.append(self.executor.submit(self.run, job))
+        log.info(f"[{job.name}] {', '.join(str(step()) for step in job.steps)} en segundo plano")
+
+    def run(self, job: ReportJob) -> bool:
+        step = job.steps[0]
+        try:
+            if isinstance(job.kwargs['parser'].input, GDriveHandler):
+                job.kwargs['parser'].input = self.drive = self.drive or GDriveHandler()
+            for step in job.steps:
+                for action in self.actions(step, job.kwargs):
+                    self.retry(job, step, action)
+                # Igual que en el Parser, ver once_in_interval en Export
+                time.sleep(3)
+            log.info(f"[{job.name}] Reporte terminado")
+            return True
+        except Exception as e:
+            self.register_error(job, step, e)
+            return False
+        finally:
+            connections.close_all()
+
+    @staticmethod
+    def actions(step, kwargs: dict) -> list:
+        """ Acciones del paso que son reintentadas por separado, Ver Export.actions. """
+        instance = step()
+        if hasattr(instance, 'actions'):
+            return instance.actions(kwargs)
+        return [partial(instance.run, **kwargs)]
+
+    @staticmethod
+    def retry(job: ReportJob, step, action) -> None:
+        name = getattr(getattr(action, 'func', action), '__name__', str(step()))
+        for attempt in range(1, settings.REPORT_RETRIES + 1):
+            try:
+                return action()
+            except Exception as e:
+                if attempt == settings.REPORT_RETRIES:
+                    raise
+                wait = settings.REPORT_RETRY_INTERVAL * attempt
+                log.warning(f"[{job.name}] {name} falló en intento #{attempt} ({e!r}), reintentando en {wait}s")
+                time.sleep(wait)
+
+    @staticmethod
+    def register_error(job: ReportJob, step, e: Exception) -> None:
+        """ Igual que cuando el paso falla dentro del Parser, ver Parser.process_drive_files. """
+        log.error(f"[{job.name}] Reporte no terminado en {step()}: {e!r}")
+        pipeline = list(job.parser.pipeline)
+        try:
+            file = job.kwargs.get('file')
+            send_mail_due_to_general_error_in_file(file['name'] if file else f"{job.name}.csv", e,
+                                                   traceback.format_exc(), pipeline.index(step) + 1,
+                                                   step, pipeline)
+            job.parser.strategy_post_error(step.__name__)
+        except Exception as err:
+            log.error(f"[{job.name}] No fue posible registrar el error del reporte: {err!r}")
+
+    def flush_moves(self) -> None:
+        if self.drive is None:
+            return
+        try:
+            if failed := self.drive.flush_moves():
+                log.error(f"{failed} archivo(s) no fueron movidos a _BackUp, "
+                          f"serán procesados de nuevo en la siguiente ejecución")
+        except Exception as e:
+            log.error(f"No fue posible mover los archivos reportados: {e!r}")
+        finally:
+            connections.close_all()
+
+    def cancel(self) -> None:
+        """ Descarta los reportes que no iniciaron, sin esperar el que está corriendo. Ej.: SIGTERM. """
+        with self.lock:
+            executor, self.executor = self.executor, None
+            pending, self.pending = self.pending, []
+        if executor is None:
+            return
+        executor.shutdown(wait=False, cancel_futures=True)
+        if cancelled := sum(future.cancelled() for future in pending):
+            log.warning(f"{cancelled} reportes cancelados, sus archivos serán reportados en la siguiente ejecución")
+
+    def wait(self) -> int:
+        """
+        Espera los reportes entregados hasta el momento.
+        :return: Cantidad de reportes que no terminaron.
+        """
+        with self.lock:
+            executor, self.executor = self.executor, None
+            pending, self.pending = self.pending, []
+        if executor is None:
+            return 0
+        # Los movimientos de todo el ciclo van en el mismo lote, ver GDriveHandler.flush_moves
+        executor.submit(self.flush_moves).result()
+        executor.shutdown(wait=True)
+        if self.drive is not None:
+            self.drive.close()
+        failed = sum(not future.result() for future in pending)
+        if failed:
+            log.error(f"{failed} de {len(pending)} reportes no terminaron")
+        return failed
+
+
+reporter = Reporter()
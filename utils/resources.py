@@ -1,4 +1,5 @@
 import pickle
+import threading
 from datetime import datetime
 from typing import List
 
@@ -8,6 +9,9 @@ from decouple import config
 
 from core.settings import BASE_DIR, logger
 
+# login.pickle es compartido por todas las instancias de SAP de los modulos en paralelo
+login_lock = threading.Lock()
+
 
 def moment():
     return datetime.now(tz=timezone('America/Bogota'))
@@ -150,6 +154,11 @@ def login_check(sap) -> bool:
     :param sap: Instancia de SAPData
     :return: True o False caso haga login o no.
     """
+    with login_lock:
+        return _login_check(sap)
+
+
+def _login_check(sap) -> bool:
     login_pkl = BASE_DIR / 'login.pickle'
 
     if not login_pkl.exists():
@@ -169,9 +178,35 @@ def login_check(sap) -> bool:
     return login_succeed
 
 
+def item_prices(document_lines: list) -> dict:
+    """
+    Precio de cada ItemCode, tomado de la primera linea en que aparece.
+    >>> item_prices([{'ItemCode': 'A', 'Price': 10}, {'ItemCode': 'A', 'Price': 12}])
+    {'A': 10}
+    """
+    prices = {}
+    for line in document_lines:
+        if 'Price' in line:
+            prices.setdefault(line['ItemCode'], line['Price'])
+    return prices
+
+
+def item_quantities(document_lines: list) -> dict:
+    """
+    Cantidad total de cada ItemCode.
+    >>> item_quantities([{'ItemCode': 'A', 'Quantity': 2}, {'ItemCode': 'A', 'Quantity': 3}])
+    {'A': 5}
+    """
+    quantities = {}
+    for line in document_lines:
+        quantities[line['ItemCode']] = quantities.get(line['ItemCode'], 0) + line['Quantity']
+    return quantities
+
+
 def mix_documentlines(data_sap: list, document_lines: list) -> list:
     """ Toma la información de SAP producto de haberse consultado y monta esa respuesta
     en un payload, rellenándolo con el resto de información necesaria. """
+    prices = item_prices(document_lines)
     for i in data_sap:
         # inicio procesos comunes #
         for key in ("id__", "U_LF_Formula", "CardCode", "U_LF_Autorizacion", "U_LF_IDSSC",
@@ -184,7 +219,7 @@ def mix_documentlines(data_sap: list, document_lines: list) -> list:
         del i['DocEntry']
         i['BaseLine'] = i['LineNum']
         del i['LineNum']
-        i['Price'] = [j['Price'] for j in document_lines if j['ItemCode'] == i['ItemCode']][0]
+        i['Price'] = prices[i['ItemCode']]
         i['CostingCode'] = document_lines[0]['CostingCode']
         i['CostingCode2'] = document_lines[0]['CostingCode2']
         i['CostingCode3'] = document_lines[0]['CostingCode3']
@@ -200,10 +235,11 @@ def build_new_documentlines(data_sap: list, document_lines: list) -> list:
     """ Crea un nuevo document lines basado en la respuesta de sap.
     Obs.: Usado en notas_credito """
     resp = {}
+    prices = item_prices(document_lines)
     for s in data_sap:
         if s['LineNum'] not in resp:
             resp[s['LineNum']] = {
-                "Price": [j['Price'] for j in document_lines if j['ItemCode'] == s['ItemCode']][0],
+                "Price": prices[s['ItemCode']],
                 "BaseLine": s['LineNum'],
                 "ItemCode": s['ItemCode'],
                 "BaseEntry": s['DocEntry'],
@@ -0,0 +1,374 @@
+import csv
+from collections import Counter
+from collections.abc import Mapping
+from functools import lru_cache
+
+
+class RowSchema:
+    """
+    Header compartido por todas las líneas de un mismo csv.
+    Cada CsvRow guarda solamente una tupla con sus valores y una
+    referencia a esta clase, que sabe en qué posición está cada columna.
+    """
+    __slots__ = ('fields', 'index', 'keys')
+
+    def __init__(self, fieldnames):
+        self.fields = tuple(fieldnames)
+        # Si el nombre de una columna se repite, se queda con la última
+        # posición igual que lo hace csv.DictReader.
+        self.index = {name: i for i, name in enumerate(self.fields)}
+        # La columna 'Status' siempre va al final, es agregada al procesar el csv.
+        self.keys = tuple(f for f in self.index if f != 'Status') + ('Status',)
+
+    def __repr__(self):
+        return f"RowSchema({self.fields!r})"
+
+    @classmethod
+    @lru_cache(maxsize=128)
+    def for_fields(cls, fieldnames: tuple) -> 'RowSchema':
+        """Retorna siempre la misma instancia para un mismo header."""
+        return cls(fieldnames)
+
+
+def status_category(text: str) -> str:
+    """
+    Tipo de status según el texto, en orden de prioridad.
+    >>> status_category("[CSV] Plu no reconocido | [SAP] Lote inválido")
+    'CSV'
+    >>> status_category("DocEntry: 752066")
+    'DocEntry'
+    """
+    for category, marks in (('CSV', ('CSV',)), ('SAP', ('SAP',)),
+                            ('CONNECTION', ('CONNECTION', 'TIMEOUT')), ('DocEntry', ('DocEntry',))):
+        if any(mark in text for mark in marks):
+            return category
+    return ''
+
+
+class DocStatus:
+    """
+    Status de un documento, compartido por todas sus líneas.
+    Es un conjunto ordenado de mensajes que al ser convertido a texto
+    queda igual a como era concatenado antes en la columna 'Status':
+    "[CSV] Plu no reconocido | [CSV] Lote vencido".
+    Caso sea observado por un ErrorHistogram (ver watch), le avisa cada cambio.
+    """
+    __slots__ = ('messages', 'watcher')
+
+    def __init__(self, text=''):
+        self.messages = {}
+        self.watcher = None  # (ErrorHistogram, valor_documento)
+        if text:
+            self.messages[text] = None
+
+    def __str__(self):
+        return ' | '.join(self.messages)
+
+    def __repr__(self):
+        # Igual al repr del texto para que str(lineas) guardado en BD siga siendo evaluable.
+        return repr(str(self))
+
+    def __eq__(self, other):
+        if isinstance(other, DocStatus):
+            return self.messages == other.messages
+        if isinstance(other, str):
+            return str(self) == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def __bool__(self):
+        return bool(self.messages)
+
+    def __contains__(self, txt):
+        return txt in str(self)
+
+    def __getstate__(self):
+        return str(self)
+
+    def __setstate__(self, state):
+        self.messages = {state: None} if state else {}
+        self.watcher = None
+
+    def add(self, txt) -> None:
+        """Agrega el mensaje caso no esté contenido en ninguno de los actuales."""
+        if txt and not any(txt in msg for msg in self.messages):
+            self.messages[txt] = None
+            self.notify()
+
+    def replace(self, txt) -> None:
+        """Deja txt como único mensaje, Ej.: la respuesta de SAP."""
+        self.messages = {str(txt): None} if txt else {}
+        self.notify()
+
+    def clear(self) -> None:
+        if self.messages:
+            self.messages.clear()
+            self.notify()
+
+    def watch(self, histogram: 'ErrorHistogram', key: str) -> None:
+        """Registra el status en el histograma como el del documento key."""
+        self.watcher = (histogram, key)
+        histogram.update(key, self.text())
+
+    def unwatch(self) -> None:
+        self.watcher = None
+
+    def notify(self) -> None:
+        if self.watcher:
+            histogram, key = self.watcher
+            histogram.update(key, self.text())
+
+    def text(self) -> str:
+        """Frases sin repetir separadas por ', ', igual a make_text_status de las líneas del documento."""
+        return ', '.join(dict.fromkeys(self.phrases()))
+
+    def phrases(self) -> list:
+        """Mensajes separados por '|' y sin espacios, como los muestra el email."""
+        return [phrase.strip() for msg in self.messages for phrase in msg.split('|')]
+
+    @property
+    def category(self) -> str:
+        return status_category(str(self))
+
+
+class ErrorBucket(dict):
+    """
+    {texto del status: {valor_documento, ...}} de una categoría de ErrorHistogram.
+    Además lleva la cantidad de documentos (total) y cuántos textos
+    distintos hay por cada mensaje resumido (summaries), para que el
+    e-mail no tenga que recorrer los documentos.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.total = 0
+        self.summaries = Counter()
+
+
+class ErrorHistogram:
+    """
+    Documentos agrupados por categoría (ver status_category) y texto del
+    status, actualizado a medida que cambian los DocStatus observados
+    durante la conversión y el envío a SAP.
+    Ex.:
+        histogram.buckets['CSV'] -> {'[CSV] Plu no reconocido': {'1127507', ...}}
+        histogram.buckets['CSV'].summaries -> Counter({'Plu no reconocido.': 1})
+    """
+    CATEGORIES = ('CSV', 'SAP', 'CONNECTION', 'DocEntry')
+
+    def __init__(self, summarize=str):
+        self.summarize = summarize  # Resume el texto de un status, Ej.: filter_extras.summarize_error
+        self.texts = {}  # {valor_documento: texto}
+        self.summary_of = {}  # {texto: resumen}, cada texto es resumido una sola vez
+        self.unknown = Counter()  # {texto sin categoría: cantidad de documentos}
+        self.buckets = {category: ErrorBucket() for category in self.CATEGORIES}
+
+    def __contains__(self, key) -> bool:
+        return key in self.texts
+
+    def update(self, key: str, text: str) -> None:
+        """ Mueve el documento al grupo de su nuevo texto. """
+        if self.texts.get(key) == text:
+            return
+        self.discard(key)
+        self.texts[key] = text
+        if not text:
+            return
+        if not (category := status_category(text)):
+            self.unknown[text] += 1
+            return
+        bucket = self.buckets[category]
+        if text not in bucket:
+            bucket[text] = set()
+            if text not in self.summary_of:
+                self.summary_of[text] = self.summarize(text)
+            bucket.summaries[self.summary_of[text]] += 1
+        bucket[text].add(key)
+        bucket.total += 1
+
+    def discard(self, key: str) -> None:
+        if not (text := self.texts.pop(key, '')):
+            return
+        if not (category := status_category(text)):
+            self.unknown[text] -= 1
+            if not self.unknown[text]:
+                del self.unknown[text]
+            return
+        bucket = self.buckets[category]
+        bucket[text].discard(key)
+        bucket.total -= 1
+        if not bucket[text]:
+            del bucket[text]
+            summary = self.summary_of[text]
+            bucket.summaries[summary] -= 1
+            if not bucket.summaries[summary]:
+                del bucket.summaries[summary]
+
+    def clear(self) -> None:
+        self.texts.clear()
+        self.unknown.clear()
+        self.buckets = {category: ErrorBucket() for category in self.CATEGORIES}
+
+
+class CsvRow(Mapping):
+    """
+    Línea de un csv con la misma interfaz de lectura de un dict
+    (row['Plu'], row.get('SubPlan', ''), row.keys(), etc.) pero sin
+    repetir las llaves del header en cada línea.
+    Solamente 'Status' puede ser modificado sin reconstruir la tupla.
+    """
+    __slots__ = ('schema', 'cells', 'Status')
+
+    def __init__(self, schema: RowSchema, cells, status=''):
+        self.schema = schema
+        self.cells = tuple(cells)
+        self.Status = status
+
+    def __getitem__(self, key):
+        if key == 'Status':
+            return self.Status
+        return self.cells[self.schema.index[key]]
+
+    def __setitem__(self, key, value):
+        if key == 'Status':
+            self.Status = value
+            return
+        cells = list(self.cells)
+        cells[self.schema.index[key]] = value
+        self.cells = tuple(cells)
+
+    def get(self, key, default=None):
+        if key == 'Status':
+            return self.Status
+        idx = self.schema.index.get(key)
+        return default if idx is None else self.cells[idx]
+
+    def __contains__(self, key):
+        return key == 'Status' or key in self.schema.index
+
+    def __iter__(self):
+        return iter(self.schema.keys)
+
+    def __len__(self):
+        return len(self.schema.keys)
+
+    def __repr__(self):
+        return repr(self.as_dict())
+
+    def as_dict(self) -> dict:
+        """Convierte la línea en dict, usado al exportar a json o a la BD."""
+        row = {k: self[k] for k in self.schema.keys}
+        row['Status'] = str(row['Status'])
+        return row
+
+    @classmethod
+    def from_dict(cls, row: dict) -> 'CsvRow':
+        """Crea un CsvRow a partir de un dict, Ej.: las líneas guardadas en BD."""
+        schema = RowSchema.for_fields(tuple(k for k in row if k != 'Status'))
+        return cls(schema, (row[k] for k in schema.fields), row.get('Status', ''))
+
+
+class CsvRowReader:
+    """
+    Reemplazo de csv.DictReader que retorna CsvRow en vez de dicts.
+    Conserva el atributo fieldnames y el comportamiento de DictReader
+    con las líneas vacías, con las que traen menos columnas y con las que
+    traen más, cuyos valores sobrantes quedan en una lista bajo la llave None.
+    """
+    # Una columna con más valores distintos que este límite (Ej.: NroDocumento)
+    # deja de ser internada, sus valores casi no se repiten.
+    INTERN_MAX_DISTINCT = 2048
+
+    def __init__(self, f, **kwargs):
+        self.reader = csv.reader(f, **kwargs)
+        self._fieldnames = None
+        self.schema = None
+        self.line_num = 0
+        # Los valores repetidos (fechas, SubPlan, CECO, etc.) se guardan una sola vez,
+        # un dict por columna o None caso la columna ya no sea internada.
+        self._values = []
+        self._rows = 0
+
+    @property
+    def fieldnames(self):
+        if self._fieldnames is None:
+            try:
+                self._fieldnames = next(self.reader)
+            except StopIteration:
+                pass
+        return self._fieldnames
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> CsvRow:
+        if self.schema is None:
+            self.schema = RowSchema.for_fields(tuple(self.fieldnames or ()))
+            self._values = [{} for _ in self.schema.fields]
+        row = next(self.reader)
+        while row == []:
+            row = next(self.reader)
+        self.line_num = self.reader.line_num
+        lf = len(self.schema.fields)
+        values = self._values
+        cells = [v if (pool := values[i]) is None else pool.setdefault(v, v) for i, v in enumerate(row[:lf])]
+        self._rows += 1
+        if not self._rows % 1024:
+            self.stop_interning()
+        if len(row) < lf:
+            cells += [None] * (lf - len(row))
+        elif len(row) > lf:
+            return CsvRow(RowSchema.for_fields(self.schema.fields + (None,)), cells + [row[lf:]])
+        return CsvRow(self.schema, cells)
+
+    def stop_interning(self) -> None:
+        """ Libera los valores internados de las columnas que no se repiten. """
+        for i, pool in enumerate(self._values):
+            if pool is not None and len(pool) > self.INTERN_MAX_DISTINCT:
+                self._values[i] = None
+
+
+def rows_as_dicts(rows) -> list:
+    """Convierte las líneas de un documento a dicts."""
+    return [r.as_dict() if isinstance(r, CsvRow) else r for r in rows]
+
+
+def to_builtin(obj):
+    """Usado como default= en json.dumps para serializar CsvRow y DocStatus."""
+    if isinstance(obj, CsvRow):
+        return obj.as_dict()
+    if isinstance(obj, DocStatus):
+        return str(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+if __name__ == '__main__':
+    # Compara el consumo de memoria de csv.DictReader vs CsvRowReader
+    # en un archivo de 200.000 líneas con el header de dispensación.
+    import io
+    import tracemalloc
+
+    header = ['FechaDispensacion', 'SubPlan', 'NIT', 'Plan', 'NroDocumento', 'Beneficiario',
+              'NroSSC', 'Categoria', 'NroAutorizacion', 'Mipres', 'UsuarioDispensa', 'Plu',
+              'CECO', 'Lote', 'CantidadDispensada', 'Precio']
+    buf = io.StringIO()
+    writer = csv.writer(buf, delimiter=';')
+    writer.writerow(header)
+    for n in range(200_000):
+        writer.writerow(['2023-10-03 20:53:48', 'Capita Subsidiado', '890', 'Regimen Subsidiado',
+                         f'{n:010}', 'JANE DOE', str(n // 3), '6', '', '', '123123123',
+                         f'77059590{n % 9999:05}', '306', f'L{n % 500}', '30.0', '0.0'])
+
+    for reader_cls in (csv.DictReader, CsvRowReader):
+        buf.seek(0)
+        tracemalloc.start()
+        rows = []
+        for row in reader_cls(buf, delimiter=';'):
+            row['Status'] = ''
+            rows.append(row)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{reader_cls.__name__:<14} {len(rows)} líneas -> {current / 1024 ** 2:.1f} MB "
+              f"(pico {peak / 1024 ** 2:.1f} MB)")
+        del rows
@@ -71,7 +71,7 @@ class SAPConnect(SAP):
         """ Actualiza PayloadMigración en BD con base en respuesta después de petición """
         payload = self.registros.get(valor_documento=valor_doc)
         payload.enviado_a_sap = True
-        payload.status = self.info.data[valor_doc]['csv'][0]['Status']
+        payload.status = str(self.info.data[valor_doc]['csv'][0]['Status'])
         csv_lines = eval(payload.lineas)
         for line in csv_lines:
             line['Status'] = payload.status
@@ -116,8 +116,8 @@ class SAPConnect(SAP):
         return f"({key}): {msg}"
 
     def update_status_csv_column(self, key, msg):
-        for csv_item in self.info.data[key]['csv']:
-            csv_item['Status'] = msg
+        """Reemplaza el status del documento, compartido por todas sus líneas."""
+        self.info.doc_status(key).replace(msg)
 
     def build_url(self, key):
         """Construye la url a la cual se realizará la petición a la API de SAP."""
@@ -2,18 +2,41 @@ import datetime
 import json
 import pickle
 import random
+from threading import BoundedSemaphore
 from typing import List
 
 import requests
 from requests import HTTPError, Timeout
 
-from core.settings import BASE_DIR, SAP_COMPANY, SAP_USER, SAP_PASS, SAP_URL
+from core.settings import BASE_DIR, SAP_COMPANY, SAP_USER, SAP_PASS, SAP_URL, SAP_MAX_CONCURRENCY
+from core.settings import FACTURACION_NAME, MODULES_USE_DOCUMENTLINES, TRASLADOS_NAME
 from core.settings import logger as log
 from utils.decorators import login_required
 from utils.resources import clean_text, moment
 
 login_pkl = BASE_DIR / 'login.pickle'
 
+# Limita las peticiones simultáneas a SAP cuando varios modulos corren en paralelo
+sap_budget = BoundedSemaphore(SAP_MAX_CONCURRENCY)
+
+
+def reserve_budget(n: int) -> int:
+    """
+    Toma, sin esperar, hasta n cupos de sap_budget para procesos hijos que
+    también consultan SAP (ver ConversionPool), ya que cada proceso tiene su
+    propia copia del semáforo.
+    :return: Cupos tomados, deben ser devueltos con release_budget.
+    """
+    taken = 0
+    while taken < n and sap_budget.acquire(blocking=False):
+        taken += 1
+    return taken
+
+
+def release_budget(n: int) -> None:
+    for _ in range(n):
+        sap_budget.release()
+
 
 class SAP:
     def __init__(self, module):
@@ -26,9 +49,10 @@ class SAP:
         # sourcery skip: raise-specific-error
         res = {"ERROR": ""}
         try:
-            response = requests.request(method, url, headers=headers,
-                                        data=json.dumps(payload),
-                                        timeout=1_800)
+            with sap_budget:
+                response = requests.request(method, url, headers=headers,
+                                            data=json.dumps(payload),
+                                            timeout=1_800)
             response.raise_for_status()
         except Timeout:
             log.error(txt := "No hubo respuesta de la API en 30 min.")
@@ -168,6 +192,37 @@ class SAPData(SAP):
     # Se podria agregar un post_init que de manera asíncrona
     # ejecute load_sucursales y load_abs_entries
 
+    def preload(self, module_name: str) -> None:
+        """
+        Carga de una vez las tablas completas que consulta el modulo al
+        convertir su csv. Usado antes de convertir archivos en otros procesos
+        para que ninguno de ellos las tenga que volver a pedir a SAP.
+        """
+        if module_name in MODULES_USE_DOCUMENTLINES and not self.sucursales_loaded:
+            self.load_sucursales()
+        if module_name == TRASLADOS_NAME and not self.abs_entries_loaded:
+            self.load_abs_entries()
+        if module_name == FACTURACION_NAME and not self.dispensados_loaded:
+            self.load_dispensados()
+
+    def cache_snapshot(self) -> dict:
+        """Copia de lo que ya fue consultado en SAP, para ser compartida con otro proceso."""
+        return {
+            'sucursales': self.sucursales, 'sucursales_loaded': self.sucursales_loaded,
+            'abs_entries': self.abs_entries, 'abs_entries_loaded': self.abs_entries_loaded,
+            'dispensados': self.dispensados, 'dispensados_loaded': self.dispensados_loaded,
+            'entregas': self.entregas, 'entregas_loaded': self.entregas_loaded,
+        }
+
+    def update_cache(self, snapshot: dict) -> None:
+        """Agrega lo consultado en SAP por otro proceso, ver cache_snapshot."""
+        for table in ('sucursales', 'abs_entries', 'dispensados'):
+            if snapshot.get(f'{table}_loaded') and not getattr(self, f'{table}_loaded'):
+                setattr(self, table, snapshot[table])
+                setattr(self, f'{table}_loaded', True)
+        self.entregas.update(snapshot.get('entregas', {}))
+        self.entregas_loaded.update(snapshot.get('entregas_loaded', ()))
+
     @login_required
     def get_all(self, end_url: object) -> List:
         """
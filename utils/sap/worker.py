@@ -0,0 +1,85 @@
+import os
+import socket
+import time
+from itertools import groupby
+from typing import Sequence
+
+from django.db import connections
+
+from base.models import PayloadMigracion
+from core.settings import logger as log
+from utils.converters import Csv2Dict
+from utils.interactor_db import claim_payloads, release_payloads, renew_claim
+from utils.parsers import Module
+from utils.resources import login_check
+from utils.sap.connectors import SAPConnect
+
+
+class SAPWorker:
+    """
+    Toma de la BD los payloads pendientes (ver claim_payloads) y los envía
+    a SAP con SAPConnect, actualizando el resultado en cada PayloadMigracion.
+    Varios workers, en uno o varios procesos, pueden vaciar la misma cola
+    sin enviar dos veces el mismo documento.
+    """
+
+    def __init__(self, name: str = '', modulos: Sequence[str] = (), batch: int = 50, poll: int = 30):
+        self.name = name or f"{os.environ.get('DYNO', socket.gethostname())}-{os.getpid()}"
+        self.modulos = tuple(modulos)
+        self.batch = batch
+        self.poll = poll  # Segundos de espera cuando no hay pendientes o no fue posible enviarlos
+
+    def run(self, once: bool = False) -> int:
+        """
+        Procesa la cola hasta que se interrumpa o, caso once=True,
+        hasta que no queden pendientes o una pasada no envíe ninguno
+        (ej.: SAP caído, los payloads volverían a ser reclamados sin fin).
+        :return: Cantidad de payloads reclamados.
+        """
+        total = 0
+        try:
+            while True:
+                if ids := claim_payloads(self.name, self.batch, self.modulos):
+                    total += len(ids)
+                    if self.post(ids):
+                        continue
+                    log.warning(f"[{self.name}] Ninguno de {len(ids)} payloads reclamados fue enviado a SAP")
+                if once:
+                    break
+                time.sleep(self.poll)
+        finally:
+            connections.close_all()
+        log.info(f"[{self.name}] {total} payloads reclamados")
+        return total
+
+    def post(self, ids: list) -> int:
+        """ :return: Cantidad de payloads enviados a SAP. """
+        sent = 0
+        claimed = PayloadMigracion.objects.filter(id__in=ids).order_by('nombre_archivo', 'id')
+        try:
+            for nombre_archivo, records in groupby(claimed, key=lambda r: r.nombre_archivo):
+                records = list(records)
+                # Un archivo anterior pudo tardar más que SAP_CLAIM_TIMEOUT, solo se envía lo que sigue siendo propio
+                if not (owned := renew_claim(self.name, [r.id for r in records])):
+                    log.warning(f"[{self.name}] Payloads de archivo {nombre_archivo!r} reclamados por otro worker")
+                    continue
+                sent += self.post_file(PayloadMigracion.objects.filter(id__in=owned), records[0])
+        finally:
+            # Los que no alcanzaron a ser enviados vuelven a la cola
+            release_payloads(self.name, ids)
+        return sent
+
+    def post_file(self, registros, first: PayloadMigracion) -> int:
+        """ :return: Cantidad de payloads enviados, 0 caso el login en SAP falle. """
+        module = Module(name=first.modulo, migracion_id=first.migracion_id_id)
+        sap = SAPConnect(module)
+        if not login_check(sap):
+            log.warning(f"[{self.name}] Login en SAP no realizado, {len(registros)} payloads vuelven a la cola")
+            return 0
+        sap.info = Csv2Dict(module.name, module.pk, module.series, None)
+        sap.info.load_data_from_db(registros)
+        sap.registros = registros
+        log.info(f"[{self.name}] [{module.name}] Enviando {len(sap.info.succss)} payloads"
+                 f" de archivo {first.nombre_archivo!r}")
+        sap.gotosap(sap.select_method())
+        return len(sap.info.succss)
@@ -0,0 +1,105 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from graphlib import TopologicalSorter
+from typing import Callable, Sequence
+
+from django.conf import settings
+from django.db import connections
+
+from core.settings import logger as log
+
+
+class ModuleScheduler:
+    """
+    Ejecuta los modulos de una migración en varios hilos, respetando las
+    dependencias de settings.MODULES_DEPENDENCIES. Un modulo solo inicia
+    cuando los modulos de los que depende terminaron, y entre los que
+    están listos se respeta el orden recibido, de manera que con
+    parallelism=1 el resultado es el mismo de ejecutarlos uno tras otro.
+    Caso un modulo falle, no se inician más modulos, se espera a que
+    terminen los que estaban corriendo y se relanza el error. Con
+    parallelism=1 los modulos corren en el hilo que llama, sin hilos aparte.
+    """
+
+    def __init__(self, modules: Sequence[str], func: Callable[[str], None],
+                 parallelism: int = 1, dependencies: dict = None):
+        self.modules = list(modules)
+        self.func = func
+        self.parallelism = max(parallelism, 1)
+        dependencies = settings.MODULES_DEPENDENCIES if dependencies is None else dependencies
+        self.graph = {
+            module: {dep for dep in dependencies.get(module, ()) if dep in self.modules and dep != module}
+            for module in self.modules
+        }
+        self.times = {}  # {'compras': 12.5, ...} segundos que tardó cada modulo
+
+    def run(self) -> dict:
+        sorter = TopologicalSorter(self.graph)
+        sorter.prepare()  # Lanza graphlib.CycleError si hay dependencias circulares
+        if self.parallelism == 1:
+            self.run_serial(sorter)
+        else:
+            self.run_parallel(sorter)
+        return self.times
+
+    def run_serial(self, sorter: TopologicalSorter) -> None:
+        """
+        Uno tras otro en el hilo que llama, así una señal (SIGTERM) recibida
+        durante un modulo interrumpe la migración de inmediato.
+        """
+        ready = []
+        while sorter.is_active():
+            ready.extend(sorter.get_ready())
+            ready.sort(key=self.modules.index)
+            module = ready.pop(0)
+            try:
+                self.times[module] = self.timed(module)
+            except Exception as e:
+                log.error(f"[{module}] Modulo terminó con error {e!r}, no serán iniciados más modulos.")
+                raise
+            sorter.done(module)
+
+    def run_parallel(self, sorter: TopologicalSorter) -> None:
+        ready, running, error = [], {}, None
+        executor = ThreadPoolExecutor(max_workers=self.parallelism, thread_name_prefix='modulo')
+        try:
+            while sorter.is_active():
+                if error is None:
+                    ready.extend(sorter.get_ready())
+                    ready.sort(key=self.modules.index)
+                    while ready and len(running) < self.parallelism:
+                        module = ready.pop(0)
+                        running[executor.submit(self.timed, module)] = module
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    module = running.pop(future)
+                    try:
+                        self.times[module] = future.result()
+                    except Exception as e:
+                        log.error(f"[{module}] Modulo terminó con error {e!r}, no serán iniciados más modulos.")
+                        error = error or e
+                    else:
+                        sorter.done(module)
+        except BaseException:
+            # Ej.: SystemExit de handle_sigterm en el hilo principal. No se inician más
+            # modulos y no se espera a los que están corriendo.
+            log.warning(f"Migración interrumpida, modulos sin iniciar: {', '.join(ready) or 'ninguno'}; "
+                        f"en ejecución: {', '.join(running.values()) or 'ninguno'}")
+            for future in running:
+                future.cancel()
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        executor.shutdown(wait=True)
+        if error:
+            raise error
+
+    def timed(self, module: str) -> float:
+        start = time.perf_counter()
+        try:
+            self.func(module)
+        finally:
+            # Las conexiones a la BD son por hilo, se cierran al terminar el modulo.
+            connections.close_all()
+        return round(time.perf_counter() - start, 2)
@@ -0,0 +1,107 @@
+import json
+import zipfile
+from pathlib import Path
+from typing import Iterator
+
+from core.settings import logger as log
+from utils.rows import to_builtin
+
+META = 'meta.json'
+VERSION = 1
+
+
+class RunSnapshot:
+    """
+    Foto de un Csv2Dict al final de un archivo: documentos, status y payloads,
+    sin el SAPData ni el resto del estado del proceso.
+
+    Es un .zip con un meta.json (nombre, pk, succss, errs y el índice
+    {valor_documento: miembro}) y un miembro json comprimido por documento,
+    de manera que un documento es leído sin descomprimir los demás.
+    Ex.:
+        with RunSnapshot('Dispensacion-1.snapshot.zip') as snap:
+            snap['1127507']['json']
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.zip = zipfile.ZipFile(self.path)
+        meta = json.loads(self.zip.read(META))
+        self.name = meta['name']
+        self.pk = meta['pk']
+        self.csv_lines = meta['csv_lines']
+        self.succss = set(meta['succss'])
+        self.errs = set(meta['errs'])
+        self.index = meta['index']
+
+    @staticmethod
+    def dump(csv_to_dict, path: str | Path) -> str:
+        """
+        Escribe la foto del Csv2Dict en path.
+        :return: Ruta del archivo creado.
+        """
+        index = {}
+        with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+            for i, (key, doc) in enumerate(csv_to_dict.data.items()):
+                index[key] = f'documentos/{i:06}.json'
+                zf.writestr(index[key], json.dumps({
+                    'valor_documento': key,
+                    'status': str(doc['csv'][0]['Status']) if doc['csv'] else '',
+                    'json': doc['json'],
+                    'csv': doc['csv'],
+                }, ensure_ascii=False, default=to_builtin))
+            zf.writestr(META, json.dumps({
+                'version': VERSION,
+                'name': csv_to_dict.name,
+                'pk': csv_to_dict.pk,
+                'csv_lines': csv_to_dict.csv_lines,
+                'succss': sorted(csv_to_dict.succss),
+                'errs': sorted(csv_to_dict.errs),
+                'index': index,
+            }, ensure_ascii=False))
+        return str(path)
+
+    def __getitem__(self, key: str) -> dict:
+        """ {'valor_documento': ..., 'status': ..., 'json': {...}, 'csv': [{...}, ...]} """
+        return json.loads(self.zip.read(self.index[key]))
+
+    def get(self, key: str, default=None):
+        return self[key] if key in self else default
+
+    def __contains__(self, key) -> bool:
+        return key in self.index
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.index)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def items(self) -> Iterator[tuple]:
+        for key in self.index:
+            yield key, self[key]
+
+    def close(self) -> None:
+        self.zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def get_json_from_snapshot(snapshot_path, jsonfilepath=None) -> str:
+    """ Dado un RunSnapshot, crea un archivo json con sus documentos, uno a la vez. """
+    with RunSnapshot(snapshot_path) as snapshot:
+        if not jsonfilepath:
+            jsonfilepath = f"{snapshot.name}_exported.json"
+        log.info(f'Creando archivo {jsonfilepath}')
+        with open(jsonfilepath, 'w', encoding='utf-8-sig') as jsonf:
+            jsonf.write('{')
+            for i, (key, doc) in enumerate(snapshot.items()):
+                item = json.dumps({'json': doc['json'], 'csv': doc['csv']}, indent=4, ensure_ascii=False)
+                jsonf.write(f"{',' if i else ''}\n    {json.dumps(key, ensure_ascii=False)}: {item.replace(chr(10), chr(10) + '    ')}")
+            jsonf.write('\n}' if len(snapshot) else '}')
+        log.info(f'Archivo {jsonfilepath} creado con éxito!')
+    return jsonfilepath